@@ -0,0 +1,121 @@
+"""
+Output format benchmark: bytes sent and end-to-end latency per format
+
+Sends speech-like audio through AudioHandler._generate_and_send_audio to the
+fake Telegram server once per output profile: MP3 as synthesized, re-encoded
+low-bitrate MP3, and OGG/Opus voice notes at every quality level. The stub
+engine returns a gTTS-like 32 kbit/s MP3 whose length follows the text, so
+the encoder works on realistic input. Needs numpy and ffmpeg with libopus.
+
+    python benchmarks/bench_audio_format.py [--lengths 300,2000,5000] [--iterations 20]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from fake_telegram import FakeTelegramServer
+from bench_pipeline import configure, started_bot, make_text, make_stub_handler, run_concurrently, percentile
+from bench_time_stretch import speech_like_signal
+
+CHARS_PER_SECOND = 14  # gTTS speaking rate at 1.0x
+
+
+def make_source_service(engine_delay: float):
+    """TTSService whose gTTS engine returns speech-like MP3 as long as gTTS would speak the text"""
+    from services.tts_service import TTSService
+    from services.audio_codec import AudioCodec
+
+    source = {}
+
+    class SpeechTTSService(TTSService):
+        def text_to_speech_gtts(self, text: str, speed: float = 1.0) -> bytes:
+            time.sleep(engine_delay)
+            seconds = max(1, len(text) // CHARS_PER_SECOND)
+            if seconds not in source:
+                source[seconds] = AudioCodec.encode_mp3(speech_like_signal(seconds).tobytes(), bitrate='32k')
+            return source[seconds]
+
+    return SpeechTTSService()
+
+
+def profiles():
+    from services.audio_encoder import OutputProfile
+    yield 'mp3 (as synthesized)', OutputProfile('mp3')
+    yield f"mp3 {Config.MP3_LOW_BITRATE}", OutputProfile('mp3', Config.MP3_LOW_BITRATE)
+    for quality, bitrate in zip(('low', 'standard', 'high'), Config.OPUS_BITRATES):
+        yield f"opus {bitrate} ({quality})", OutputProfile('opus', bitrate)
+
+
+async def bench_profile(args, fake, profile, length: int, offset: int):
+    """Latencies and upload bytes of iterations requests of length characters"""
+    from telegram import Update
+    bot = await started_bot(fake)
+    handler = make_stub_handler(args.engine_delay, make_source_service(args.engine_delay))
+    handler._output_profile = lambda context, text_length: profile
+    first_reply = len(fake.replies)
+    try:
+        async def operation(index):
+            update = Update.de_json(fake.make_message_update('1.0', user_id=index + 1), bot)
+            text = make_text(offset + index, length)
+            await handler._generate_and_send_audio(update, None, text, 1.0, index + 1)
+        latencies, wall = await run_concurrently(args.iterations, args.concurrency, operation)
+    finally:
+        handler.tts_service.shutdown()
+        await bot.shutdown()
+
+    uploads = [
+        params.get('multipart_bytes', 0) for _, method, params in fake.replies[first_reply:]
+        if method in ('sendAudio', 'sendVoice')
+    ]
+    return latencies, sum(uploads) / max(len(uploads), 1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', default='300,2000,5000', help="comma-separated text lengths in characters")
+    parser.add_argument('--iterations', type=int, default=20, help="requests per format and length")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent requests")
+    parser.add_argument('--engine-delay', type=float, default=0.0, help="simulated engine latency in seconds")
+    args = parser.parse_args()
+
+    from services.audio_codec import AudioCodec
+    if not AudioCodec.is_available():
+        raise SystemExit("ffmpeg is needed to encode audio for this benchmark")
+
+    from utils.logger import bot_logger
+    bot_logger.disabled = True
+
+    print(f"{'format':>22} {'chars':>6} {'KB sent':>9} {'vs mp3':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    fake = FakeTelegramServer()
+    await fake.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure(fake, workdir)
+            # One engine call and one upload per request, whatever the length
+            Config.SEGMENT_CACHE_ENABLED = False
+            Config.PROGRESSIVE_DELIVERY = False
+            offset = 0
+            for length in (int(length) for length in args.lengths.split(',')):
+                baseline = None
+                for name, profile in profiles():
+                    offset += args.iterations
+                    latencies, sent = await bench_profile(args, fake, profile, length, offset)
+                    baseline = baseline or sent
+                    ordered = sorted(latencies)
+                    print(
+                        f"{name:>22} {length:>6} {sent / 1024:>9.1f} {sent / baseline:>6.2f}x "
+                        f"{percentile(ordered, 50) * 1000:>8.1f} {percentile(ordered, 95) * 1000:>8.1f}"
+                    )
+    finally:
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,407 @@
+"""
+Offline pipeline microbenchmarks
+
+Runs the synthesis dispatch, temp file handling, text extraction and the full
+audio request path with stub engines that return fixed MP3/WAV data, so results
+depend on the bot's own code rather than on Google or the local speech engine.
+Replies go to a local fake Telegram server (benchmarks/fake_telegram.py).
+
+Each case reports throughput and latency percentiles. Results can be saved as
+JSON and compared with an earlier run:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --compare before.json [--only dispatch,send_audio]
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from fake_telegram import FakeTelegramServer
+
+# A gTTS-like MPEG-2 Layer III frame: 32 kbit/s, 24 kHz, mono, 24 ms of silence
+MP3_FRAME = b'\xff\xf3\x44\xc4' + bytes(92)
+MP3_FRAMES_PER_CHAR = 3  # gTTS speaks roughly 14 characters per second
+WAV_RATE = 22050
+BATCH_FILES = 10  # files per batch in the batch case
+
+SAMPLE_TEXT = (
+    "The quick brown fox jumps over the lazy dog. Pack my box with five dozen liquor jugs! "
+    "How vexingly quick daft zebras jump? Sphinx of black quartz, judge my vow. "
+)
+
+
+def stub_mp3(text: str) -> bytes:
+    return b'ID3\x03\x00\x00\x00\x00\x00\x00' + MP3_FRAME * max(1, len(text) * MP3_FRAMES_PER_CHAR)
+
+
+def stub_wav(text: str) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(WAV_RATE)
+        f.writeframes(bytes(2 * WAV_RATE * max(1, len(text)) // 14))
+    return buffer.getvalue()
+
+
+def make_text(index: int, length: int) -> str:
+    """Distinct text of about length characters, so every request misses the caches"""
+    text = f"Request {index}. " + SAMPLE_TEXT * (length // len(SAMPLE_TEXT) + 1)
+    return text[:length]
+
+
+def configure(fake: FakeTelegramServer, workdir: str):
+    Config.TELEGRAM_TOKEN = '123456:benchmark'
+    Config.TELEGRAM_API_BASE_URL = fake.base_url
+    Config.DATA_DIR = workdir
+    Config.TEMP_AUDIO_DIR = os.path.join(workdir, 'temp_audio')
+    Config.AUDIO_CACHE_DIR = os.path.join(workdir, 'audio_cache')
+    Config.DATABASE_PATH = os.path.join(workdir, 'sessions.db')
+    Config.FILE_ID_STORE_PATH = os.path.join(workdir, 'file_ids.log')
+    Config.SEGMENT_STORE_PATH = os.path.join(workdir, 'segments.pack')
+    Config.LONG_DOCUMENT_DIR = os.path.join(workdir, 'documents')
+    Config.PYTTSX_POOL_SIZE = 0
+    Config.METRICS_ENABLED = False
+    for path in (Config.TEMP_AUDIO_DIR, Config.AUDIO_CACHE_DIR, Config.LONG_DOCUMENT_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def make_stub_service(engine_delay: float, failing=()):
+    """TTSService whose engines return fixed audio after engine_delay seconds"""
+    from services.tts_service import TTSService
+    from services.file_service import FileService
+
+    class StubTTSService(TTSService):
+        def text_to_speech_gtts(self, text: str, speed: float = 1.0) -> bytes:
+            time.sleep(engine_delay)
+            if 'gtts' in failing:
+                raise ConnectionError("stub gTTS is down")
+            return stub_mp3(text)
+
+        def text_to_speech_pyttsx(self, text: str, speed: float = 1.0) -> str:
+            time.sleep(engine_delay)
+            file_path = FileService.get_file_path(FileService.generate_filename())
+            FileService.track(file_path)
+            with open(file_path, 'wb') as f:
+                f.write(stub_wav(text))
+            return file_path
+
+    return StubTTSService()
+
+
+def make_stub_handler(engine_delay: float, service=None):
+    """AudioHandler whose synthesis and encoding go through a stub TTSService"""
+    from handlers.audio_handler import AudioHandler
+    from services.audio_encoder import AudioEncoder
+    handler = AudioHandler()
+    handler.tts_service.shutdown()
+    handler.tts_service = handler.synthesizer = service or make_stub_service(engine_delay)
+    handler.encoder = AudioEncoder(handler.tts_service)
+    return handler
+
+
+# Cases: each returns per-operation latencies and the wall time they took, in seconds
+
+async def run_concurrently(count: int, concurrency: int, operation):
+    """Run operation(index) count times, at most concurrency at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index):
+        async with semaphore:
+            started = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    return latencies, time.perf_counter() - started
+
+
+async def run_sequentially(count: int, operation):
+    """Run operation(index) count times, one after another"""
+    latencies = []
+    started = time.perf_counter()
+    for index in range(count):
+        op_started = time.perf_counter()
+        await operation(index)
+        latencies.append(time.perf_counter() - op_started)
+    return latencies, time.perf_counter() - started
+
+
+async def bench_dispatch(args, fake):
+    """Synthesis through the worker pool, every request a cache miss"""
+    service = make_stub_service(args.engine_delay)
+    try:
+        async def operation(index):
+            result = await service.convert_text_to_speech_async(make_text(index, args.text_length), 1.0)
+            result.release()
+        return await run_concurrently(args.iterations, args.concurrency, operation)
+    finally:
+        service.shutdown()
+
+
+async def bench_dispatch_cached(args, fake):
+    """Repeated request served from the audio cache"""
+    service = make_stub_service(args.engine_delay)
+    text = make_text(0, args.text_length)
+    try:
+        (await service.convert_text_to_speech_async(text, 1.0)).release()
+
+        async def operation(index):
+            result = await service.convert_text_to_speech_async(text, 1.0)
+            result.release()
+        return await run_concurrently(args.iterations, args.concurrency, operation)
+    finally:
+        service.shutdown()
+
+
+async def bench_dispatch_fallback(args, fake):
+    """gTTS failing, so requests fall back to the WAV-writing offline engine"""
+    service = make_stub_service(args.engine_delay, failing=('gtts',))
+    try:
+        async def operation(index):
+            result = await service.convert_text_to_speech_async(make_text(index, args.text_length), 1.0)
+            result.release()
+        return await run_concurrently(args.iterations, args.concurrency, operation)
+    finally:
+        service.shutdown()
+
+
+async def bench_file_save_delete(args, fake):
+    """Write a temp audio file and delete it"""
+    from services.file_service import FileService
+    data = stub_mp3(make_text(0, args.text_length))
+
+    async def operation(index):
+        path = FileService.save_audio_file(data, FileService.generate_filename())
+        FileService.delete_file(path)
+    return await run_sequentially(args.iterations, operation)
+
+
+async def bench_extract_text(args, fake):
+    """Text message extraction and validation"""
+    from telegram import Update
+    from handlers.text_handler import TextHandler
+    bot = await started_bot(fake)
+    updates = [
+        Update.de_json(fake.make_message_update(make_text(index, args.text_length)), bot)
+        for index in range(args.iterations)
+    ]
+    try:
+        async def operation(index):
+            TextHandler._is_valid_text(await TextHandler._extract_text(updates[index], None))
+        return await run_sequentially(args.iterations, operation)
+    finally:
+        await bot.shutdown()
+
+
+async def bench_extract_document(args, fake):
+    """.txt upload: getFile, download into memory, decode and validate"""
+    from telegram import Update
+    from handlers.text_handler import TextHandler
+    bot = await started_bot(fake)
+    updates = [
+        Update.de_json(fake.make_document_update('notes.txt', make_text(index, Config.MAX_TEXT_LENGTH).encode()), bot)
+        for index in range(args.iterations)
+    ]
+    try:
+        async def operation(index):
+            TextHandler._is_valid_text(await TextHandler._extract_text(updates[index], None))
+        return await run_sequentially(args.iterations, operation)
+    finally:
+        await bot.shutdown()
+
+
+async def bench_document_chunks(args, fake):
+    """Streaming a 1 MB .txt upload from disk in sentence-aligned chunks"""
+    from services.long_document_service import iter_text_chunks
+    path = os.path.join(Config.LONG_DOCUMENT_DIR, 'bench_document.txt')
+    # Odd line breaks and paragraph gaps, so block boundaries land everywhere
+    text = ''.join(f"{make_text(index, 100 + index % 57)}{chr(10) * (index % 3)} " for index in range(10000))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    try:
+        async def operation(index):
+            chunks = list(iter_text_chunks(path, Config.LONG_DOCUMENT_CHUNK_CHARS))
+            # No word may be lost, split or glued to its neighbour at a block boundary
+            if index == 0 and ' '.join(chunks).split() != text.split():
+                raise AssertionError("chunked document does not match the original words")
+        return await run_sequentially(args.iterations, operation)
+    finally:
+        os.remove(path)
+
+
+async def bench_send_audio(args, fake):
+    """AudioHandler._generate_and_send_audio from request to the audio reaching the fake server"""
+    from telegram import Update
+    bot = await started_bot(fake)
+    handler = make_stub_handler(args.engine_delay)
+    try:
+        async def operation(index):
+            update = Update.de_json(fake.make_message_update('1.0', user_id=index + 1), bot)
+            await handler._generate_and_send_audio(update, None, make_text(index, args.text_length), 1.0, index + 1)
+        return await run_concurrently(args.iterations, args.concurrency, operation)
+    finally:
+        handler.tts_service.shutdown()
+        await bot.shutdown()
+
+
+async def bench_batch(args, fake):
+    """AudioHandler._convert_batch: BATCH_FILES files synthesized in parallel and sent in order"""
+    from telegram import Update
+    bot = await started_bot(fake)
+    handler = make_stub_handler(args.engine_delay)
+    batches = max(1, args.iterations // BATCH_FILES)
+    try:
+        async def operation(index):
+            update = Update.de_json(fake.make_message_update('1.0', user_id=index + 1), bot)
+            items = [
+                {'name': f"chapter{number}.txt", 'text': make_text(index * BATCH_FILES + number, args.text_length)}
+                for number in range(1, BATCH_FILES + 1)
+            ]
+            await handler._convert_batch(update, None, {'items': items, 'skipped': []}, 1.0, index + 1)
+        return await run_concurrently(batches, args.concurrency, operation)
+    finally:
+        handler.tts_service.shutdown()
+        await bot.shutdown()
+
+
+async def started_bot(fake):
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+    # Same connection pool size the Application gives its bot
+    bot = Bot(
+        Config.TELEGRAM_TOKEN, base_url=fake.base_url, base_file_url=fake.base_file_url,
+        request=HTTPXRequest(connection_pool_size=256)
+    )
+    await bot.initialize()
+    return bot
+
+
+CASES = {
+    'dispatch': bench_dispatch,
+    'dispatch_cached': bench_dispatch_cached,
+    'dispatch_fallback': bench_dispatch_fallback,
+    'file_save_delete': bench_file_save_delete,
+    'extract_text': bench_extract_text,
+    'extract_document': bench_extract_document,
+    'document_chunks': bench_document_chunks,
+    'send_audio': bench_send_audio,
+    'batch': bench_batch,
+}
+
+
+# Reporting
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(latencies: list, wall: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'operations': len(ordered),
+        'ops_per_second': len(ordered) / wall if wall else 0.0,
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_results(results: dict, baseline: dict = None):
+    header = f"{'case':>18} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header + (f" {'p50 vs base':>12} {'ops/s vs base':>14}" if baseline else ''))
+    for name, r in results.items():
+        line = (f"{name:>18} {r['ops_per_second']:>9.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['p99_ms']:>9.2f} {r['max_ms']:>9.2f}")
+        base = (baseline or {}).get(name)
+        if base:
+            change = lambda new, old: f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+            line += f" {change(r['p50_ms'], base['p50_ms']):>12} {change(r['ops_per_second'], base['ops_per_second']):>14}"
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help="operations per case")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent requests in the async cases")
+    parser.add_argument('--text-length', type=int, default=300, help="characters per request")
+    parser.add_argument('--engine-delay', type=float, default=0.0, help="simulated engine latency in seconds")
+    parser.add_argument('--only', help="comma-separated cases to run: " + ', '.join(CASES))
+    parser.add_argument('--output', help="save results to this JSON file")
+    parser.add_argument('--compare', help="JSON file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    # The bot's log lines would dominate the timings of the cheap cases
+    from utils.logger import bot_logger
+    bot_logger.disabled = True
+
+    results = {}
+    fake = FakeTelegramServer()
+    await fake.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure(fake, workdir)
+            for name in names:
+                latencies, wall = await CASES[name](args, fake)
+                results[name] = summarize(latencies, wall)
+    finally:
+        await fake.stop()
+
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'settings': {
+                'iterations': args.iterations, 'concurrency': args.concurrency,
+                'text_length': args.text_length, 'engine_delay': args.engine_delay,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
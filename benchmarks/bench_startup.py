@@ -0,0 +1,107 @@
+"""
+Cold start benchmark: time from a fresh interpreter to a constructed bot
+
+Every run starts a new Python process that imports bot.py under -X importtime,
+constructs TextToSpeechBot and then runs the engine warm-up that the bot does
+in the background after it starts polling. Reports the best run and the
+modules and top-level packages that take the most import time.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+CHILD = """
+import os, sys, json, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+from config import Config
+workdir = sys.argv[1]
+Config.DATA_DIR = workdir
+Config.TEMP_AUDIO_DIR = os.path.join(workdir, 'temp_audio')
+Config.AUDIO_CACHE_DIR = os.path.join(workdir, 'audio_cache')
+Config.DATABASE_PATH = os.path.join(workdir, 'sessions.db')
+Config.FILE_ID_STORE_PATH = os.path.join(workdir, 'file_ids.log')
+Config.SEGMENT_STORE_PATH = os.path.join(workdir, 'segments.pack')
+Config.LONG_DOCUMENT_DIR = os.path.join(workdir, 'documents')
+Config.PYTTSX_POOL_SIZE = 0
+constructing = time.perf_counter()
+instance = bot.TextToSpeechBot()
+constructed = time.perf_counter()
+instance.audio_handler.tts_service.warm_up()
+warmed = time.perf_counter()
+instance.audio_handler.tts_service.shutdown()
+print(json.dumps({
+    'import': imported - started,
+    'construct': constructed - constructing,
+    'warm_up': warmed - constructed,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self seconds, cumulative seconds) of every module imported by import bot"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+        if name.strip() == 'bot':
+            break  # the rest was imported by the warm-up
+    return modules
+
+
+def run_once(workdir: str):
+    env = dict(os.environ, BOT_LOG_FILE='bench_startup.log')
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, workdir],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise SystemExit(f"Benchmark process failed:\n{process.stderr[-2000:]}")
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="fresh processes to start, best is reported")
+    parser.add_argument('--top', type=int, default=15, help="modules and packages to list")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(args.repeat):
+            runs.append(run_once(workdir))
+    timings, modules = min(runs, key=lambda run: run[0]['import'])
+
+    print(f"import bot      {timings['import'] * 1000:>8.1f} ms   (best of {args.repeat})")
+    print(f"construct bot   {timings['construct'] * 1000:>8.1f} ms")
+    print(f"ready to poll   {(timings['import'] + timings['construct']) * 1000:>8.1f} ms")
+    print(f"engine warm-up  {timings['warm_up'] * 1000:>8.1f} ms   (in the background after polling starts)")
+
+    # Self time summed per top-level package, so e.g. all of telegram.* counts once
+    packages = defaultdict(float)
+    for name, self_seconds, _ in modules:
+        packages[name.split('.')[0]] += self_seconds
+
+    print(f"\n{'package':<32} {'self ms':>9}")
+    for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<32} {seconds * 1000:>9.1f}")
+
+    print(f"\n{'module':<32} {'self ms':>9} {'cumulative ms':>14}")
+    for name, self_seconds, cumulative in sorted(modules, key=lambda module: -module[2])[:args.top]:
+        print(f"{name:<32} {self_seconds * 1000:>9.1f} {cumulative * 1000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
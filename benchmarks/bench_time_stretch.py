@@ -0,0 +1,58 @@
+"""
+Time-stretch throughput benchmark
+
+Measures how many seconds of audio the WSOLA stretcher processes per second of
+single-core CPU time, for every speed the bot offers.
+
+    python benchmarks/bench_time_stretch.py [--seconds 60]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np
+from services.time_stretch import time_stretch
+
+SAMPLE_RATE = 24000
+SPEEDS = [0.1, 0.5, 0.8, 1.25, 1.5, 2.0, 3.0]
+
+
+def speech_like_signal(seconds: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Voiced harmonics with a drifting pitch, syllable envelope and noise bursts"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    noise = rng.normal(0, 0.2, len(t)) * (envelope < 0.1)
+    signal = 0.3 * voiced * envelope + noise
+    return (signal / np.max(np.abs(signal)) * 20000).astype(np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60.0, help="length of the test signal")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per speed, best is reported")
+    args = parser.parse_args()
+
+    samples = speech_like_signal(args.seconds)
+    print(f"Input: {args.seconds:.0f}s of 16-bit mono PCM at {SAMPLE_RATE} Hz")
+    print(f"{'speed':>6} {'cpu s':>8} {'x realtime':>11} {'out s':>8}")
+
+    for speed in SPEEDS:
+        best = None
+        for _ in range(args.repeat):
+            start = time.process_time()
+            output = time_stretch(samples, speed, SAMPLE_RATE)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{speed:>6.2f} {best:>8.3f} {args.seconds / best:>11.1f} {len(output) / SAMPLE_RATE:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Update delivery latency: long polling vs webhook
+
+Runs the bot against a local fake Telegram server (benchmarks/fake_telegram.py),
+sends /help updates one at a time and measures the time from the server
+handing out the update to the bot's reply arriving.
+
+    python benchmarks/bench_webhook_latency.py [--updates 200]
+"""
+import os
+import sys
+import socket
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from fake_telegram import FakeTelegramServer
+from bench_pipeline import configure as configure_paths
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure(fake: FakeTelegramServer, workdir: str):
+    # Every data file in workdir and no metrics endpoint, so a live bot on this machine is left alone
+    configure_paths(fake, workdir)
+    Config.CONTROL_SOCKET_ENABLED = False
+    Config.CONTROL_SOCKET_PATH = os.path.join(workdir, 'control.sock')
+    Config.WEBHOOK_PORT = free_port()
+    Config.WEBHOOK_URL = f"http://127.0.0.1:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}"
+
+
+async def measure(fake: FakeTelegramServer, count: int, gap: float) -> list:
+    latencies = []
+    for _ in range(count):
+        expected = len(fake.replies) + 1
+        sent_at = await fake.push_update(fake.make_message_update('/help'))
+        await fake.wait_for_replies(expected)
+        latencies.append(fake.replies[expected - 1][0] - sent_at)
+        await asyncio.sleep(gap)
+    return latencies
+
+
+async def bench_polling(fake, count, gap):
+    from bot import TextToSpeechBot
+    bot = TextToSpeechBot()
+    application = bot.build_application()
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=10)
+    try:
+        await measure(fake, 5, gap)  # warm-up
+        return await measure(fake, count, gap)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+
+async def bench_webhook(fake, count, gap):
+    from bot import TextToSpeechBot
+    bot = TextToSpeechBot()
+    bot.build_application()
+    stop_event = asyncio.Event()
+    runner = asyncio.ensure_future(bot.run_webhook(stop_event))
+    try:
+        while fake.webhook_url is None:
+            if runner.done():
+                runner.result()
+            await asyncio.sleep(0.01)
+        await measure(fake, 5, gap)
+        return await measure(fake, count, gap)
+    finally:
+        stop_event.set()
+        await runner
+        fake.webhook_url = None
+
+
+def summarize(name: str, latencies: list):
+    ordered = sorted(latencies)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+    print(f"{name:>8} {len(ordered):>8} {pick(50):>9.2f} {pick(95):>9.2f} {ordered[-1] * 1000:>9.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200, help="updates sent per mode")
+    parser.add_argument('--gap', type=float, default=0.01, help="pause between updates in seconds")
+    args = parser.parse_args()
+
+    fake = FakeTelegramServer()
+    await fake.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure(fake, workdir)
+            results = [
+                ('polling', await bench_polling(fake, args.updates, args.gap)),
+                ('webhook', await bench_webhook(fake, args.updates, args.gap)),
+            ]
+    finally:
+        await fake.stop()
+
+    print(f"{'mode':>8} {'updates':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, latencies in results:
+        summarize(name, latencies)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+"""
+Local stand-in for the Telegram Bot API
+
+Speaks just enough of the Bot API for the bot to start, receive updates by
+long polling or webhook, download uploaded files and send replies. Every reply is recorded with a
+timestamp so benchmarks can measure end-to-end latency offline.
+"""
+import json
+import time
+import asyncio
+import itertools
+from urllib.parse import parse_qs
+
+import httpx
+
+
+class FakeTelegramServer:
+    """Fake Bot API server: point the bot's base_url at `base_url`"""
+
+    BOT_USER = {
+        'id': 1000, 'is_bot': True, 'first_name': 'SpeechBot', 'username': 'speech_bot',
+        'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+    }
+
+    def __init__(self, host: str = '127.0.0.1'):
+        self.host = host
+        self._server = None
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._files = {}    # file_path -> bytes
+        self._new_update = asyncio.Event()
+        self._new_reply = asyncio.Event()
+        self._client = None
+        self._connections = set()
+
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.replies = []   # (monotonic time, method, params)
+        self.calls = {}     # method -> count
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, 0)
+        self._client = httpx.AsyncClient()
+
+    async def stop(self):
+        self._server.close()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        await self._client.aclose()
+
+    # Driving the bot
+
+    def make_message_update(self, text: str, user_id: int = 1, chat_id: int = None) -> dict:
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+        message = {
+            'message_id': next(self._message_ids), 'date': int(time.time()),
+            'chat': {'id': chat_id or user_id, 'type': 'private'}, 'from': user, 'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def make_document_update(self, file_name: str, data: bytes, user_id: int = 1, chat_id: int = None,
+                             mime_type: str = 'text/plain') -> dict:
+        """Update carrying a document that the bot can download through getFile"""
+        file_id = f"upload{next(self._file_ids)}"
+        self._files[f"documents/{file_id}"] = data
+        update = self.make_message_update('', user_id, chat_id)
+        message = update['message']
+        del message['text']
+        message['document'] = {
+            'file_id': file_id, 'file_unique_id': file_id, 'file_name': file_name,
+            'mime_type': mime_type, 'file_size': len(data),
+        }
+        return update
+
+    async def push_update(self, update: dict) -> float:
+        """Deliver an update by whichever mode the bot registered; returns the send time"""
+        sent_at = time.monotonic()
+        if self.webhook_url:
+            headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''}
+            response = await self._client.post(self.webhook_url, json=update, headers=headers)
+            response.raise_for_status()
+        else:
+            self._updates.append(update)
+            self._new_update.set()
+        return sent_at
+
+    async def wait_for_replies(self, count: int, timeout: float = 10.0):
+        """Wait until at least count replies have been recorded"""
+        deadline = time.monotonic() + timeout
+        while len(self.replies) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Only {len(self.replies)} of {count} replies arrived")
+            self._new_reply.clear()
+            try:
+                await asyncio.wait_for(self._new_reply.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    # Bot API methods
+
+    async def _call(self, method: str, params: dict):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        handler = getattr(self, f"_api_{method.lower()}", None)
+        if handler is None:
+            return True
+        return await handler(params)
+
+    async def _api_getme(self, params):
+        return self.BOT_USER
+
+    async def _api_setwebhook(self, params):
+        self.webhook_url = params.get('url')
+        self.webhook_secret = params.get('secret_token')
+        return True
+
+    async def _api_getfile(self, params):
+        file_id = params.get('file_id')
+        file_path = f"documents/{file_id}"
+        return {
+            'file_id': file_id, 'file_unique_id': file_id,
+            'file_size': len(self._files.get(file_path, b'')), 'file_path': file_path,
+        }
+
+    async def _api_deletewebhook(self, params):
+        self.webhook_url = None
+        return True
+
+    async def _api_getupdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self._updates)
+
+    def _record_reply(self, method, params, **extra):
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': next(self._message_ids), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': self.BOT_USER,
+        }
+        message.update(extra)
+        self.replies.append((time.monotonic(), method, params))
+        self._new_reply.set()
+        return message
+
+    async def _api_sendmessage(self, params):
+        return self._record_reply('sendMessage', params, text=params.get('text', ''))
+
+    async def _api_sendaudio(self, params):
+        file_id = params.get('audio') if isinstance(params.get('audio'), str) else f"audio{next(self._file_ids)}"
+        return self._record_reply('sendAudio', params, audio={
+            'file_id': file_id, 'file_unique_id': file_id, 'duration': 1,
+        })
+
+    async def _api_sendvoice(self, params):
+        file_id = params.get('voice') if isinstance(params.get('voice'), str) else f"voice{next(self._file_ids)}"
+        return self._record_reply('sendVoice', params, voice={
+            'file_id': file_id, 'file_unique_id': file_id, 'duration': 1,
+        })
+
+    async def _api_senddocument(self, params):
+        file_id = f"doc{next(self._file_ids)}"
+        return self._record_reply('sendDocument', params, document={'file_id': file_id, 'file_unique_id': file_id})
+
+    async def _api_editmessagetext(self, params):
+        return self._record_reply('editMessageText', params, text=params.get('text', ''))
+
+    # HTTP plumbing
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                _, target, _ = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+
+                if target.startswith('/file/'):
+                    # /file/bot<token>/<file_path>
+                    payload = self._files.get(target.split('/', 3)[3], b'')
+                    content_type = 'application/octet-stream'
+                else:
+                    method = target.rstrip('/').rsplit('/', 1)[-1]
+                    result = await self._call(method, self._parse_params(headers, body))
+                    payload = json.dumps({'ok': True, 'result': result}).encode()
+                    content_type = 'application/json'
+                writer.write(
+                    f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _parse_params(headers, body) -> dict:
+        content_type = headers.get('content-type', '')
+        if 'application/json' in content_type:
+            return json.loads(body or b'{}')
+        if 'x-www-form-urlencoded' in content_type:
+            params = {}
+            for key, values in parse_qs(body.decode('utf-8')).items():
+                try:
+                    params[key] = json.loads(values[0])
+                except ValueError:
+                    params[key] = values[0]
+            return params
+        # Multipart uploads: the file contents are not needed, only that something was sent
+        return {'chat_id': 0, 'multipart_bytes': len(body)}
@@ -1,26 +1,86 @@
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import subprocess
 import time
 import psutil
-import sys
 from config import Config
 from utils.logger import admin_logger
+from services.control_server import send_command, ControlError
+
+
+def format_duration(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes}m {int(seconds % 60)}s"
+
+
+class LogTail:
+    """Reads lines appended to a log file since the last read, following it across rotation"""
+    
+    def __init__(self, path, backlog_bytes=8192):
+        self.path = path
+        self.backlog_bytes = backlog_bytes
+        self.offset = None
+        self._inode = None
+        self._partial = b''
+    
+    def read_new(self):
+        """Complete lines written since the last call"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        
+        if self.offset is None:
+            # First read: start near the end to show some recent context
+            self.offset = max(0, stat.st_size - self.backlog_bytes)
+            self._inode = stat.st_ino
+            skip_partial = self.offset > 0
+        else:
+            skip_partial = False
+            if stat.st_ino != self._inode or stat.st_size < self.offset:
+                # Rotated or truncated: the new file is read from its start
+                self.offset = 0
+                self._inode = stat.st_ino
+                self._partial = b''
+        
+        if stat.st_size == self.offset:
+            return []
+        
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        if skip_partial and lines:
+            lines.pop(0)
+        return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
 
 class AdminPanel:
     """Admin control panel for bot management"""
     
+    DASHBOARD_REFRESH = 1.0  # seconds
+    DASHBOARD_LOG_LINES = 10
+    
     def __init__(self):
         self.bot_process = None
-        self.monitor_process = None
+        self.log_file = os.path.join(Config.LOGS_DIR, Config.BOT_LOG_FILE)
     
     def clear_screen(self):
         """Clear terminal screen"""
-        os.system('cls')
+        os.system('cls' if os.name == 'nt' else 'clear')
     
     def is_bot_running(self):
         """Check if bot process is running"""
+        # A bot that answers on its control socket is certainly running
+        try:
+            send_command('ping', timeout=1.0)
+            return True
+        except ControlError:
+            pass
+        
         bot_pid_file = os.path.join(Config.DATA_DIR, 'bot.pid')
         
         if not os.path.exists(bot_pid_file):
@@ -56,15 +116,7 @@ class AdminPanel:
             
             if psutil.pid_exists(pid):
                 process = psutil.Process(pid)
-                create_time = process.create_time()
-                uptime_seconds = time.time() - create_time
-                
-                # Format uptime
-                hours = int(uptime_seconds // 3600)
-                minutes = int((uptime_seconds % 3600) // 60)
-                seconds = int(uptime_seconds % 60)
-                
-                return f"{hours}h {minutes}m {seconds}s"
+                return format_duration(time.time() - process.create_time())
             else:
                 return "Not running"
                 
@@ -77,12 +129,15 @@ class AdminPanel:
             return "❌ Bot is already running!"
         
         try:
-            # Start bot process
+            # Start bot process; in sharded mode the supervisor starts the bot and its workers
+            script = "src/supervisor.py" if Config.SHARD_WORKERS else "src/bot.py"
             self.bot_process = subprocess.Popen(
-                [sys.executable, "src/bot.py"],
+                [sys.executable, script],
                 cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
+                stderr=subprocess.DEVNULL,
+                # Keep running, and keep supervising, after the admin panel is closed
+                start_new_session=os.name != 'nt'
             )
             
             # Save PID to file
@@ -134,34 +189,124 @@ class AdminPanel:
             admin_logger.error(f"Error stopping bot: {e}")
             return f"❌ Error stopping bot: {e}"
     
-    def start_log_terminal(self):
-        """Start log monitor terminal"""
+    def follow_log(self):
+        """Print the bot log as it grows until Ctrl+C"""
+        print(f"=== Bot Log: {self.log_file} (Ctrl+C to return) ===")
+        tail = LogTail(self.log_file)
         try:
-            log_file = os.path.join(Config.LOGS_DIR, 'bot.log')
-            
-            # Create log file if it doesn't exist
-            if not os.path.exists(log_file):
-                with open(log_file, 'w') as f:
-                    f.write("Log file created\n")
-            
-            # Start new terminal with log tailing
-            self.monitor_process = subprocess.Popen(
-                [
-                    'cmd', '/k',
-                    f'title Bot Monitor && '
-                    f'echo === Bot Log Monitor === && '
-                    f'echo Close this window anytime && '
-                    f'powershell Get-Content "{log_file}" -Wait'
-                ],
-                creationflags=subprocess.CREATE_NEW_CONSOLE
+            while True:
+                for line in tail.read_new():
+                    print(line)
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print()
+        return "✅ Stopped following the log"
+    
+    def run_command(self, command, **arguments):
+        """Send a control command to the bot and describe the outcome"""
+        try:
+            result = send_command(command, **arguments)
+        except ControlError as e:
+            admin_logger.error(f"Control command {command} failed: {e}")
+            return f"❌ {command} failed: {e}"
+        admin_logger.info(f"Control command {command} sent")
+        
+        if command == 'drain':
+            return f"✅ Draining: {result['in_progress']} updates/jobs in progress, the bot stops when they finish"
+        if command == 'reload':
+            if not result:
+                return "✅ Config reloaded, nothing changed"
+            return "✅ Config reloaded:\n" + "\n".join(f"   {name} = {value}" for name, value in result.items())
+        if command == 'scale':
+            return f"✅ Running {result['workers']} synthesis workers"
+        if command == 'flush_caches':
+            freed = (result['memory_bytes_freed'] + result['disk_bytes_freed']) / (1024 * 1024)
+            return f"✅ Flushed {result['scope']} audio cache ({freed:.1f} MB)"
+        return f"✅ {result}"
+    
+    def scale_workers(self):
+        """Ask for a new synthesis worker count and apply it without restarting"""
+        try:
+            current = send_command('status', path=Config.SUPERVISOR_SOCKET_PATH)['workers']
+        except ControlError as e:
+            return f"❌ Supervisor not reachable: {e}"
+        answer = input(f"Synthesis workers (now {current}): ").strip()
+        if not answer.isdigit() or int(answer) < 1:
+            return "❌ Please enter a number of at least 1"
+        return self.run_command('scale', path=Config.SUPERVISOR_SOCKET_PATH, workers=int(answer))
+    
+    def render_dashboard(self, stats, log_lines):
+        """Dashboard text for one refresh"""
+        mb = 1024 * 1024
+        updates = stats['updates']
+        scheduler = stats['scheduler']
+        pool = stats['synthesis_pool']
+        cache = stats['audio_cache']
+        segments = stats['segments']
+        status = "🟡 DRAINING" if stats['draining'] else "🟢 RUNNING"
+        
+        lines = [
+            "=================================",
+            "🤖 TEXT-TO-SPEECH BOT DASHBOARD",
+            "=================================",
+            f"Status: {status} ({stats['mode']})   PID: {stats['pid']}   Uptime: {format_duration(stats['uptime'])}",
+            f"Memory: {stats['rss_bytes'] / mb:.1f} MB RSS   "
+            f"Event loop lag: {stats['event_loop_lag'] * 1000:.1f} ms (max {stats['event_loop_lag_max'] * 1000:.1f} ms)",
+            f"Conversations: {stats['active_conversations']}",
+            "",
+            f"Updates:   {updates['running']} running, {updates['queued']} queued behind their chat, "
+            f"{updates['processed']} processed (wait p95 {updates['wait_p95']:.2f}s)",
+            f"Synthesis: {scheduler['running']} running, {scheduler['queued']} queued for "
+            f"{scheduler['users_waiting']} users, {scheduler['rejected']} rejected (wait p95 {scheduler['wait_p95']:.2f}s)",
+            f"Pool:      {pool['pending']}/{pool['max_pending']} jobs   "
+            f"Engines: " + ", ".join(f"{engine} {state}" for engine, state in stats['breakers'].items()),
+            f"Cache:     {cache['hit_rate'] * 100:.1f}% hit rate ({cache['memory_hits']} memory, "
+            f"{cache['disk_hits']} disk, {cache['misses']} misses), "
+            f"{cache['memory_bytes'] / mb:.1f} MB memory, {cache['disk_bytes'] / mb:.1f} MB disk",
+        ]
+        broker = stats.get('broker')
+        if broker:
+            lines.append(
+                f"Workers:   {len(broker['workers'])} connected, {broker['capacity']} slots, {broker['queued']} queued, "
+                f"{broker['in_flight']} in flight, {broker['requeued']} requeued, {broker['failed']} failed"
             )
-            
-            admin_logger.info("Log terminal opened")
-            return "✅ Log terminal opened!"
-            
-        except Exception as e:
-            admin_logger.error(f"Failed to start log terminal: {e}")
-            return f"❌ Failed to start log terminal: {e}"
+            for worker in broker['workers']:
+                lines.append(
+                    f"   worker{worker['worker']} (pid {worker['pid']}): {worker['in_flight']}/{worker['slots']} busy, "
+                    f"{worker['completed']} done, up {format_duration(worker['connected_for'])}"
+                )
+        hot_phrases = stats.get('hot_phrases')
+        if hot_phrases:
+            lines.append(
+                f"Hot:       {hot_phrases['hot']} phrases to prerender of {hot_phrases['candidates']} tracked, "
+                f"{hot_phrases['recorded']} requests counted in {hot_phrases['sketch_bytes'] // 1024} KB"
+            )
+        if segments:
+            lines.append(
+                f"Segments:  {segments['hit_rate'] * 100:.1f}% hit rate, {segments['segments']} stored, "
+                f"{segments['live_bytes'] / mb:.1f} MB"
+            )
+        lines += ["", f"--- {os.path.basename(self.log_file)} ---"] + list(log_lines)
+        lines += ["", "Ctrl+C to return to the menu"]
+        return "\n".join(lines)
+    
+    def show_dashboard(self):
+        """Refreshing live view of the bot's stats and log until Ctrl+C"""
+        tail = LogTail(self.log_file)
+        recent = []
+        try:
+            while True:
+                recent = (recent + tail.read_new())[-self.DASHBOARD_LOG_LINES:]
+                try:
+                    screen = self.render_dashboard(send_command('stats'), recent)
+                except ControlError as e:
+                    screen = f"❌ No stats from the bot: {e}"
+                # Move the cursor home and clear below, which redraws without flicker
+                print("\033[H\033[J" + screen, flush=True)
+                time.sleep(self.DASHBOARD_REFRESH)
+        except KeyboardInterrupt:
+            print()
+        return "✅ Dashboard closed"
     
     def display_menu(self):
         """Display admin menu based on bot status"""
@@ -175,59 +320,58 @@ class AdminPanel:
         
         if self.is_bot_running():
             print(f"Uptime: {self.get_uptime()}")
-            print("\n1. STOP Bot")
-            print("2. OPEN Log Terminal")
-            print("3. EXIT")
         else:
             print(f"Last Run: {self.get_uptime()}")
-            print("\n1. START Bot")
-            print("2. OPEN Log Terminal")
-            print("3. EXIT")
+        
+        print()
+        for number, (label, _) in enumerate(self.menu_actions(), start=1):
+            print(f"{number}. {label}")
         
         print("=================================")
     
+    def menu_actions(self):
+        """Menu entries for the bot's current state; None marks EXIT"""
+        if self.is_bot_running():
+            return [
+                ("STOP Bot", self.stop_bot),
+                ("LIVE Dashboard", self.show_dashboard),
+                ("FOLLOW Log", self.follow_log),
+                ("DRAIN Bot (finish current work, then stop)", lambda: self.run_command('drain')),
+                ("RELOAD Config", lambda: self.run_command('reload')),
+                ("FLUSH Audio Cache", lambda: self.run_command('flush_caches')),
+            ] + ([("SCALE Workers", self.scale_workers)] if Config.SHARD_WORKERS else []) + [
+                ("EXIT", None),
+            ]
+        return [
+            ("START Bot", self.start_bot),
+            ("FOLLOW Log", self.follow_log),
+            ("EXIT", None),
+        ]
+    
     def run(self):
         """Main admin panel loop"""
         admin_logger.info("Admin panel started")
         
         while True:
             self.display_menu()
+            actions = self.menu_actions()
             
             try:
-                choice = input("Choice [1-3]: ").strip()
+                choice = input(f"Choice [1-{len(actions)}]: ").strip()
                 self.clear_screen()
                 
                 print("=================================")
                 print("🤖 TEXT-TO-SPEECH BOT ADMIN")
                 print("=================================")
                 
-                if self.is_bot_running():
-                    # Bot is running menu
-                    if choice == "1":
-                        result = self.stop_bot()
-                        print(result)
-                    elif choice == "2":
-                        result = self.start_log_terminal()
-                        print(result)
-                    elif choice == "3":
-                        print("👋 Goodbye!")
-                        break
-                    else:
-                        print("❌ Invalid choice! Please select 1-3")
-                
+                if not choice.isdigit() or not 1 <= int(choice) <= len(actions):
+                    print(f"❌ Invalid choice! Please select 1-{len(actions)}")
                 else:
-                    # Bot is stopped menu
-                    if choice == "1":
-                        result = self.start_bot()
-                        print(result)
-                    elif choice == "2":
-                        result = self.start_log_terminal()
-                        print(result)
-                    elif choice == "3":
+                    _, action = actions[int(choice) - 1]
+                    if action is None:
                         print("👋 Goodbye!")
                         break
-                    else:
-                        print("❌ Invalid choice! Please select 1-3")
+                    print(action())
                 
                 input("\nPress Enter to continue...")
                 
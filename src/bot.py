@@ -1,9 +1,8 @@
 import os
-import sys
-
-# Add the project root to Python path
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, project_root)
+import time
+import signal
+import asyncio
+import secrets
 
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
@@ -15,6 +14,13 @@ from handlers.text_handler import TextHandler
 from handlers.audio_handler import AudioHandler
 from handlers.error_handler import ErrorHandler
 from services.file_service import FileService
+from services.sqlite_persistence import SQLitePersistence
+from services.webhook_server import WebhookServer
+from services.update_processor import ChatOrderedUpdateProcessor
+from services.metrics_server import MetricsServer
+from services.control_server import ControlServer, LoopLagMonitor
+from services.job_broker import JobBroker
+from utils.metrics import registry
 
 
 class TextToSpeechBot:
@@ -23,6 +29,18 @@ class TextToSpeechBot:
     def __init__(self):
         self.application = None
         self.audio_handler = AudioHandler()
+        self.persistence = None
+        self.metrics_server = None
+        self.control_server = None
+        self.broker = None
+        self.loop_monitor = LoopLagMonitor()
+        self.draining = False
+        self._started_at = time.time()
+        self._stop_event = None
+        self._webhook_server = None
+        self._scan_task = None
+        self._file_id_task = None
+        self._drain_task = None
     
     def setup_handlers(self):
         """Setup all conversation handlers"""
@@ -43,6 +61,8 @@ class TextToSpeechBot:
                 ],
                 Config.AWAITING_SPEED: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.audio_handler.handle_speed_selection),
+                    # Further files of an album that started a batch
+                    MessageHandler(filters.Document.ALL, TextHandler.handle_batch_document),
                     CommandHandler('cancel', StartHandler.cancel)
                 ],
                 Config.CONTINUOUS_MODE: [
@@ -51,8 +71,13 @@ class TextToSpeechBot:
                 ],
             },
             fallbacks=[CommandHandler('cancel', StartHandler.cancel)],
+            name='main_conversation',
+            persistent=True,
         )
         
+        # Audio format settings work at any point, so they go before the conversation
+        self.application.add_handler(CommandHandler('format', StartHandler.format_command), group=-1)
+        
         # Add handlers to application
         self.application.add_handler(conv_handler)
         self.application.add_handler(CommandHandler('help', StartHandler.help_command))
@@ -61,17 +86,262 @@ class TextToSpeechBot:
         # Add error handler
         self.application.add_error_handler(ErrorHandler.error_handler)
     
+    def register_metrics(self):
+        """Expose queue depths and existing counters; they are read only when metrics are scraped"""
+        tts_service = self.audio_handler.tts_service
+        scheduler = self.audio_handler.scheduler
+        cache = tts_service.cache
+        
+        queue_depth = registry.gauge('queue_depth', "Work waiting or in progress", ('queue',))
+        queue_depth.set_function(lambda: scheduler.queue_depth, queue='scheduler_waiting')
+        queue_depth.set_function(lambda: scheduler.running, queue='scheduler_running')
+        queue_depth.set_function(lambda: tts_service.pending_jobs, queue='synthesis_pool')
+        queue_depth.set_function(lambda: self.application.update_processor.backlog, queue='updates')
+        
+        registry.gauge('active_conversations', "Chats in the middle of a conversation").set_function(
+            self.persistence.active_conversations
+        )
+        
+        cache_lookups = registry.counter_function('cache_lookups_total', "Audio cache lookups", ('cache', 'result'))
+        cache_lookups.set_function(lambda: cache.memory_hits, cache='audio', result='memory_hit')
+        cache_lookups.set_function(lambda: cache.disk_hits, cache='audio', result='disk_hit')
+        cache_lookups.set_function(lambda: cache.misses, cache='audio', result='miss')
+        if tts_service.segments is not None:
+            segments = tts_service.segments
+            cache_lookups.set_function(lambda: segments.hits, cache='segments', result='hit')
+            cache_lookups.set_function(lambda: segments.misses, cache='segments', result='miss')
+        
+        registry.counter_function('hedged_requests_total', "Requests that were also sent to a backup engine").set_function(
+            lambda: tts_service.hedged_requests
+        )
+        if self.broker is not None:
+            broker = self.broker
+            queue_depth.set_function(lambda: broker.queue_depth, queue='broker_waiting')
+            queue_depth.set_function(lambda: broker.in_flight, queue='broker_in_flight')
+            registry.gauge('synthesis_workers', "Connected synthesis worker processes").set_function(
+                lambda: len(broker.stats()['workers'])
+            )
+        registry.gauge('event_loop_lag_seconds', "How late the event loop last woke up").set_function(
+            lambda: self.loop_monitor.lag
+        )
+    
+    # Control socket commands
+    
+    def runtime_stats(self) -> dict:
+        """Live numbers for the admin dashboard"""
+        import psutil  # only the dashboard needs it
+        tts_service = self.audio_handler.tts_service
+        segments = tts_service.segments
+        return {
+            'pid': os.getpid(),
+            'mode': Config.BOT_MODE,
+            'uptime': time.time() - self._started_at,
+            'draining': self.draining,
+            'rss_bytes': psutil.Process().memory_info().rss,
+            'event_loop_lag': self.loop_monitor.lag,
+            'event_loop_lag_max': self.loop_monitor.max_lag,
+            'active_conversations': self.persistence.active_conversations(),
+            'updates': self.application.update_processor.stats(),
+            'scheduler': self.audio_handler.scheduler.stats(),
+            'synthesis_pool': {'pending': tts_service.pending_jobs, 'max_pending': tts_service.max_pending},
+            'breakers': {engine: breaker.state for engine, breaker in tts_service.breakers.items()},
+            'audio_cache': tts_service.cache.stats(),
+            'segments': segments.stats() if segments is not None else None,
+            'broker': self.broker.stats() if self.broker is not None else None,
+            'hot_phrases': self.audio_handler.hot_phrases.stats(),
+        }
+    
+    def drain(self) -> dict:
+        """Stop taking updates, let the ones in progress finish, then shut down"""
+        if not self.draining:
+            self.draining = True
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain())
+        return {'draining': True, 'in_progress': self._work_in_progress()}
+    
+    def _work_in_progress(self) -> int:
+        scheduler = self.audio_handler.scheduler
+        return (
+            self.application.update_queue.qsize() + self.application.update_processor.backlog
+            + scheduler.queue_depth + scheduler.running
+        )
+    
+    def enable_sharding(self):
+        """Send synthesis to worker processes through the job broker instead of this process"""
+        scheduler = self.audio_handler.scheduler
+        self.broker = JobBroker(self.audio_handler.tts_service, on_capacity_change=scheduler.set_concurrency)
+        self.audio_handler.synthesizer = self.broker
+        # Jobs are let through as worker slots appear
+        scheduler.set_concurrency(self.broker.capacity)
+    
+    async def _drain(self):
+        bot_logger.info("Draining: no new updates are accepted")
+        if self.application.updater is not None and self.application.updater.running:
+            await self.application.updater.stop()
+        if self._webhook_server is not None:
+            await self._webhook_server.stop()
+        
+        while self._work_in_progress():
+            await asyncio.sleep(0.2)
+        
+        bot_logger.info("Drained, shutting down")
+        if self._stop_event is not None:
+            self._stop_event.set()
+        else:
+            self.application.stop_running()
+    
+    @staticmethod
+    def reload_config() -> dict:
+        """Apply changed settings from the environment and .env file"""
+        changed = Config.reload()
+        if changed:
+            bot_logger.info(f"Reloaded settings: {', '.join(sorted(changed))}")
+        return changed
+    
+    def flush_caches(self, scope: str = 'memory') -> dict:
+        """Drop cached audio from memory, or from memory and disk with scope='all'"""
+        if scope not in ('memory', 'all'):
+            raise ValueError("scope must be 'memory' or 'all'")
+        cache = self.audio_handler.tts_service.cache
+        before = cache.stats()
+        cache.clear(disk=scope == 'all')
+        return {
+            'scope': scope,
+            'memory_bytes_freed': before['memory_bytes'],
+            'disk_bytes_freed': before['disk_bytes'] if scope == 'all' else 0,
+        }
+    
     async def post_init(self, application):
         """Run after bot initialization"""
-        # Clean up old files on startup
-        FileService.cleanup_old_files()
+        # Index files left by earlier runs in the background, then expire temp files periodically
+        self._scan_task = asyncio.get_running_loop().create_task(FileService.scan_existing())
+        # Replay the file_id log in a thread; until it is loaded known audio is just uploaded again
+        self._file_id_task = asyncio.get_running_loop().create_task(self.audio_handler.file_ids.load())
+        if application.job_queue is not None:
+            application.job_queue.run_repeating(
+                FileService.expire_job,
+                interval=Config.TEMP_CLEANUP_INTERVAL,
+                first=Config.TEMP_CLEANUP_INTERVAL,
+                name='expire_temp_files'
+            )
+            application.job_queue.run_repeating(
+                self.prerender_job,
+                interval=Config.HOT_PHRASE_INTERVAL,
+                first=Config.HOT_PHRASE_INTERVAL,
+                name='prerender_hot_phrases'
+            )
+        else:
+            bot_logger.warning(
+                "JobQueue unavailable, temp files are only cleaned up on startup and shutdown, "
+                "and hot phrases are not prerendered"
+            )
+        if self.broker is not None:
+            await self.broker.start()
+        else:
+            # Import the engines and start pyttsx3 fallback workers in the background
+            self.audio_handler.tts_service.warm_up_in_background()
+        self.loop_monitor.start()
+        if Config.CONTROL_SOCKET_ENABLED:
+            self.control_server = ControlServer({
+                'ping': lambda: 'pong',
+                'stats': self.runtime_stats,
+                'drain': self.drain,
+                'reload': self.reload_config,
+                'flush_caches': self.flush_caches,
+            })
+            if not await self.control_server.start():
+                self.control_server = None
+        if Config.METRICS_ENABLED:
+            self.metrics_server = MetricsServer()
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                bot_logger.error(f"Metrics endpoint unavailable: {e}")
+                self.metrics_server = None
         bot_logger.info("Bot initialized successfully")
     
+    async def prerender_job(self, context=None):
+        """JobQueue callback: synthesize hot phrases ahead of time while nobody is waiting"""
+        if Config.HOT_PHRASES_ENABLED and not self.draining:
+            await self.audio_handler.prerender_hot_phrases()
+    
     async def post_stop(self, application):
         """Run before bot shutdown"""
         bot_logger.info("Bot shutting down...")
-        # Clean up temp files on shutdown
-        FileService.cleanup_old_files(0)  # Clean all temp files
+        await self.loop_monitor.stop()
+        if self.broker is not None:
+            await self.broker.stop()
+        if self.control_server is not None:
+            await self.control_server.stop()
+            self.control_server = None
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+            self.metrics_server = None
+        await self.audio_handler.file_ids.flush()
+        # Stop synthesis workers before removing their files
+        self.audio_handler.tts_service.shutdown()
+        # Clean up temp files on shutdown, except ones still being sent
+        FileService.cleanup_old_files(0)
+    
+    def build_application(self):
+        """Create the application with handlers and lifecycle hooks"""
+        # Conversations and user data are kept across restarts
+        self.persistence = SQLitePersistence()
+        builder = Application.builder().token(Config.TELEGRAM_TOKEN).persistence(self.persistence)
+        # Chats are served concurrently, updates within one chat stay in order
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor())
+        if Config.TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(Config.TELEGRAM_API_BASE_URL)
+        self.application = builder.build()
+        
+        if Config.SHARD_WORKERS:
+            self.enable_sharding()
+        
+        # Setup handlers
+        self.setup_handlers()
+        self.register_metrics()
+        
+        # Add startup/shutdown hooks
+        self.application.post_init = self.post_init
+        self.application.post_stop = self.post_stop
+        return self.application
+    
+    async def run_webhook(self, stop_event: asyncio.Event = None):
+        """Receive updates on a local webhook server until stop_event is set or a stop signal arrives"""
+        application = self.application
+        secret_token = Config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        server = self._webhook_server = WebhookServer(application, secret_token=secret_token)
+        
+        stop_event = self._stop_event = stop_event or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+        
+        await application.initialize()
+        try:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            await server.start()
+            await application.bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=Config.DROP_PENDING_UPDATES,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+            )
+            bot_logger.info(f"Webhook registered at {Config.WEBHOOK_URL}")
+            await stop_event.wait()
+        finally:
+            # Stop taking new updates, then let the queued ones finish
+            await server.stop()
+            if application.running:
+                await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
     
     def run(self):
         """Start the bot"""
@@ -79,22 +349,19 @@ class TextToSpeechBot:
             # Validate configuration
             Config.validate_setup()
             
-            # Create application
-            self.application = Application.builder().token(Config.TELEGRAM_TOKEN).build()
-            
-            # Setup handlers
-            self.setup_handlers()
+            self.build_application()
             
-            # Add startup/shutdown hooks
-            self.application.post_init = self.post_init
-            self.application.post_stop = self.post_stop
+            if Config.BOT_MODE == 'webhook':
+                bot_logger.info("Starting bot in webhook mode...")
+                asyncio.run(self.run_webhook())
+                return
             
             bot_logger.info("Starting bot polling...")
             
             # Start the bot
             self.application.run_polling(
                 allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True
+                drop_pending_updates=Config.DROP_PENDING_UPDATES
             )
             
         except Exception as e:
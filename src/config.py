@@ -1,4 +1,6 @@
 import os
+import socket
+import importlib.util
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,16 +8,156 @@ load_dotenv()
 class Config:
     TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'your_bot_token_here')
     MAX_TEXT_LENGTH = int(os.getenv('MAX_TEXT_LENGTH', 5000))
+    # Larger .txt uploads are refused before downloading (at most 4 bytes per character, plus a BOM)
+    MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', MAX_TEXT_LENGTH * 4 + 4))
     DEFAULT_SPEED = float(os.getenv('DEFAULT_SPEED', 1.0))
+    # Only set to talk to a self-hosted or fake Bot API server, e.g. http://127.0.0.1:8081/bot
+    TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+
+    # How updates arrive: 'polling' or 'webhook'
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # public HTTPS URL Telegram posts to
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # random per start when empty
+    WEBHOOK_MAX_QUEUE = int(os.getenv('WEBHOOK_MAX_QUEUE', 100))
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
     
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
     LOGS_DIR = os.path.join(BASE_DIR, '..', 'logs')
     TEMP_AUDIO_DIR = os.path.join(DATA_DIR, 'temp_audio')
+    AUDIO_CACHE_DIR = os.path.join(DATA_DIR, 'audio_cache')
     
     DATABASE_PATH = os.path.join(DATA_DIR, 'user_sessions.db')
+    FILE_ID_STORE_PATH = os.path.join(DATA_DIR, 'file_ids.log')
+    LONG_DOCUMENT_DIR = os.path.join(DATA_DIR, 'documents')
+    SEGMENT_STORE_PATH = os.path.join(DATA_DIR, 'segments.pack')
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-    
+
+    # Session persistence
+    PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', 5))
+    PERSISTENCE_WRITE_DELAY = float(os.getenv('PERSISTENCE_WRITE_DELAY', 0.5))
+    DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', 'false').lower() == 'true'
+
+    # Prometheus metrics endpoint, local only by default
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9464))
+
+    # Log files rotate by size, or by time when LOG_ROTATE_WHEN is set (e.g. 'midnight')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # 'text' or 'json' (one JSON object per line)
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+    BOT_LOG_FILE = os.getenv('BOT_LOG_FILE', 'bot.log')  # synthesis workers log to workerN.log
+
+    # Local control socket the admin panel uses for live stats and commands (not on Windows)
+    CONTROL_SOCKET_ENABLED = os.getenv('CONTROL_SOCKET_ENABLED', 'true').lower() == 'true'
+    CONTROL_SOCKET_PATH = os.getenv('CONTROL_SOCKET_PATH', os.path.join(DATA_DIR, 'control.sock'))
+
+    # Sharded mode (Linux/macOS): the bot process receives updates and SHARD_WORKERS
+    # worker processes synthesize, all run by src/supervisor.py; 0 runs everything in one process
+    SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', 0))
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 4))  # jobs per worker at once
+    BROKER_SOCKET_PATH = os.getenv('BROKER_SOCKET_PATH', os.path.join(DATA_DIR, 'broker.sock'))
+    SUPERVISOR_SOCKET_PATH = os.getenv('SUPERVISOR_SOCKET_PATH', os.path.join(DATA_DIR, 'supervisor.sock'))
+
+    # Update dispatch: chats are handled concurrently, each chat's updates in order
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 64))
+    CHAT_WAIT_WARNING = float(os.getenv('CHAT_WAIT_WARNING', 10))
+
+    # Synthesis worker pool
+    TTS_MAX_WORKERS = int(os.getenv('TTS_MAX_WORKERS', max(4, os.cpu_count() or 1)))
+    TTS_MAX_PENDING = int(os.getenv('TTS_MAX_PENDING', 32))
+    TTS_JOB_TIMEOUT = float(os.getenv('TTS_JOB_TIMEOUT', 60))
+    TTS_LANGUAGE = os.getenv('TTS_LANGUAGE', 'en')
+
+    # Fair scheduling of synthesis jobs between users
+    SCHEDULER_MAX_QUEUE_DEPTH = int(os.getenv('SCHEDULER_MAX_QUEUE_DEPTH', 200))
+    SCHEDULER_MAX_JOBS_PER_USER = int(os.getenv('SCHEDULER_MAX_JOBS_PER_USER', 20))
+    SCHEDULER_SHORT_TEXT_CHARS = int(os.getenv('SCHEDULER_SHORT_TEXT_CHARS', 300))
+
+    # Per-engine circuit breakers and hedged requests
+    BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', 20))
+    BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', 0.5))
+    BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', 5))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+    TTS_HEDGING = os.getenv('TTS_HEDGING', 'false').lower() == 'true'
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+    HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 10))
+
+    # Offline pyttsx3 fallback worker processes (0 runs a single in-process engine)
+    PYTTSX_POOL_SIZE = int(os.getenv('PYTTSX_POOL_SIZE', os.cpu_count() or 1))
+    PYTTSX_MAX_JOBS_PER_WORKER = int(os.getenv('PYTTSX_MAX_JOBS_PER_WORKER', 100))
+    PYTTSX_POOL_MAX_QUEUE = int(os.getenv('PYTTSX_POOL_MAX_QUEUE', 32))
+    PYTTSX_HEALTH_INTERVAL = float(os.getenv('PYTTSX_HEALTH_INTERVAL', 300))
+
+    # Synthesized audio cache
+    AUDIO_CACHE_MEMORY_BYTES = int(os.getenv('AUDIO_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))
+    AUDIO_CACHE_DISK_BYTES = int(os.getenv('AUDIO_CACHE_DISK_BYTES', 512 * 1024 * 1024))
+    AUDIO_CACHE_TTL = int(os.getenv('AUDIO_CACHE_TTL', 7 * 24 * 3600))
+    # Fallback (pyttsx3) audio is kept briefly, so repeated texts get gTTS quality again once it recovers
+    FALLBACK_CACHE_TTL = int(os.getenv('FALLBACK_CACHE_TTL', 600))
+    AUDIO_SPILL_THRESHOLD = int(os.getenv('AUDIO_SPILL_THRESHOLD', 10 * 1024 * 1024))
+    # Temp audio files are deleted this long after creation, checked every TEMP_CLEANUP_INTERVAL seconds
+    TEMP_FILE_TTL = int(os.getenv('TEMP_FILE_TTL', 3600))
+    TEMP_CLEANUP_INTERVAL = int(os.getenv('TEMP_CLEANUP_INTERVAL', 300))
+    FILE_ID_STORE_MAX_ENTRIES = int(os.getenv('FILE_ID_STORE_MAX_ENTRIES', 50000))
+    # gTTS audio is also cached per sentence, so texts sharing sentences reuse them
+    SEGMENT_CACHE_ENABLED = os.getenv('SEGMENT_CACHE_ENABLED', 'true').lower() == 'true'
+    SEGMENT_STORE_MAX_BYTES = int(os.getenv('SEGMENT_STORE_MAX_BYTES', 256 * 1024 * 1024))
+
+    # Audio post-processing (needs numpy and ffmpeg)
+    TIME_STRETCH_ENABLED = os.getenv('TIME_STRETCH_ENABLED', 'true').lower() == 'true'
+    FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+    MP3_BITRATE = os.getenv('MP3_BITRATE', '64k')
+
+    # Output encoding: 'mp3' sends audio files, 'voice' sends OGG/Opus voice notes (needs ffmpeg).
+    # Users can pick their own with /format; these are the defaults
+    AUDIO_OUTPUT_FORMAT = os.getenv('AUDIO_OUTPUT_FORMAT', 'mp3').lower()
+    AUDIO_QUALITY = os.getenv('AUDIO_QUALITY', 'standard').lower()  # 'low', 'standard' or 'high'
+    OPUS_BITRATES = os.getenv('OPUS_BITRATES', '16k,24k,32k').split(',')  # for low, standard, high
+    MP3_LOW_BITRATE = os.getenv('MP3_LOW_BITRATE', '24k')  # other MP3 qualities keep gTTS's own encoding
+    # Texts at least this long are encoded one quality level lower, as they make the largest uploads
+    AUDIO_LONG_TEXT_CHARS = int(os.getenv('AUDIO_LONG_TEXT_CHARS', 2000))
+
+    # Progressive delivery of long texts in sentence-aligned parts
+    PROGRESSIVE_DELIVERY = os.getenv('PROGRESSIVE_DELIVERY', 'true').lower() == 'true'
+    PROGRESSIVE_MIN_LENGTH = int(os.getenv('PROGRESSIVE_MIN_LENGTH', 800))
+    PROGRESSIVE_CHUNK_CHARS = int(os.getenv('PROGRESSIVE_CHUNK_CHARS', 500))
+
+    # Long-document mode: .txt files over MAX_TEXT_LENGTH are converted from disk, chunk by chunk
+    LONG_DOCUMENT_ENABLED = os.getenv('LONG_DOCUMENT_ENABLED', 'true').lower() == 'true'
+    LONG_DOCUMENT_MAX_BYTES = int(os.getenv('LONG_DOCUMENT_MAX_BYTES', 20 * 1024 * 1024))  # Bot API download limit
+    LONG_DOCUMENT_MAX_CHARS = int(os.getenv('LONG_DOCUMENT_MAX_CHARS', 2_000_000))
+    LONG_DOCUMENT_CHUNK_CHARS = int(os.getenv('LONG_DOCUMENT_CHUNK_CHARS', 1000))
+    LONG_DOCUMENT_LOOKAHEAD = int(os.getenv('LONG_DOCUMENT_LOOKAHEAD', 3))
+    LONG_DOCUMENT_DOWNLOAD_TIMEOUT = float(os.getenv('LONG_DOCUMENT_DOWNLOAD_TIMEOUT', 120))  # seconds
+    # Uploaded documents nobody converts (abandoned conversations) are deleted after this long
+    LONG_DOCUMENT_TTL = int(os.getenv('LONG_DOCUMENT_TTL', 24 * 3600))
+    # Bot API upload limit is 50 MB; leave room for the multipart envelope
+    TELEGRAM_UPLOAD_LIMIT = int(os.getenv('TELEGRAM_UPLOAD_LIMIT', 49 * 1024 * 1024))
+
+    # Batch mode: a zip of .txt files, or several .txt files sent together as an album
+    BATCH_ENABLED = os.getenv('BATCH_ENABLED', 'true').lower() == 'true'
+    BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 50))
+    BATCH_MAX_ZIP_BYTES = int(os.getenv('BATCH_MAX_ZIP_BYTES', 20 * 1024 * 1024))  # Bot API download limit
+    BATCH_PARALLELISM = int(os.getenv('BATCH_PARALLELISM', 8))  # files synthesized at once per batch
+    # Batches of at least this many files come back as a zip archive, smaller ones as audio messages
+    BATCH_ARCHIVE_MIN_FILES = int(os.getenv('BATCH_ARCHIVE_MIN_FILES', 5))
+
+    # Hot phrases: short texts requested again and again are synthesized ahead of time while the bot is idle
+    HOT_PHRASES_ENABLED = os.getenv('HOT_PHRASES_ENABLED', 'true').lower() == 'true'
+    HOT_PHRASE_MAX_CHARS = int(os.getenv('HOT_PHRASE_MAX_CHARS', 1000))  # longer texts are not tracked
+    HOT_PHRASE_MIN_COUNT = int(os.getenv('HOT_PHRASE_MIN_COUNT', 3))  # requests before a phrase is prerendered
+    HOT_PHRASE_TOP_K = int(os.getenv('HOT_PHRASE_TOP_K', 200))  # candidates kept with their text
+    # Counters per sketch row; the sketch takes 16 bytes per unit of width
+    HOT_PHRASE_SKETCH_WIDTH = int(os.getenv('HOT_PHRASE_SKETCH_WIDTH', 4096))
+    HOT_PHRASE_INTERVAL = int(os.getenv('HOT_PHRASE_INTERVAL', 60))  # seconds between idle checks
+    HOT_PHRASE_BATCH = int(os.getenv('HOT_PHRASE_BATCH', 20))  # phrases prerendered per idle check at most
+
     SPEED_OPTIONS = {
         '0.5x': 0.5,
         '1.0x': 1.0,
@@ -26,13 +168,69 @@ class Config:
     
     MAIN_MENU, AWAITING_TEXT, AWAITING_SPEED, CONTINUOUS_MODE = range(4)
     
+    # Settings read on every request, so a reload applies them without a restart
+    RELOADABLE = (
+        'MAX_TEXT_LENGTH', 'MAX_UPLOAD_BYTES', 'DEFAULT_SPEED', 'TTS_JOB_TIMEOUT',
+        'TTS_HEDGING', 'HEDGE_PERCENTILE', 'HEDGE_MIN_SAMPLES',
+        'PROGRESSIVE_DELIVERY', 'PROGRESSIVE_MIN_LENGTH', 'PROGRESSIVE_CHUNK_CHARS',
+        'TIME_STRETCH_ENABLED', 'MP3_BITRATE', 'AUDIO_SPILL_THRESHOLD', 'TEMP_FILE_TTL',
+        'AUDIO_OUTPUT_FORMAT', 'AUDIO_QUALITY', 'OPUS_BITRATES', 'MP3_LOW_BITRATE', 'AUDIO_LONG_TEXT_CHARS',
+        'LONG_DOCUMENT_ENABLED', 'LONG_DOCUMENT_MAX_BYTES', 'LONG_DOCUMENT_MAX_CHARS', 'LONG_DOCUMENT_CHUNK_CHARS',
+        'BATCH_ENABLED', 'BATCH_MAX_FILES', 'BATCH_MAX_ZIP_BYTES', 'BATCH_PARALLELISM', 'BATCH_ARCHIVE_MIN_FILES',
+        'HOT_PHRASES_ENABLED', 'HOT_PHRASE_MAX_CHARS', 'HOT_PHRASE_MIN_COUNT', 'HOT_PHRASE_BATCH',
+    )
+    
+    @classmethod
+    def reload(cls) -> dict:
+        """Re-read the environment and .env file and apply the RELOADABLE settings; returns what changed"""
+        load_dotenv(override=True)
+        # Evaluate this file again for fresh values, without replacing the class everyone imported
+        spec = importlib.util.spec_from_file_location('_config_reload', __file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        # A bad value rejects the whole reload, so nothing is half applied
+        cls.validate_settings(module.Config)
+        
+        changed = {}
+        for name in cls.RELOADABLE:
+            value = getattr(module.Config, name)
+            if value != getattr(cls, name):
+                changed[name] = value
+                setattr(cls, name, value)
+        return changed
+    
+    @staticmethod
+    def validate_settings(config):
+        """Check the RELOADABLE settings of config, a Config class; raises ValueError"""
+        if config.AUDIO_OUTPUT_FORMAT not in ('mp3', 'voice'):
+            raise ValueError("AUDIO_OUTPUT_FORMAT must be 'mp3' or 'voice'")
+        if config.AUDIO_QUALITY not in ('low', 'standard', 'high'):
+            raise ValueError("AUDIO_QUALITY must be 'low', 'standard' or 'high'")
+        if len(config.OPUS_BITRATES) != 3:
+            raise ValueError("OPUS_BITRATES must list three bitrates: low, standard and high")
+    
     @classmethod
     def validate_setup(cls):
         if cls.TELEGRAM_TOKEN == 'your_bot_token_here':
             raise ValueError("Please set TELEGRAM_BOT_TOKEN in .env file")
+        if cls.BOT_MODE not in ('polling', 'webhook'):
+            raise ValueError("BOT_MODE must be 'polling' or 'webhook'")
+        if cls.BOT_MODE == 'webhook' and not cls.WEBHOOK_URL:
+            raise ValueError("Please set WEBHOOK_URL in .env file to use webhook mode")
+        cls.validate_settings(cls)
+        if cls.LOG_FORMAT not in ('text', 'json'):
+            raise ValueError("LOG_FORMAT must be 'text' or 'json'")
+        if cls.SHARD_WORKERS and not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Sharded mode (SHARD_WORKERS) needs Unix sockets, which this platform lacks")
+        if cls.HOT_PHRASE_SKETCH_WIDTH < 1 or cls.HOT_PHRASE_TOP_K < 1:
+            raise ValueError("HOT_PHRASE_SKETCH_WIDTH and HOT_PHRASE_TOP_K must be at least 1")
+        if cls.CONCURRENT_UPDATES < 1:
+            raise ValueError("CONCURRENT_UPDATES must be at least 1")
         
         os.makedirs(cls.DATA_DIR, exist_ok=True)
         os.makedirs(cls.LOGS_DIR, exist_ok=True)
         os.makedirs(cls.TEMP_AUDIO_DIR, exist_ok=True)
+        os.makedirs(cls.AUDIO_CACHE_DIR, exist_ok=True)
+        os.makedirs(cls.LONG_DOCUMENT_DIR, exist_ok=True)
         
         return True
\ No newline at end of file
@@ -1,19 +1,38 @@
-import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import asyncio
 
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from config import Config
 from utils.logger import bot_logger
-from services.tts_service import TTSService
-from services.file_service import FileService
+from services.tts_service import TTSService, TTSBusyError, TTSTimeoutError
+from services.file_id_store import FileIdStore
+from services.job_scheduler import JobScheduler, QueueFullError
+from services.long_document_service import LongDocumentService, LongDocumentError
+from services.batch_service import BatchService, BatchArchive
+from services.audio_encoder import AudioEncoder, choose_profile
+from services.hot_phrases import HotPhraseTracker
+from utils.text_splitter import split_text_chunks
+from utils.metrics import upload_seconds, request_seconds, errors_total, upload_bytes_total, prerenders_total
 
 class AudioHandler:
     """Handles speed selection and audio generation"""
     
+    AUDIO_TITLE = "Text-to-Speech Audio"
+    AUDIO_PERFORMER = "SpeechBot"
+    PROGRESS_EDIT_INTERVAL = 1.0  # seconds between progress message edits
+    UPLOAD_TIMEOUT = 300  # long-document parts can be close to 50 MB
+    
     def __init__(self):
         self.tts_service = TTSService()
+        # Where synthesis runs: this process, or worker processes behind a JobBroker in sharded mode
+        self.synthesizer = self.tts_service
+        self.encoder = AudioEncoder(self.tts_service)
+        self.file_ids = FileIdStore()
+        self.scheduler = JobScheduler(concurrency=self.tts_service.max_workers)
+        self.hot_phrases = HotPhraseTracker()
     
     async def handle_speed_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle speed selection and generate audio"""
@@ -32,7 +51,13 @@ class AudioHandler:
         
         # Get text from context
         text = context.user_data.get('text_to_process')
-        if not text:
+        document_path = context.user_data.get('document_path')
+        if document_path and not os.path.exists(document_path):
+            # Expired while the conversation waited, e.g. one restored from persistence
+            context.user_data.pop('document_path', None)
+            document_path = None
+        batch = context.user_data.get('batch')
+        if not text and not document_path and not batch:
             await update.message.reply_text("❌ Text not found. Please start over.")
             from handlers.start_handler import StartHandler
             return await StartHandler.main_menu(update, context)
@@ -40,8 +65,14 @@ class AudioHandler:
         # Store speed for continuous mode
         context.user_data['last_speed'] = speed
         
-        # Generate audio
-        await self._generate_and_send_audio(update, context, text, speed, user.id)
+        # Generate audio; long documents are converted from disk in parts
+        if batch:
+            context.user_data.pop('batch', None)
+            await self._convert_batch(update, context, batch, speed, user.id)
+        elif document_path:
+            await self._convert_long_document(update, context, document_path, speed, user.id)
+        else:
+            await self._generate_and_send_audio(update, context, text, speed, user.id)
         
         # Ask for next action
         keyboard = [["🔄 Keep Sending", "🛑 Stop"]]
@@ -162,43 +193,474 @@ class AudioHandler:
     async def _generate_and_send_audio(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
                                      text: str, speed: float, user_id: int):
         """Generate audio and send to user with progress updates"""
+        caption = f"Speed: {speed}x | Text: {len(text)} chars"
+        profile = self._output_profile(context, len(text))
+        result = None
+        started = time.perf_counter()
+        mode, outcome = 'single', 'error'
+        if Config.HOT_PHRASES_ENABLED:
+            self.hot_phrases.record(text, speed)
+        
         try:
+            # Telegram already has this audio, send it by file_id
+            if await self._send_known_audio(update, text, speed, caption, profile):
+                outcome = 'file_id'
+                bot_logger.info(
+                    f"User {user_id} received audio by file_id (speed: {speed}x, length: {len(text)} chars)",
+                    extra={'user_id': user_id, 'text_length': len(text), 'speed': speed, 'delivery': 'file_id',
+                           'latency_ms': round((time.perf_counter() - started) * 1000)}
+                )
+                return
+            
+            # Long texts are delivered part by part as soon as each part is ready
+            if Config.PROGRESSIVE_DELIVERY and len(text) >= Config.PROGRESSIVE_MIN_LENGTH:
+                chunks = split_text_chunks(text, Config.PROGRESSIVE_CHUNK_CHARS)
+                if len(chunks) > 1:
+                    mode = 'progressive'
+                    await self._generate_and_send_progressive(update, chunks, speed, user_id, profile)
+                    outcome = 'ok'
+                    return
+            
             # Send progress message
+            status = "⏳ Waiting in queue..." if self.scheduler.is_saturated() else "🔄 Creating audio..."
             progress_msg = await update.message.reply_text(
-                f"🔄 Creating audio...\n"
+                f"{status}\n"
                 f"📊 Text: {len(text)} characters\n"
                 f"⚡ Speed: {speed}x"
             )
             
-            # Generate audio
-            audio_file_path = self.tts_service.convert_text_to_speech(text, speed)
+            # Generate audio in the worker pool, taking turns fairly with other users
+            result = await self._synthesize(user_id, text, speed, profile)
             
             # Update progress
             await progress_msg.edit_text("📤 Sending audio...")
             
-            # Send audio file
-            with open(audio_file_path, 'rb') as audio_file:
-                await update.message.reply_audio(
-                    audio=audio_file,
-                    title="Text-to-Speech Audio",
-                    performer="SpeechBot",
-                    caption=f"Speed: {speed}x | Text: {len(text)} chars"
-                )
+            # Send audio file, or voice note
+            await self._send_result(update, result, self.AUDIO_TITLE, caption)
             
             # Delete progress message
             await progress_msg.delete()
             
-            # Clean up audio file
-            FileService.delete_file(audio_file_path)
+            # Clean up spilled audio file
+            result.release()
+            
+            outcome = 'ok'
+            bot_logger.info(
+                f"User {user_id} received audio (speed: {speed}x, length: {len(text)} chars)",
+                extra={'user_id': user_id, 'text_length': len(text), 'speed': speed, 'engine': result.engine,
+                       'cached': result.cached, 'format': repr(profile), 'bytes': result.size, 'latency_ms': round((time.perf_counter() - started) * 1000)}
+            )
             
-            bot_logger.info(f"User {user_id} received audio (speed: {speed}x, length: {len(text)} chars)")
+        except QueueFullError as e:
+            outcome = 'rejected'
+            await update.message.reply_text(f"⏳ {e}")
+            
+        except TTSBusyError:
+            outcome = 'busy'
+            bot_logger.warning(
+                f"Synthesis pool full, rejected request from user {user_id}",
+                extra={'user_id': user_id, 'text_length': len(text)}
+            )
+            await update.message.reply_text(
+                "⏳ The bot is busy right now. Please try again in a moment."
+            )
+            
+        except TTSTimeoutError:
+            outcome = 'timeout'
+            errors_total.inc(stage='request')
+            bot_logger.error(
+                f"Audio generation timed out for user {user_id}",
+                extra={'user_id': user_id, 'text_length': len(text), 'speed': speed}
+            )
+            await update.message.reply_text(
+                "⌛ Audio generation took too long. Please try a shorter text."
+            )
             
         except Exception as e:
-            bot_logger.error(f"Audio generation failed for user {user_id}: {e}")
+            errors_total.inc(stage='request')
+            bot_logger.error(
+                f"Audio generation failed for user {user_id}: {e}",
+                extra={'user_id': user_id, 'text_length': len(text), 'speed': speed}
+            )
             await update.message.reply_text(
                 "❌ Failed to generate audio. Please try again with different text."
             )
             
             # Clean up any partial files
-            if 'audio_file_path' in locals() and os.path.exists(audio_file_path):
-                FileService.delete_file(audio_file_path)
\ No newline at end of file
+            if result is not None:
+                result.release()
+        
+        finally:
+            request_seconds.observe(time.perf_counter() - started, mode=mode, outcome=outcome)
+    
+    async def _generate_and_send_progressive(self, update: Update, chunks: list, speed: float, user_id: int,
+                                             profile):
+        """Synthesize sentence-aligned parts concurrently and send each one in order as soon as it is ready"""
+        total = len(chunks)
+        progress_msg = await update.message.reply_text(
+            f"🔄 Creating audio in {total} parts...\n"
+            f"📊 Text: {sum(len(chunk) for chunk in chunks)} characters\n"
+            f"⚡ Speed: {speed}x"
+        )
+        
+        # The scheduler interleaves these parts with other users' jobs; they start in text order
+        def synthesize(chunk):
+            return self._synthesize(user_id, chunk, speed, profile)
+        
+        # Parts Telegram already has are sent by file_id instead of synthesized
+        started = time.monotonic()
+        tasks = [
+            None if self._has_known_audio(chunk, speed, profile) else asyncio.create_task(synthesize(chunk))
+            for chunk in chunks
+        ]
+        last_edit = 0.0
+        
+        try:
+            for index, chunk in enumerate(chunks, start=1):
+                caption = f"Part {index}/{total} | Speed: {speed}x | Text: {len(chunk)} chars"
+                
+                task = tasks[index - 1]
+                if task is None and not await self._send_known_audio(update, chunk, speed, caption, profile):
+                    # Stored file_id was rejected, synthesize this part after all
+                    task = tasks[index - 1] = asyncio.create_task(synthesize(chunk))
+                
+                if task is not None:
+                    result = await task
+                    try:
+                        await self._send_result(update, result, f"{self.AUDIO_TITLE} ({index}/{total})", caption)
+                    finally:
+                        result.release()
+                
+                if index == 1:
+                    bot_logger.info(
+                        f"User {user_id} received first part after {time.monotonic() - started:.2f}s",
+                        extra={'user_id': user_id, 'parts': total,
+                               'first_part_ms': round((time.monotonic() - started) * 1000)}
+                    )
+                
+                # Report real progress without hitting Telegram's edit rate limits
+                now = time.monotonic()
+                if index < total and now - last_edit >= self.PROGRESS_EDIT_INTERVAL:
+                    synthesized = sum(1 for t in tasks if t is None or t.done())
+                    await progress_msg.edit_text(
+                        f"🔄 Creating audio...\n"
+                        f"🎧 Synthesized: {synthesized}/{total} parts\n"
+                        f"📤 Sent: {index}/{total} parts"
+                    )
+                    last_edit = now
+            
+            await progress_msg.delete()
+            bot_logger.info(
+                f"User {user_id} received {total} audio parts in {time.monotonic() - started:.2f}s "
+                f"(speed: {speed}x)",
+                extra={'user_id': user_id, 'text_length': sum(len(chunk) for chunk in chunks), 'speed': speed,
+                       'parts': total, 'latency_ms': round((time.monotonic() - started) * 1000)}
+            )
+        
+        finally:
+            await self._discard_tasks(tasks)
+    
+    async def _convert_long_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                     path: str, speed: float, user_id: int):
+        """Convert a long document chunk by chunk and send the audio in parts of at most the upload limit"""
+        from handlers.text_handler import TextHandler
+        
+        total = context.user_data.get('text_length', 0)
+        started = time.monotonic()
+        last_edit = 0.0
+        progress_msg = await update.message.reply_text(
+            f"📚 Converting document...\n"
+            f"📊 Text: {total} characters\n"
+            f"⚡ Speed: {speed}x"
+        )
+        
+        async def on_progress(done: int, total: int):
+            nonlocal last_edit
+            now = time.monotonic()
+            if done < total and now - last_edit >= self.PROGRESS_EDIT_INTERVAL:
+                last_edit = now
+                try:
+                    await progress_msg.edit_text(
+                        f"📚 Converting document... {done * 100 // max(total, 1)}%\n"
+                        f"📊 {done}/{total} characters"
+                    )
+                except BadRequest:
+                    pass  # unchanged text
+        
+        async def on_part(part_path: str, index: int):
+            with open(part_path, 'rb') as audio_file, upload_seconds.time(kind='document_part'):
+                await update.message.reply_audio(
+                    audio=audio_file,
+                    filename=f"document_part{index}.mp3",
+                    title=f"{self.AUDIO_TITLE} (part {index})",
+                    performer=self.AUDIO_PERFORMER,
+                    caption=f"Part {index} | Speed: {speed}x",
+                    write_timeout=self.UPLOAD_TIMEOUT
+                )
+        
+        converter = LongDocumentService(lambda chunk, speed: self._synthesize(user_id, chunk, speed))
+        outcome = 'error'
+        try:
+            parts = await converter.convert(path, speed, total, on_part, on_progress)
+            outcome = 'ok'
+            await progress_msg.delete()
+            bot_logger.info(
+                f"User {user_id} received a {total} char document in {parts} parts "
+                f"after {time.monotonic() - started:.1f}s (speed: {speed}x)",
+                extra={'user_id': user_id, 'text_length': total, 'speed': speed, 'parts': parts,
+                       'latency_ms': round((time.monotonic() - started) * 1000)}
+            )
+        
+        except (QueueFullError, LongDocumentError) as e:
+            outcome = 'rejected'
+            await update.message.reply_text(f"❌ {e}")
+        
+        except (TTSBusyError, TTSTimeoutError):
+            outcome = 'busy'
+            bot_logger.error(f"Long document conversion for user {user_id} stalled")
+            await update.message.reply_text(
+                "⏳ The bot is busy right now. Please send the document again later."
+            )
+        
+        except Exception as e:
+            errors_total.inc(stage='document')
+            bot_logger.error(
+                f"Long document conversion failed for user {user_id}: {e}",
+                extra={'user_id': user_id, 'text_length': total, 'speed': speed}
+            )
+            await update.message.reply_text("❌ Failed to convert the document. Please try again.")
+        
+        finally:
+            request_seconds.observe(time.monotonic() - started, mode='document', outcome=outcome)
+            TextHandler.discard_document(context)
+    
+    async def _convert_batch(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             batch: dict, speed: float, user_id: int):
+        """Convert a batch of files in parallel and send the audio in file order, as messages or zip archives"""
+        items = batch['items']
+        total = len(items)
+        if not total:
+            await update.message.reply_text("❌ No readable .txt files in this batch.")
+            return
+        
+        chars = sum(len(item['text']) for item in items)
+        as_archive = 0 < Config.BATCH_ARCHIVE_MIN_FILES <= total
+        started = time.monotonic()
+        last_edit = 0.0
+        progress_msg = await update.message.reply_text(
+            f"📦 Converting {total} files...\n"
+            f"📊 Text: {chars} characters\n"
+            f"⚡ Speed: {speed}x"
+        )
+        
+        async def on_progress(done: int, total: int):
+            nonlocal last_edit
+            now = time.monotonic()
+            if done < total and now - last_edit >= self.PROGRESS_EDIT_INTERVAL:
+                last_edit = now
+                try:
+                    await progress_msg.edit_text(
+                        f"📦 Converting files... {done}/{total}\n"
+                        f"⏱ {done / (now - started):.1f} files/s"
+                    )
+                except BadRequest:
+                    pass  # unchanged text
+        
+        async def send_audio(index: int, item: dict, result):
+            await self._send_result(
+                update, result, f"{os.path.splitext(item['name'])[0]} ({index}/{total})",
+                f"{index}/{total} | {item['name']} | Speed: {speed}x"
+            )
+        
+        async def send_archive(path: str, index: int):
+            with open(path, 'rb') as archive_file, upload_seconds.time(kind='batch_archive'):
+                await update.message.reply_document(
+                    document=archive_file,
+                    filename=f"audio_batch_{index}.zip",
+                    caption=f"Archive {index} | Speed: {speed}x",
+                    write_timeout=self.UPLOAD_TIMEOUT
+                )
+        
+        archive = BatchArchive(send_archive) if as_archive else None
+        
+        async def on_result(index: int, item: dict, result):
+            if archive is not None:
+                await archive.add(index, item['name'], result)
+            else:
+                await send_audio(index, item, result)
+        
+        # Stay within the scheduler's per-user queue limit, so the batch is never rejected outright
+        converter = BatchService(
+            lambda text, speed: self._synthesize(user_id, text, speed, self._output_profile(context, len(text))),
+            parallelism=min(Config.BATCH_PARALLELISM, self.scheduler.max_per_user)
+        )
+        outcome = 'error'
+        try:
+            failed = await converter.convert(items, speed, on_result, on_progress)
+            if archive is not None:
+                await archive.close()
+            elapsed = time.monotonic() - started
+            outcome = 'ok' if len(failed) < total else 'error'
+            await progress_msg.delete()
+            
+            summary = (
+                f"✅ Converted {total - len(failed)}/{total} files in {elapsed:.1f}s "
+                f"({chars / max(elapsed, 0.001):.0f} characters/s)"
+            )
+            not_converted = failed + batch['skipped']
+            if not_converted:
+                shown = ', '.join(not_converted[:10])
+                more = f" and {len(not_converted) - 10} more" if len(not_converted) > 10 else ""
+                summary += f"\n⚠️ Not converted: {shown}{more}"
+            await update.message.reply_text(summary)
+            
+            bot_logger.info(
+                f"User {user_id} received a batch of {total} files in {elapsed:.1f}s (speed: {speed}x)",
+                extra={'user_id': user_id, 'files': total, 'failed': len(failed), 'text_length': chars,
+                       'speed': speed, 'archive': as_archive, 'latency_ms': round(elapsed * 1000),
+                       'chars_per_second': round(chars / max(elapsed, 0.001))}
+            )
+        
+        except Exception as e:
+            errors_total.inc(stage='batch')
+            bot_logger.error(
+                f"Batch conversion failed for user {user_id}: {e}",
+                extra={'user_id': user_id, 'files': total, 'speed': speed}
+            )
+            await update.message.reply_text("❌ Failed to convert the batch. Please try again.")
+        
+        finally:
+            if archive is not None:
+                archive.discard()
+            request_seconds.observe(time.monotonic() - started, mode='batch', outcome=outcome)
+    
+    async def _synthesize(self, user_id: int, text: str, speed: float, profile=None):
+        """Run one synthesis job, and its encoding for profile if given, through the fair scheduler"""
+        return await self.scheduler.run(user_id, len(text), lambda: self._synthesize_now(text, speed, profile))
+    
+    async def _synthesize_now(self, text: str, speed: float, profile=None):
+        """Synthesize, and encode for profile if given, without waiting for a turn"""
+        result = await self.synthesizer.convert_text_to_speech_async(text, speed)
+        if profile is None:
+            return result
+        try:
+            return await self.encoder.encode_async(result, profile)
+        except BaseException:
+            result.release()
+            raise
+    
+    async def prerender_hot_phrases(self, limit: int = None) -> int:
+        """
+        Synthesize the most requested phrases that are not stored yet, one at a time, so their
+        next request is a cache hit; stops as soon as a user's job is running or waiting
+        Returns the number of phrases synthesized
+        """
+        limit = limit or Config.HOT_PHRASE_BATCH
+        cache = self.tts_service.cache
+        rendered = 0
+        for text, speed, count in self.hot_phrases.hot(Config.HOT_PHRASE_MIN_COUNT):
+            if rendered >= limit or self.scheduler.running or self.scheduler.queue_depth:
+                break
+            # Rendered for users on the default /format setting; others only need encoding
+            profile = self._output_profile(None, len(text))
+            keys = self.encoder.cache_keys(text, speed, profile)
+            if any(self.file_ids.get(key) for key in self._file_id_keys(text, speed, profile)):
+                continue
+            # The first lookup may load the disk cache index
+            if await asyncio.to_thread(lambda: any(cache.contains(key) for key in keys)):
+                continue
+            
+            try:
+                result = await self._synthesize_now(text, speed, profile)
+            except Exception as e:
+                # Engines are struggling; try again at the next idle check
+                prerenders_total.inc(outcome='error')
+                bot_logger.warning(f"Prerendering a hot phrase failed: {e}")
+                break
+            result.release()
+            prerenders_total.inc(outcome='ok')
+            rendered += 1
+            bot_logger.info(
+                f"Prerendered a hot phrase ({len(text)} chars, speed: {speed}x, {count} requests)",
+                extra={'text_length': len(text), 'speed': speed, 'requests': count, 'engine': result.engine}
+            )
+        return rendered
+    
+    @staticmethod
+    def _output_profile(context: ContextTypes.DEFAULT_TYPE, text_length: int):
+        """Format and bitrate for this text, from the user's /format choice"""
+        preferences = context.user_data if context is not None else {}
+        return choose_profile(text_length, preferences.get('audio_format'), preferences.get('audio_quality'))
+    
+    async def _send_result(self, update: Update, result, title: str, caption: str):
+        """Upload audio as an audio file or a voice note and remember its file_id"""
+        kind = 'voice' if result.is_voice else 'upload'
+        with result.open() as audio_file, upload_seconds.time(kind=kind):
+            if result.is_voice:
+                message = await update.message.reply_voice(
+                    voice=audio_file, filename=result.filename, caption=caption
+                )
+                sent = message.voice
+            else:
+                message = await update.message.reply_audio(
+                    audio=audio_file,
+                    filename=result.filename,
+                    title=title,
+                    performer=self.AUDIO_PERFORMER,
+                    caption=caption
+                )
+                sent = message.audio
+        upload_bytes_total.inc(result.size, format='opus' if result.is_voice else 'mp3')
+        
+        # Remember the upload so identical audio is never uploaded again
+        if sent:
+            self.file_ids.put(result.key, sent.file_id)
+    
+    @staticmethod
+    async def _discard_tasks(tasks: list):
+        """Cancel unfinished synthesis tasks and release audio nobody will send"""
+        tasks = [task for task in tasks if task is not None]
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            # Files of parts that were sent are already gone
+            if not isinstance(result, BaseException):
+                result.release()
+    
+    def _file_id_keys(self, text: str, speed: float, profile) -> list:
+        """Keys whose uploads may be sent again; fallback audio only while the primary engine is failing"""
+        keys = self.encoder.cache_keys(text, speed, profile)
+        return keys[:1] if self.tts_service.primary_circuit_closed() else keys
+    
+    def _has_known_audio(self, text: str, speed: float, profile) -> bool:
+        """Check whether a file_id is stored for this audio"""
+        return any(self.file_ids.get(key) for key in self._file_id_keys(text, speed, profile))
+    
+    async def _send_known_audio(self, update: Update, text: str, speed: float, caption: str, profile) -> bool:
+        """Send previously uploaded audio by file_id, return False if none is usable"""
+        for key in self._file_id_keys(text, speed, profile):
+            file_id = self.file_ids.get(key)
+            if not file_id:
+                continue
+            
+            try:
+                with upload_seconds.time(kind='file_id'):
+                    if profile.is_voice:
+                        await update.message.reply_voice(voice=file_id, caption=caption)
+                    else:
+                        await update.message.reply_audio(
+                            audio=file_id,
+                            title=self.AUDIO_TITLE,
+                            performer=self.AUDIO_PERFORMER,
+                            caption=caption
+                        )
+                return True
+            except BadRequest as e:
+                # Expired or foreign file_id, fall back to a real upload
+                bot_logger.warning(f"Stored file_id rejected by Telegram: {e}")
+                self.file_ids.discard(key)
+        
+        return False
\ No newline at end of file
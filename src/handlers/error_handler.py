@@ -1,9 +1,7 @@
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from telegram import Update
 from telegram.ext import ContextTypes
 from utils.logger import bot_logger
+from utils.metrics import errors_total
 
 class ErrorHandler:
     """Handles errors across the bot"""
@@ -15,7 +13,8 @@ class ErrorHandler:
             user_id = update.effective_user.id if update and update.effective_user else "Unknown"
             
             # Log the error
-            bot_logger.error(f"Error for user {user_id}: {context.error}")
+            bot_logger.error(f"Error for user {user_id}: {context.error}", extra={'user_id': user_id})
+            errors_total.inc(stage='handler')
             
             # Send user-friendly error message
             if update and update.effective_message:
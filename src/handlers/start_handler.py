@@ -1,8 +1,5 @@
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import ContextTypes, ConversationHandler
+from telegram.ext import ContextTypes, ConversationHandler, ApplicationHandlerStop
 from config import Config
 from utils.logger import bot_logger
 
@@ -91,22 +88,61 @@ class StartHandler:
             "• 2.0x💨 - Very fast\n"
             "• Custom🔧 - Any speed from 0.1x to 3.0x\n\n"
             "📏 *Limits:*\n"
-            "• Max 5,000 characters per conversion\n\n"
+            "• Max 5,000 characters per conversion\n"
+            "• Longer .txt files are converted in parts\n"
+            "• Send a .zip of .txt files, or several .txt files at once, to convert them together\n\n"
             "🛠 *Commands:*\n"
             "/start - Start the bot\n"
             "/help - Show this help\n"
+            "/format - Choose voice notes or MP3 files, and their quality\n"
             "/cancel - Cancel current operation"
         )
         
         await update.message.reply_text(help_text, parse_mode='Markdown')
     
+    # User settings that outlive a conversation
+    PREFERENCES = ('audio_format', 'audio_quality')
+    
+    @staticmethod
+    async def format_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show or change how audio is sent: /format [voice|mp3] [low|standard|high]"""
+        for argument in (argument.lower() for argument in context.args):
+            if argument in ('voice', 'mp3'):
+                context.user_data['audio_format'] = argument
+            elif argument in ('low', 'standard', 'high'):
+                context.user_data['audio_quality'] = argument
+            else:
+                await update.message.reply_text(
+                    "Usage: /format [voice|mp3] [low|standard|high]\n"
+                    "Example: /format voice low"
+                )
+                raise ApplicationHandlerStop
+        
+        output = context.user_data.get('audio_format', Config.AUDIO_OUTPUT_FORMAT)
+        quality = context.user_data.get('audio_quality', Config.AUDIO_QUALITY)
+        described = "🎙 voice notes (OGG/Opus)" if output == 'voice' else "🎵 MP3 audio files"
+        await update.message.reply_text(
+            f"Audio is sent as {described}, {quality} quality.\n"
+            "Change it with /format voice or /format mp3, optionally followed by low, standard or high. "
+            "Long texts use one quality level lower."
+        )
+        if context.args:
+            bot_logger.info(f"User {update.effective_user.id} chose {output} audio, {quality} quality")
+        
+        # Handled here in every conversation state, without moving the conversation on
+        raise ApplicationHandlerStop
+    
     @staticmethod
     async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Cancel conversation and return to start"""
         user = update.effective_user
         
-        # Clear user data
+        # Clear user data, including any uploaded long document, but keep the audio format choice
+        from handlers.text_handler import TextHandler
+        TextHandler.discard_document(context)
+        preferences = {key: context.user_data[key] for key in StartHandler.PREFERENCES if key in context.user_data}
         context.user_data.clear()
+        context.user_data.update(preferences)
         
         await update.message.reply_text(
             "Operation cancelled.\n\n"
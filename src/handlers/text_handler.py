@@ -1,11 +1,17 @@
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import os
+import time
+import uuid
+import asyncio
+from io import BytesIO
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import Config
 from utils.logger import bot_logger
+from utils.text_decoder import decode_limited, TextTooLongError
+from utils.metrics import text_extraction_seconds
+from services.file_service import FileService
+from services.long_document_service import download_to_path, count_characters, LongDocumentError
+from services.batch_service import read_zip_texts, BatchError
 
 class TextHandler:
     """Handles text input validation and processing"""
@@ -15,8 +21,23 @@ class TextHandler:
         """Process text input from user"""
         user = update.effective_user
         
+        # Zip archives and albums of files are converted as a batch
+        if Config.BATCH_ENABLED and TextHandler._is_batch(update.message):
+            return await TextHandler._accept_batch(update, context)
+        
         # Extract text from different message types
-        text = await TextHandler._extract_text(update, context)
+        source = 'document' if update.message.document else 'caption' if update.message.photo else 'text'
+        try:
+            with text_extraction_seconds.time(source=source):
+                text = await TextHandler._extract_text(update, context)
+        except TextTooLongError:
+            if update.message.document and Config.LONG_DOCUMENT_ENABLED:
+                return await TextHandler._accept_long_document(update, context)
+            await update.message.reply_text(
+                f"❌ Text too long (more than {Config.MAX_TEXT_LENGTH} characters). "
+                f"Please shorten your text."
+            )
+            return Config.AWAITING_TEXT
         
         if not text:
             await update.message.reply_text(
@@ -41,12 +62,20 @@ class TextHandler:
             return Config.AWAITING_TEXT
         
         # Store text in context for speed selection
+        TextHandler.discard_document(context)
+        context.user_data.pop('batch', None)
         context.user_data['text_to_process'] = text
         context.user_data['text_length'] = len(text)
         
-        bot_logger.info(f"User {user.id} submitted text ({len(text)} chars)")
+        bot_logger.info(f"User {user.id} submitted text ({len(text)} chars)",
+                        extra={'user_id': user.id, 'text_length': len(text)})
         
         # Show character count and request speed selection
+        return await TextHandler._ask_speed(update, f"✅ Received {len(text)} characters")
+    
+    @staticmethod
+    async def _ask_speed(update: Update, received: str) -> int:
+        """Confirm the input and show the speed keyboard"""
         keyboard = [
             ["0.5x🐢", "1.0x⚡", "1.5x🚀"],
             ["2.0x💨", "Custom🔧", "Back↩️"]
@@ -56,13 +85,165 @@ class TextHandler:
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         
         await update.message.reply_text(
-            f"✅ Received {len(text)} characters\n"
+            f"{received}\n"
             "Now choose playback speed:",
             reply_markup=reply_markup
         )
         
         return Config.AWAITING_SPEED
     
+    @staticmethod
+    async def _accept_long_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Save a .txt file over MAX_TEXT_LENGTH to disk for chunked conversion"""
+        user = update.effective_user
+        document = update.message.document
+        
+        if document.file_size and document.file_size > Config.LONG_DOCUMENT_MAX_BYTES:
+            await update.message.reply_text(
+                f"❌ File too large ({document.file_size // (1024 * 1024)} MB). "
+                f"The limit is {Config.LONG_DOCUMENT_MAX_BYTES // (1024 * 1024)} MB."
+            )
+            return Config.AWAITING_TEXT
+        
+        os.makedirs(Config.LONG_DOCUMENT_DIR, exist_ok=True)
+        path = os.path.join(Config.LONG_DOCUMENT_DIR, f"{uuid.uuid4().hex}.txt")
+        # Expires like temp audio, in case the conversation is abandoned before a speed is picked
+        FileService.track(path, time.time() + Config.LONG_DOCUMENT_TTL)
+        try:
+            file = await document.get_file()
+            await download_to_path(file, path, Config.LONG_DOCUMENT_MAX_BYTES)
+            length = await asyncio.to_thread(count_characters, path)
+        except LongDocumentError as e:
+            FileService.delete_file(path)
+            await update.message.reply_text(f"❌ {e}")
+            return Config.AWAITING_TEXT
+        except Exception as e:
+            FileService.delete_file(path)
+            bot_logger.error(f"Error saving long document: {e}")
+            await update.message.reply_text("❌ Error reading text file. Please try again.")
+            return Config.AWAITING_TEXT
+        
+        if length > Config.LONG_DOCUMENT_MAX_CHARS:
+            FileService.delete_file(path)
+            await update.message.reply_text(
+                f"❌ Document too long ({length}/{Config.LONG_DOCUMENT_MAX_CHARS} characters)."
+            )
+            return Config.AWAITING_TEXT
+        
+        TextHandler.discard_document(context)
+        context.user_data.pop('text_to_process', None)
+        context.user_data.pop('batch', None)
+        context.user_data['document_path'] = path
+        context.user_data['text_length'] = length
+        
+        bot_logger.info(f"User {user.id} uploaded long document ({length} chars)",
+                        extra={'user_id': user.id, 'text_length': length})
+        return await TextHandler._ask_speed(
+            update, f"📚 Received a long document ({length} characters). It will be sent in parts."
+        )
+    
+    @staticmethod
+    def _is_zip(document) -> bool:
+        return document.mime_type in ('application/zip', 'application/x-zip-compressed') or \
+            (document.file_name or '').lower().endswith('.zip')
+    
+    @staticmethod
+    def _is_batch(message) -> bool:
+        """A zip archive, or a file sent as part of an album"""
+        return bool(message.document) and (
+            TextHandler._is_zip(message.document) or message.media_group_id is not None
+        )
+    
+    @staticmethod
+    async def _accept_batch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Start a batch from a zip archive of .txt files, or from the first file of an album"""
+        user = update.effective_user
+        message = update.message
+        
+        TextHandler.discard_document(context)
+        context.user_data.pop('text_to_process', None)
+        
+        if not TextHandler._is_zip(message.document):
+            # Telegram delivers album files one by one; the rest join the batch in AWAITING_SPEED
+            context.user_data['batch'] = {'group': message.media_group_id, 'items': [], 'skipped': []}
+            await TextHandler._add_batch_file(update, context)
+            bot_logger.info(f"User {user.id} started an album batch", extra={'user_id': user.id})
+            return await TextHandler._ask_speed(update, "📦 Receiving your files...")
+        
+        document = message.document
+        if document.file_size and document.file_size > Config.BATCH_MAX_ZIP_BYTES:
+            await message.reply_text(
+                f"❌ Archive too large ({document.file_size // (1024 * 1024)} MB). "
+                f"The limit is {Config.BATCH_MAX_ZIP_BYTES // (1024 * 1024)} MB."
+            )
+            return Config.AWAITING_TEXT
+        
+        try:
+            file = await document.get_file()
+            buffer = BytesIO()
+            await file.download_to_memory(buffer)
+            with text_extraction_seconds.time(source='zip'):
+                items, skipped = await asyncio.to_thread(read_zip_texts, buffer.getbuffer())
+        except BatchError as e:
+            await message.reply_text(f"❌ {e}")
+            return Config.AWAITING_TEXT
+        except Exception as e:
+            bot_logger.error(f"Error reading zip archive: {e}")
+            await message.reply_text("❌ Error reading the archive. Please try again.")
+            return Config.AWAITING_TEXT
+        
+        if not items:
+            await message.reply_text("❌ No readable .txt files found in the archive.")
+            return Config.AWAITING_TEXT
+        
+        context.user_data['batch'] = {'group': None, 'items': items, 'skipped': skipped}
+        chars = sum(len(item['text']) for item in items)
+        bot_logger.info(f"User {user.id} uploaded a zip batch ({len(items)} files, {chars} chars)",
+                        extra={'user_id': user.id, 'files': len(items), 'text_length': chars})
+        
+        received = f"📦 Received {len(items)} files ({chars} characters)"
+        if skipped:
+            received += f", skipped {len(skipped)} that were empty or too long"
+        return await TextHandler._ask_speed(update, received)
+    
+    @staticmethod
+    async def handle_batch_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Add the next file of an album to the batch; any other file is taken as new input"""
+        batch = context.user_data.get('batch')
+        group = update.message.media_group_id
+        if batch is None or group is None or batch['group'] != group:
+            return await TextHandler.handle_text_input(update, context)
+        
+        await TextHandler._add_batch_file(update, context)
+        return Config.AWAITING_SPEED
+    
+    @staticmethod
+    async def _add_batch_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        batch = context.user_data['batch']
+        document = update.message.document
+        name = document.file_name or f"file{len(batch['items']) + len(batch['skipped']) + 1}.txt"
+        
+        if len(batch['items']) >= Config.BATCH_MAX_FILES:
+            batch['skipped'].append(name)
+            return
+        
+        try:
+            with text_extraction_seconds.time(source='document'):
+                text = await TextHandler._extract_text(update, context)
+        except TextTooLongError:
+            text = ""
+        if text and TextHandler._is_valid_text(text):
+            batch['items'].append({'name': name, 'text': text})
+        else:
+            batch['skipped'].append(name)
+    
+    @staticmethod
+    def discard_document(context: ContextTypes.DEFAULT_TYPE):
+        """Forget a pending long document and delete its file"""
+        path = context.user_data.pop('document_path', None)
+        if path:
+            FileService.delete_file(path)
+    
     @staticmethod
     async def _extract_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
         """Extract text from different message types"""
@@ -75,20 +256,25 @@ class TextHandler:
         elif update.message.document:
             # Text file
             document = update.message.document
-            if document.mime_type == 'text/plain' or document.file_name.endswith('.txt'):
+            if document.mime_type == 'text/plain' or (document.file_name or '').endswith('.txt'):
+                # Refuse files that cannot fit the limit without downloading them
+                if document.file_size and document.file_size > Config.MAX_UPLOAD_BYTES:
+                    bot_logger.info(
+                        f"User {update.effective_user.id} uploaded a {document.file_size} byte text file, refused"
+                    )
+                    raise TextTooLongError(Config.MAX_TEXT_LENGTH)
+                
                 try:
+                    # Downloaded into memory: nothing on disk, so concurrent uploads cannot collide
                     file = await document.get_file()
-                    file_path = f"temp_{document.file_id}.txt"
-                    await file.download_to_drive(file_path)
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
-                    
-                    # Clean up temp file
-                    os.remove(file_path)
+                    buffer = BytesIO()
+                    await file.download_to_memory(buffer)
+                    text = decode_limited(buffer.getbuffer(), Config.MAX_TEXT_LENGTH)
                     
                     bot_logger.info(f"User {update.effective_user.id} uploaded text file")
                     
+                except TextTooLongError:
+                    raise
                 except Exception as e:
                     bot_logger.error(f"Error reading text file: {e}")
                     await update.message.reply_text("❌ Error reading text file. Please try again.")
@@ -0,0 +1,88 @@
+import shutil
+import subprocess
+from config import Config
+from utils.logger import bot_logger
+
+class AudioCodecError(Exception):
+    """Raised when ffmpeg cannot decode or encode audio"""
+
+
+def mp3_frames(data: bytes) -> memoryview:
+    """MP3 data without ID3 tags, so segments can be appended into one stream"""
+    view = memoryview(data)
+    if data[:3] == b'ID3' and len(data) >= 10:
+        # ID3v2 size is a 28-bit syncsafe integer, not counting the 10-byte header
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        view = view[10 + size + footer:]
+    if len(view) >= 128 and bytes(view[-128:-125]) == b'TAG':
+        view = view[:-128]
+    return view
+
+
+def is_mp3(data: bytes) -> bool:
+    return data[:3] == b'ID3' or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0)
+
+
+class AudioCodec:
+    """Decodes and encodes audio through the ffmpeg command-line tool"""
+
+    SAMPLE_RATE = 24000  # gTTS produces 24 kHz mono MP3; also a rate Opus supports natively
+
+    # ffmpeg output options per format
+    ENCODERS = {
+        'mp3': ['-codec:a', 'libmp3lame', '-write_xing', '0', '-f', 'mp3'],
+        'opus': ['-codec:a', 'libopus', '-application', 'voip', '-f', 'ogg'],
+    }
+
+    _available = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check once whether ffmpeg can be found"""
+        if cls._available is None:
+            cls._available = shutil.which(Config.FFMPEG_PATH) is not None
+            if not cls._available:
+                bot_logger.warning("ffmpeg not found, audio post-processing is disabled")
+        return cls._available
+
+    @staticmethod
+    def _run(args: list, data: bytes) -> bytes:
+        command = [Config.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error'] + args
+        try:
+            result = subprocess.run(command, input=data, capture_output=True, timeout=Config.TTS_JOB_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AudioCodecError(f"ffmpeg failed: {e}")
+
+        if result.returncode != 0:
+            raise AudioCodecError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    @classmethod
+    def decode_to_pcm(cls, audio_data: bytes, sample_rate: int = None) -> bytes:
+        """Decode any audio ffmpeg understands to 16-bit mono PCM"""
+        sample_rate = sample_rate or cls.SAMPLE_RATE
+        return cls._run(
+            ['-i', 'pipe:0', '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+            audio_data
+        )
+
+    @classmethod
+    def transcode(cls, audio_data: bytes, fmt: str, bitrate: str, sample_rate: int = None) -> bytes:
+        """Re-encode any audio ffmpeg understands as mono MP3 or OGG/Opus in a single ffmpeg run"""
+        sample_rate = sample_rate or cls.SAMPLE_RATE
+        return cls._run(
+            ['-i', 'pipe:0', '-ac', '1', '-ar', str(sample_rate)] + cls.ENCODERS[fmt] + ['-b:a', bitrate, 'pipe:1'],
+            audio_data
+        )
+
+    @classmethod
+    def encode_mp3(cls, pcm_data: bytes, sample_rate: int = None, bitrate: str = None) -> bytes:
+        """Encode 16-bit mono PCM as MP3"""
+        sample_rate = sample_rate or cls.SAMPLE_RATE
+        bitrate = bitrate or Config.MP3_BITRATE
+        return cls._run(
+            ['-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-i', 'pipe:0',
+             '-codec:a', 'libmp3lame', '-b:a', bitrate, '-write_xing', '0', '-f', 'mp3', 'pipe:1'],
+            pcm_data
+        )
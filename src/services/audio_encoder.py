@@ -0,0 +1,115 @@
+import time
+import hashlib
+from config import Config
+from utils.logger import bot_logger
+from utils.metrics import encode_seconds
+from services.audio_codec import AudioCodec, AudioCodecError
+from services.tts_service import TTSService
+
+QUALITIES = ('low', 'standard', 'high')
+
+# Engines whose output is already MP3 and can be sent without encoding
+MP3_ENGINES = ('gtts',)
+
+
+class OutputProfile:
+    """Format and bitrate audio is sent in; a bitrate of None keeps MP3 audio as synthesized"""
+
+    EXTENSIONS = {'mp3': '.mp3', 'opus': '.ogg'}
+
+    def __init__(self, fmt: str, bitrate: str = None):
+        self.format = fmt
+        self.bitrate = bitrate
+
+    @property
+    def extension(self) -> str:
+        return self.EXTENSIONS[self.format]
+
+    @property
+    def is_voice(self) -> bool:
+        return self.format == 'opus'
+
+    def keeps(self, engine: str) -> bool:
+        """Whether this engine's audio is sent exactly as synthesized"""
+        return self.format == 'mp3' and self.bitrate is None and engine in MP3_ENGINES
+
+    def __repr__(self):
+        return f"{self.format}@{self.bitrate or 'source'}"
+
+
+def choose_profile(text_length: int, output: str = None, quality: str = None) -> OutputProfile:
+    """
+    Pick the format from the user's preference and the bitrate from their quality setting,
+    one level lower for long texts; without ffmpeg everything stays MP3 as synthesized
+    """
+    output = output or Config.AUDIO_OUTPUT_FORMAT
+    level = QUALITIES.index(quality if quality in QUALITIES else Config.AUDIO_QUALITY)
+    if text_length >= Config.AUDIO_LONG_TEXT_CHARS:
+        level = max(0, level - 1)
+
+    if not AudioCodec.is_available():
+        return OutputProfile('mp3')
+    if output == 'voice':
+        return OutputProfile('opus', Config.OPUS_BITRATES[level])
+    return OutputProfile('mp3', Config.MP3_LOW_BITRATE if level == 0 else None)
+
+
+class AudioEncoder:
+    """
+    Encodes synthesized audio for sending, as a job in the synthesis worker pool
+    Encoded audio is cached like synthesized audio, under a key that includes the profile
+    """
+
+    def __init__(self, tts_service: TTSService):
+        self.tts_service = tts_service
+
+    @staticmethod
+    def encoded_key(key: str, engine: str, profile: OutputProfile) -> str:
+        """Cache and file_id key of engine's audio for key, encoded with profile"""
+        if profile.keeps(engine):
+            return key
+        # pyttsx3 audio sent as MP3 is re-encoded too, at MP3_BITRATE
+        bitrate = profile.bitrate or Config.MP3_BITRATE
+        return hashlib.sha256(f"{key}\0{profile.format}\0{bitrate}".encode('utf-8')).hexdigest()
+
+    def cache_keys(self, text: str, speed: float, profile: OutputProfile) -> list:
+        """Keys of this request's encoded audio for every engine, in order of preference"""
+        return [
+            self.encoded_key(key, engine, profile)
+            for engine, key in zip(TTSService.ENGINES, self.tts_service.cache_keys(text, speed))
+        ]
+
+    async def encode_async(self, result, profile: OutputProfile):
+        """Encode result in the worker pool; audio that needs no encoding is returned as is"""
+        if profile.keeps(result.engine) or not AudioCodec.is_available():
+            return result
+
+        return await self.tts_service.run_in_pool(self.encode, result, profile)
+
+    def encode(self, result, profile: OutputProfile):
+        """Blocking encode; falls back to the audio as synthesized if ffmpeg fails"""
+        key = self.encoded_key(result.key, result.engine, profile)
+        bitrate = profile.bitrate or Config.MP3_BITRATE
+        cache = self.tts_service.cache
+
+        data = cache.get(key)
+        if data is None:
+            with result.open() as f:
+                source = f.read()
+            started = time.monotonic()
+            try:
+                data = AudioCodec.transcode(source, profile.format, bitrate)
+            except AudioCodecError as e:
+                bot_logger.warning(f"Encoding as {profile} failed, sending audio as synthesized: {e}")
+                return result
+            encode_seconds.observe(time.monotonic() - started, format=profile.format)
+            cache.put(key, data, self.tts_service.cache_ttl(result.engine))
+            bot_logger.info(
+                f"Encoded {len(source)} bytes of {result.engine} audio to {len(data)} bytes of {profile}",
+                extra={'engine': result.engine, 'format': profile.format, 'bitrate': bitrate,
+                       'source_bytes': len(source), 'encoded_bytes': len(data)}
+            )
+
+        encoded = TTSService._make_result(data, result.engine, key, cached=result.cached, extension=profile.extension)
+        result.release()
+        return encoded
@@ -0,0 +1,180 @@
+import os
+import re
+import uuid
+import shutil
+import asyncio
+import zipfile
+from io import BytesIO
+from collections import deque
+from config import Config
+from utils.logger import bot_logger
+from utils.text_decoder import decode_limited, TextTooLongError
+
+
+class BatchError(Exception):
+    """Raised when a batch cannot be read; the message is meant for the user"""
+
+
+def _natural_key(name: str):
+    """Sort 'part2.txt' before 'part10.txt'"""
+    return [int(piece) if piece.isdigit() else piece.lower() for piece in re.split(r'(\d+)', name)]
+
+
+def read_zip_texts(data, max_files=None, max_chars=None) -> tuple:
+    """
+    Text files of a zip archive in natural name order, as ([{'name', 'text'}], [skipped names])
+    Every file is decompressed at most up to the upload limit, so a zip bomb cannot exhaust memory
+    """
+    max_files = max_files or Config.BATCH_MAX_FILES
+    max_chars = max_chars or Config.MAX_TEXT_LENGTH
+
+    try:
+        archive = zipfile.ZipFile(BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BatchError("This zip archive could not be read.")
+
+    items, skipped = [], []
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+        ]
+        for info in sorted(members, key=lambda info: _natural_key(info.filename)):
+            name = os.path.basename(info.filename)
+            if not name.lower().endswith('.txt'):
+                continue
+            if len(items) >= max_files:
+                raise BatchError(f"Too many files, a batch can have at most {max_files}.")
+            if info.file_size > Config.MAX_UPLOAD_BYTES:
+                skipped.append(name)
+                continue
+            try:
+                with archive.open(info) as f:
+                    text = decode_limited(f.read(Config.MAX_UPLOAD_BYTES + 1), max_chars)
+            except (TextTooLongError, RuntimeError, zipfile.BadZipFile, NotImplementedError):
+                # Too long, encrypted, corrupt or an unsupported compression method
+                skipped.append(name)
+                continue
+            if text:
+                items.append({'name': name, 'text': text})
+            else:
+                skipped.append(name)
+
+    return items, skipped
+
+
+class BatchService:
+    """
+    Converts a batch of texts with a bounded number of jobs in flight
+    Results are handed out in batch order, so later files may finish first but wait their turn
+    """
+
+    def __init__(self, synthesize, parallelism=None):
+        # synthesize(text, speed) -> AudioResult, awaited for each file
+        self.synthesize = synthesize
+        self.parallelism = parallelism or Config.BATCH_PARALLELISM
+
+    async def convert(self, items: list, speed: float, on_result, on_progress=None) -> list:
+        """
+        Convert every item, awaiting on_result(index, item, result) in order and calling
+        on_progress(files_done, total) after every file; returns the names that failed
+        """
+        pending = deque(enumerate(items, start=1))
+        in_flight = deque()
+        failed = []
+        done = 0
+
+        def fill():
+            while pending and len(in_flight) < self.parallelism:
+                index, item = pending.popleft()
+                in_flight.append((index, item, asyncio.ensure_future(self.synthesize(item['text'], speed))))
+
+        try:
+            fill()
+            while in_flight:
+                index, item, task = in_flight.popleft()
+                try:
+                    result = await task
+                except Exception as e:
+                    # One bad file does not stop the rest of the batch
+                    bot_logger.warning(f"Batch file {item['name']} failed: {e}")
+                    failed.append(item['name'])
+                    result = None
+                fill()
+                if result is not None:
+                    try:
+                        await on_result(index, item, result)
+                    finally:
+                        result.release()
+
+                done += 1
+                if on_progress is not None:
+                    await on_progress(done, len(items))
+            return failed
+
+        finally:
+            for _, _, task in in_flight:
+                task.cancel()
+            for result in await asyncio.gather(*(task for _, _, task in in_flight), return_exceptions=True):
+                if not isinstance(result, BaseException):
+                    result.release()
+
+
+class BatchArchive:
+    """
+    Zip archives of batch audio, started anew whenever the next file would pass the upload limit
+    Audio is stored uncompressed, as MP3 does not compress any further
+    """
+
+    # Local header, central directory entry and end record, rounded up generously
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self, on_part, part_bytes=None, work_dir=None):
+        # on_part(path, index) is awaited for every finished archive
+        self.on_part = on_part
+        self.part_bytes = part_bytes or Config.TELEGRAM_UPLOAD_LIMIT
+        self.work_dir = work_dir or Config.TEMP_AUDIO_DIR
+        self.parts = 0
+        self._path = None
+        self._zip = None
+
+    async def add(self, index: int, name: str, result):
+        """Store one file's audio as e.g. 03_chapter3.mp3"""
+        stem = os.path.splitext(name)[0][:60] or 'audio'
+        entry = f"{index:02d}_{stem}{os.path.splitext(result.filename)[1] or '.mp3'}"
+
+        if self._zip is not None and os.path.getsize(self._path) + result.size + self.ENTRY_OVERHEAD > self.part_bytes:
+            await self._finish_part()
+        if self._zip is None:
+            os.makedirs(self.work_dir, exist_ok=True)
+            self.parts += 1
+            self._path = os.path.join(self.work_dir, f"batch_{uuid.uuid4().hex[:8]}_{self.parts}.zip")
+            self._zip = zipfile.ZipFile(self._path, 'w', zipfile.ZIP_STORED)
+        await asyncio.to_thread(self._write, entry, result)
+
+    async def close(self) -> int:
+        """Hand out the last archive; returns the number of archives"""
+        if self._zip is not None:
+            await self._finish_part()
+        return self.parts
+
+    def discard(self):
+        """Delete an unfinished archive"""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+            os.remove(self._path)
+
+    def _write(self, entry: str, result):
+        with result.open() as source, self._zip.open(entry, 'w') as target:
+            shutil.copyfileobj(source, target, 64 * 1024)
+        self._zip.fp.flush()
+
+    async def _finish_part(self):
+        self._zip.close()
+        self._zip = None
+        try:
+            await self.on_part(self._path, self.parts)
+        finally:
+            os.remove(self._path)
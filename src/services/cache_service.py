@@ -0,0 +1,227 @@
+import os
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from config import Config
+from utils.logger import bot_logger
+from utils.metrics import disk_write_seconds
+
+class AudioCache:
+    """Content-addressed audio cache with an in-memory LRU tier and an on-disk tier"""
+
+    FILE_SUFFIX = '.audio'
+
+    def __init__(self, cache_dir=None, memory_limit=None, disk_limit=None, ttl=None):
+        self.cache_dir = cache_dir or Config.AUDIO_CACHE_DIR
+        self.memory_limit = Config.AUDIO_CACHE_MEMORY_BYTES if memory_limit is None else memory_limit
+        self.disk_limit = Config.AUDIO_CACHE_DISK_BYTES if disk_limit is None else disk_limit
+        self.ttl = Config.AUDIO_CACHE_TTL if ttl is None else ttl
+
+        # key -> (data, stored_at), ordered from least to most recently used
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # key -> (size, stored_at), same ordering; loaded on first use
+        self._disk = None
+        self._disk_bytes = 0
+        self._lock = threading.RLock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize text so trivially different inputs share a cache entry"""
+        text = unicodedata.normalize('NFC', text)
+        return ' '.join(text.split())
+
+    @classmethod
+    def make_key(cls, text: str, speed: float, engine: str, lang: str = 'en') -> str:
+        """Build the cache key for a synthesis request"""
+        raw = f"{engine}\0{lang}\0{round(float(speed), 2)}\0{cls.normalize_text(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Return cached audio bytes for key, or None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                data, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return data
+                self._drop_memory(key)
+
+            disk_entry = self._disk_entry(key, now)
+            if disk_entry is None:
+                self.misses += 1
+                return None
+
+        # The file is read without the lock, so other synthesis threads are not held up by disk I/O
+        data = self._read_disk(key)
+
+        with self._lock:
+            current = self._disk.get(key) == disk_entry
+            if data is None:
+                if current:
+                    self._forget_disk(key)
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            if current:
+                self._disk.move_to_end(key)
+                self._put_memory(key, data, disk_entry[1])
+            return data
+
+    def contains(self, key: str) -> bool:
+        """Whether audio for key is cached, without reading it or counting a hit"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key) or self._disk_index().get(key)
+            return entry is not None and now - entry[1] <= self.ttl
+
+    def put(self, key: str, data: bytes, ttl: float = None):
+        """Store audio bytes in both tiers, for ttl seconds if that is shorter than the cache's TTL"""
+        if not data:
+            return
+
+        now = time.time()
+        # Entries are stamped as if stored earlier, so the usual expiry check drops them after ttl
+        stored_at = now - max(0, self.ttl - ttl) if ttl is not None else now
+        with self._lock:
+            self._put_memory(key, data, stored_at)
+            self._disk_index()
+        if len(data) > self.disk_limit:
+            return
+
+        # Written without the lock; only the index update below needs it
+        if not self._write_disk(key, data, stored_at):
+            return
+        with self._lock:
+            if key in self._disk:
+                self._forget_disk(key)
+            self._disk[key] = (len(data), stored_at)
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def clear(self, disk: bool = True):
+        """Drop every cached entry from memory and, unless disk is False, from disk"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if disk:
+                for key in list(self._disk_index()):
+                    self._drop_disk(key)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk) if self._disk is not None else 0,
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def _put_memory(self, key, data, stored_at):
+        if len(data) > self.memory_limit:
+            return
+        if key in self._memory:
+            self._drop_memory(key)
+
+        self._memory[key] = (data, stored_at)
+        self._memory_bytes += len(data)
+
+        while self._memory_bytes > self.memory_limit:
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+
+    def _drop_memory(self, key):
+        data, _ = self._memory.pop(key)
+        self._memory_bytes -= len(data)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.FILE_SUFFIX)
+
+    def _disk_index(self):
+        """Load the disk tier index on first use"""
+        if self._disk is None:
+            self._disk = OrderedDict()
+            self._disk_bytes = 0
+            entries = []
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with os.scandir(self.cache_dir) as it:
+                    for entry in it:
+                        if entry.is_file() and entry.name.endswith(self.FILE_SUFFIX):
+                            stat = entry.stat()
+                            key = entry.name[:-len(self.FILE_SUFFIX)]
+                            entries.append((stat.st_mtime, key, stat.st_size))
+            except OSError as e:
+                bot_logger.error(f"Error loading audio cache index: {e}")
+
+            for mtime, key, size in sorted(entries):
+                self._disk[key] = (size, mtime)
+                self._disk_bytes += size
+            self._evict_disk()
+        return self._disk
+
+    def _disk_entry(self, key, now):
+        """The unexpired (size, stored_at) index entry for key, or None; the caller holds the lock"""
+        entry = self._disk_index().get(key)
+        if entry is None:
+            return None
+        if now - entry[1] > self.ttl:
+            self._drop_disk(key)
+            return None
+        return entry
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data, stored_at) -> bool:
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with disk_write_seconds.time(target='cache'):
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                # The index is rebuilt from mtimes on the next start
+                os.utime(tmp_path, (stored_at, stored_at))
+                os.replace(tmp_path, path)
+        except OSError as e:
+            bot_logger.error(f"Error writing audio cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_limit and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _forget_disk(self, key):
+        size, _ = self._disk.pop(key)
+        self._disk_bytes -= size
+
+    def _drop_disk(self, key):
+        self._forget_disk(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
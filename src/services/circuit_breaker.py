@@ -0,0 +1,110 @@
+import time
+import threading
+from collections import deque
+from config import Config
+from utils.logger import bot_logger
+
+class CircuitBreaker:
+    """
+    Per-engine circuit breaker over a rolling window of recent calls
+    Opens when the error rate is too high, lets a single probe through after a cool-down
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window=None, failure_rate=None, min_calls=None, open_seconds=None):
+        self.name = name
+        self.window = window or Config.BREAKER_WINDOW
+        self.failure_rate = failure_rate or Config.BREAKER_FAILURE_RATE
+        self.min_calls = min_calls or Config.BREAKER_MIN_CALLS
+        self.open_seconds = open_seconds or Config.BREAKER_OPEN_SECONDS
+
+        # (succeeded, latency) of recent calls
+        self._calls = deque(maxlen=self.window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to this engine now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+                bot_logger.info(f"Circuit for {self.name} half-open, probing")
+
+            # Half-open: exactly one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._calls.append((True, latency))
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._calls.clear()
+                self._calls.append((True, latency))
+                bot_logger.info(f"Circuit for {self.name} closed")
+
+    def record_failure(self, latency: float):
+        with self._lock:
+            self._calls.append((False, latency))
+            if self._state == self.HALF_OPEN:
+                self._trip()
+            elif self._state == self.CLOSED and len(self._calls) >= self.min_calls:
+                if self._error_rate() >= self.failure_rate:
+                    self._trip()
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate()
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1):
+        """Latency percentile of recent successful calls, None without enough samples"""
+        with self._lock:
+            latencies = sorted(latency for ok, latency in self._calls if ok)
+        if len(latencies) < max(1, min_samples):
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def stats(self) -> dict:
+        with self._lock:
+            state, error_rate, calls = self._state, self._error_rate(), len(self._calls)
+        return {
+            'state': state,
+            'error_rate': error_rate,
+            'calls': calls,
+            'latency_p50': self.latency_percentile(50),
+            'latency_p95': self.latency_percentile(95),
+        }
+
+    def _error_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for ok, _ in self._calls if not ok) / len(self._calls)
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        bot_logger.warning(
+            f"Circuit for {self.name} opened (error rate {self._error_rate():.0%}), "
+            f"skipping it for {self.open_seconds}s"
+        )
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import socket
+import asyncio
+from config import Config
+from utils.logger import bot_logger
+
+
+class ControlError(Exception):
+    """Raised when the control socket cannot be reached or a command fails"""
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a short sleep; high lag means blocking code"""
+
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        self.interval = interval
+        self.window = window
+        self.lag = 0.0
+        self._recent = []
+        self._task = None
+
+    @property
+    def max_lag(self) -> float:
+        return max(self._recent, default=0.0)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - started - self.interval)
+            self._recent.append(self.lag)
+            if len(self._recent) > self.window:
+                del self._recent[0]
+
+
+class ControlServer:
+    """
+    Local control socket for the admin panel
+    Each request is one JSON line, e.g. {"command": "stats"}; each reply is one JSON line
+    with "ok" and either "result" or "error". Commands are plain callables, sync or async.
+    """
+
+    READ_TIMEOUT = 10.0
+
+    def __init__(self, commands: dict, path=None):
+        self.commands = commands
+        self.path = path or Config.CONTROL_SOCKET_PATH
+        self._server = None
+
+    async def start(self) -> bool:
+        """Listen on the socket; returns False where Unix sockets are unavailable"""
+        if not hasattr(socket, 'AF_UNIX'):
+            bot_logger.warning("Control socket unavailable on this platform")
+            return False
+
+        self._remove_stale_socket()
+        try:
+            self._server = await asyncio.start_unix_server(self._handle_connection, self.path)
+        except (NotImplementedError, OSError) as e:
+            bot_logger.warning(f"Control socket unavailable: {e}")
+            return False
+        # Only the bot's own user may send commands
+        os.chmod(self.path, 0o600)
+        bot_logger.info(f"Control socket listening at {self.path}")
+        return True
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _remove_stale_socket(self):
+        """Remove a socket left by a crashed run, but never steal one a live bot is using"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            send_command('ping', path=self.path, timeout=1.0)
+        except ControlError:
+            os.remove(self.path)
+        else:
+            raise OSError(f"another bot is already listening on {self.path}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)
+                if not line:
+                    break
+                reply = await self._dispatch(line)
+                writer.write(json.dumps(reply, default=str).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            name = request.pop('command')
+        except (ValueError, KeyError, AttributeError):
+            return {'ok': False, 'error': 'expected a JSON object with a "command"'}
+
+        command = self.commands.get(name)
+        if command is None:
+            return {'ok': False, 'error': f"unknown command {name!r}, expected one of: {', '.join(self.commands)}"}
+
+        try:
+            result = command(**request)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except Exception as e:
+            bot_logger.error(f"Control command {name} failed: {e}")
+            return {'ok': False, 'error': str(e)}
+        if name != 'stats':
+            bot_logger.info(f"Control command {name} done", extra={'command': name})
+        return {'ok': True, 'result': result}
+
+
+def send_command(command: str, path=None, timeout: float = 5.0, **arguments):
+    """Send one command to a running bot and return its result"""
+    path = path or Config.CONTROL_SOCKET_PATH
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ControlError("control socket unavailable on this platform")
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps({'command': command, **arguments}).encode('utf-8') + b'\n')
+            data = b''
+            deadline = time.monotonic() + timeout
+            while not data.endswith(b'\n'):
+                if time.monotonic() > deadline:
+                    raise ControlError("timed out waiting for the bot")
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+    except OSError as e:
+        raise ControlError(f"bot is not reachable: {e}")
+
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        raise ControlError("malformed reply from the bot")
+    if not reply.get('ok'):
+        raise ControlError(reply.get('error', 'command failed'))
+    return reply.get('result')
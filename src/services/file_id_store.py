@@ -0,0 +1,162 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from config import Config
+from utils.logger import bot_logger
+
+class FileIdStore:
+    """
+    Maps synthesis keys to Telegram file_ids, persisted in an append-only log
+    The log is replayed off the event loop by load(); until then only file_ids stored in this
+    run are known. Changes are staged in memory and appended in one debounced write.
+    """
+
+    def __init__(self, path=None, max_entries=None, write_delay=None):
+        self.path = path or Config.FILE_ID_STORE_PATH
+        self.max_entries = max_entries or Config.FILE_ID_STORE_MAX_ENTRIES
+        self.write_delay = Config.PERSISTENCE_WRITE_DELAY if write_delay is None else write_delay
+
+        self._entries = OrderedDict()
+        self._loaded = False
+        self._touched = set()  # keys changed before load() finished; they override the log
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        # Staged log lines, appended by the next flush
+        self._pending = []
+        self._flush_handle = None
+        self._flush_task = None
+
+    def get(self, key: str):
+        """Return the stored file_id for key, or None"""
+        with self._lock:
+            file_id = self._entries.get(key)
+            if file_id is not None:
+                self._entries.move_to_end(key)
+            return file_id
+
+    def put(self, key: str, file_id: str):
+        """Remember the file_id Telegram assigned to the audio for key"""
+        with self._lock:
+            if self._entries.get(key) == file_id:
+                return
+
+            self._entries[key] = file_id
+            self._entries.move_to_end(key)
+            self._stage(key, file_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        """Forget a file_id that Telegram no longer accepts"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stage(key, '')
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    async def load(self):
+        """Replay the log in a thread; called once at startup"""
+        await asyncio.to_thread(self._load)
+
+    async def flush(self):
+        """Append everything still staged"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_pending()
+
+    def _stage(self, key, file_id):
+        if not self._loaded:
+            self._touched.add(key)
+        self._pending.append(f"{key}\t{file_id}\n")
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Debounce: everything staged within write_delay is appended in one write"""
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.write_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._write_pending())
+        else:
+            self._schedule_flush()  # a write is still running, try again later
+
+    async def _write_pending(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if lines:
+            await asyncio.to_thread(self._write_lines, lines)
+
+    def _load(self):
+        """Replay the log; an empty file_id marks a removed key"""
+        entries = OrderedDict()
+        with self._write_lock:
+            log_lines = 0
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        key, sep, file_id = line.rstrip('\n').partition('\t')
+                        if not sep:
+                            continue
+                        log_lines += 1
+                        entries.pop(key, None)
+                        if file_id:
+                            entries[key] = file_id
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                bot_logger.error(f"Error loading file_id store: {e}")
+
+            with self._lock:
+                # What this run stored or discarded is newer than the log
+                for key in self._touched:
+                    entries.pop(key, None)
+                    if key in self._entries:
+                        entries[key] = self._entries[key]
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+                self._entries = entries
+                self._touched.clear()
+                self._loaded = True
+                self._log_lines = log_lines
+            self._maybe_compact()
+
+    def _write_lines(self, lines):
+        with self._write_lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+                self._log_lines += len(lines)
+            except OSError as e:
+                bot_logger.error(f"Error writing file_id store: {e}")
+                return
+            if self._loaded:
+                self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Rewrite the log once most of its lines are stale; the caller holds _write_lock"""
+        with self._lock:
+            if self._log_lines <= 2 * len(self._entries) + 1000:
+                return
+            entries = list(self._entries.items())
+
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, file_id in entries:
+                    f.write(f"{key}\t{file_id}\n")
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(entries)
+        except OSError as e:
+            bot_logger.error(f"Error compacting file_id store: {e}")
@@ -1,57 +1,185 @@
-import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import time
 import uuid
-from datetime import datetime, timedelta
+import heapq
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from config import Config
 from utils.logger import bot_logger
+from utils.metrics import disk_write_seconds
 
 class FileService:
+    """
+    Temp audio files and their lifecycle
+    Every temp file is indexed with an expiry time; files are deleted when they expire,
+    unless they are open for sending, in which case they go once the last reader is done
+    """
+
+    # path -> [expires_at, open readers, delete once closed]
+    _files = {}
+    # (expires_at, path), entries made stale by later changes are skipped when popped
+    _expiry_heap = []
+    _lock = threading.Lock()
+
+    SCAN_BATCH_SIZE = 500
+
     @staticmethod
     def generate_filename():
         unique_id = str(uuid.uuid4())[:8]
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"audio_{timestamp}_{unique_id}.mp3"
-    
+
     @staticmethod
     def get_file_path(filename):
         return os.path.join(Config.TEMP_AUDIO_DIR, filename)
-    
-    @staticmethod
-    def cleanup_old_files(hours_old=1):
+
+    # Index
+
+    @classmethod
+    def track(cls, file_path, expires_at=None):
+        """Index a temp file so it is deleted once it expires"""
+        expires_at = expires_at if expires_at is not None else time.time() + Config.TEMP_FILE_TTL
+        with cls._lock:
+            entry = cls._files.get(file_path)
+            if entry is None:
+                cls._files[file_path] = [expires_at, 0, False]
+                heapq.heappush(cls._expiry_heap, (expires_at, file_path))
+
+    @classmethod
+    @contextmanager
+    def open_file(cls, file_path):
+        """Open a temp file for reading; it is not deleted while open"""
+        with cls._lock:
+            entry = cls._files.get(file_path)
+            if entry is None:
+                expires_at = time.time() + Config.TEMP_FILE_TTL
+                entry = cls._files[file_path] = [expires_at, 0, False]
+                heapq.heappush(cls._expiry_heap, (expires_at, file_path))
+            entry[1] += 1
+
         try:
-            current_time = datetime.now()
-            deleted_count = 0
-            
-            for filename in os.listdir(Config.TEMP_AUDIO_DIR):
-                file_path = os.path.join(Config.TEMP_AUDIO_DIR, filename)
-                if os.path.isfile(file_path):
-                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    if current_time - file_time > timedelta(hours=hours_old):
-                        os.remove(file_path)
-                        deleted_count += 1
-            
-            if deleted_count > 0:
-                bot_logger.info(f"Cleaned up {deleted_count} old audio files")
-                
-        except Exception as e:
-            bot_logger.error(f"Error cleaning up files: {e}")
-    
-    @staticmethod
-    def save_audio_file(audio_data, filename):
+            with open(file_path, 'rb') as f:
+                yield f
+        finally:
+            with cls._lock:
+                entry[1] -= 1
+                delete = entry[1] == 0 and entry[2]
+                if delete:
+                    cls._files.pop(file_path, None)
+            if delete:
+                cls._remove(file_path)
+
+    @classmethod
+    def expire(cls, now=None) -> int:
+        """Delete expired files that nobody is reading, returns how many were deleted"""
+        now = time.time() if now is None else now
+        expired = []
+        with cls._lock:
+            while cls._expiry_heap and cls._expiry_heap[0][0] <= now:
+                expires_at, file_path = heapq.heappop(cls._expiry_heap)
+                entry = cls._files.get(file_path)
+                if entry is None or entry[0] != expires_at:
+                    continue  # already deleted or re-tracked
+                if entry[1]:
+                    entry[2] = True  # in use: delete when the last reader closes it
+                    continue
+                del cls._files[file_path]
+                expired.append(file_path)
+
+        deleted = sum(1 for file_path in expired if cls._remove(file_path))
+        if deleted:
+            bot_logger.info(f"Cleaned up {deleted} expired audio files")
+        return deleted
+
+    @classmethod
+    async def expire_job(cls, context=None):
+        """JobQueue callback: expire temp files off the event loop"""
+        await asyncio.to_thread(cls.expire)
+
+    @classmethod
+    async def scan_existing(cls, batch_size=None):
+        """Index files left over from earlier runs, a batch at a time without blocking the event loop"""
+        batch_size = batch_size or cls.SCAN_BATCH_SIZE
+
+        def scan():
+            # (path, expires_at); uploaded long documents wait longer than temp audio
+            found = []
+            for directory, ttl in ((Config.TEMP_AUDIO_DIR, Config.TEMP_FILE_TTL),
+                                   (Config.LONG_DOCUMENT_DIR, Config.LONG_DOCUMENT_TTL)):
+                if not os.path.isdir(directory):
+                    continue
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            found.append((entry.path, entry.stat().st_mtime + ttl))
+            return found
+
+        try:
+            found = await asyncio.to_thread(scan)
+        except OSError as e:
+            bot_logger.error(f"Error scanning temp files: {e}")
+            return
+
+        for start in range(0, len(found), batch_size):
+            for file_path, expires_at in found[start:start + batch_size]:
+                cls.track(file_path, expires_at)
+            await asyncio.sleep(0)
+
+        if found:
+            bot_logger.info(f"Indexed {len(found)} temp files from a previous run")
+        await cls.expire_job()
+
+    @classmethod
+    def cleanup_old_files(cls, hours_old=1):
+        """
+        Delete indexed temp audio older than hours_old that is not being sent; 0 deletes all unused files
+        Uploaded documents are left to expire, as a restored conversation may still convert them
+        """
+        cutoff = time.time() - hours_old * 3600 + Config.TEMP_FILE_TTL
+        temp_dir = os.path.join(os.path.abspath(Config.TEMP_AUDIO_DIR), '')
+        with cls._lock:
+            candidates = [
+                path for path, entry in cls._files.items()
+                if entry[0] <= cutoff and os.path.abspath(path).startswith(temp_dir)
+            ]
+            for file_path in candidates:
+                cls._files[file_path][0] = 0
+                heapq.heappush(cls._expiry_heap, (0, file_path))
+        return cls.expire()
+
+    # Files
+
+    @classmethod
+    def save_audio_file(cls, audio_data, filename):
         try:
-            file_path = FileService.get_file_path(filename)
-            with open(file_path, 'wb') as f:
+            file_path = cls.get_file_path(filename)
+            with disk_write_seconds.time(target='temp'), open(file_path, 'wb') as f:
                 f.write(audio_data)
+            cls.track(file_path)
             return file_path
         except Exception as e:
             bot_logger.error(f"Error saving audio file: {e}")
             raise
-    
+
+    @classmethod
+    def delete_file(cls, file_path):
+        """Delete a file now, or as soon as nobody is reading it"""
+        with cls._lock:
+            entry = cls._files.get(file_path)
+            if entry is not None and entry[1]:
+                entry[2] = True
+                return
+            cls._files.pop(file_path, None)
+        cls._remove(file_path)
+
     @staticmethod
-    def delete_file(file_path):
+    def _remove(file_path) -> bool:
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
+                return True
         except Exception as e:
-            bot_logger.error(f"Error deleting file {file_path}: {e}")
\ No newline at end of file
+            bot_logger.error(f"Error deleting file {file_path}: {e}")
+        return False
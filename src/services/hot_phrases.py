@@ -0,0 +1,80 @@
+from config import Config
+from services.cache_service import AudioCache
+from utils.frequency_sketch import CountMinSketch
+
+
+class HotPhraseTracker:
+    """
+    Tracks which short texts are requested most, and at which speeds, in bounded memory
+    Counts of texts and (text, speed) pairs live in a count-min sketch; only the top_k
+    pairs are kept with their text, as the candidates for synthesizing ahead of time.
+    Counts are halved every sample_size requests, so phrases that stop coming in cool down.
+    """
+
+    def __init__(self, top_k=None, width=None, sample_size=None):
+        self.top_k = top_k or Config.HOT_PHRASE_TOP_K
+        self.sketch = CountMinSketch(width or Config.HOT_PHRASE_SKETCH_WIDTH)
+        self.sample_size = sample_size or self.sketch.width * 8
+        self._top = {}  # (normalized text, speed) -> estimated requests
+        # No candidate has fewer requests than this, so most offers are turned down without a scan
+        self._floor = 0
+        self._since_aging = 0
+        self.recorded = 0
+
+    def record(self, text: str, speed: float):
+        """Count one request; texts longer than HOT_PHRASE_MAX_CHARS are not tracked"""
+        if len(text) > Config.HOT_PHRASE_MAX_CHARS:
+            return
+        text = AudioCache.normalize_text(text)
+        if not text:
+            return
+
+        speed = round(float(speed), 2)
+        default_speed = round(float(Config.DEFAULT_SPEED), 2)
+        text_count = self.sketch.add(text)
+        pair_count = self.sketch.add(f"{speed}\0{text}")
+        # New requesters of a popular text mostly start at the default speed, whatever speed
+        # earlier ones settled on, so that pair ranks by the text's own count
+        self._offer((text, default_speed), text_count)
+        if speed != default_speed:
+            self._offer((text, speed), pair_count)
+
+        self.recorded += 1
+        self._since_aging += 1
+        if self._since_aging >= self.sample_size:
+            self._age()
+
+    def hot(self, min_count: int = 1, limit: int = None) -> list:
+        """The most requested (text, speed, count) entries with at least min_count requests"""
+        entries = sorted(
+            ((text, speed, count) for (text, speed), count in self._top.items() if count >= min_count),
+            key=lambda entry: -entry[2]
+        )
+        return entries[:limit]
+
+    def stats(self) -> dict:
+        return {
+            'recorded': self.recorded,
+            'candidates': len(self._top),
+            'hot': len(self.hot(Config.HOT_PHRASE_MIN_COUNT)),
+            'sketch_bytes': self.sketch.memory_bytes,
+        }
+
+    def _offer(self, key, count: int):
+        """Keep key among the top_k candidates if it is requested more than the coldest one"""
+        if key in self._top or len(self._top) < self.top_k:
+            self._top[key] = count
+            return
+        if count <= self._floor:
+            return
+        coldest = min(self._top, key=self._top.get)
+        self._floor = self._top[coldest]
+        if count > self._floor:
+            del self._top[coldest]
+            self._top[key] = count
+
+    def _age(self):
+        self.sketch.halve()
+        self._top = {key: count >> 1 for key, count in self._top.items() if count > 1}
+        self._floor = 0
+        self._since_aging = 0
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import socket
+import struct
+import asyncio
+import itertools
+from config import Config
+from utils.logger import bot_logger
+from services.tts_service import TTSService, TTSError, TTSBusyError, TTSTimeoutError
+
+# Every message is a JSON header plus an optional binary payload (the audio)
+FRAME = struct.Struct('>II')  # header length, payload length
+
+# Worker error kinds and the exceptions the front process raises for them
+ERRORS = {'busy': TTSBusyError, 'timeout': TTSTimeoutError, 'failed': TTSError}
+
+
+async def read_frame(reader):
+    header_length, payload_length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(payload_length) if payload_length else b''
+    return header, payload
+
+
+def write_frame(writer, header: dict, payload: bytes = b''):
+    """Queue one message on writer; the caller drains it"""
+    data = json.dumps(header).encode('utf-8')
+    writer.write(FRAME.pack(len(data), len(payload)) + data)
+    if payload:
+        writer.write(payload)
+
+
+def remove_stale_socket(path: str):
+    """Remove a Unix socket nobody listens on any more, refuse to replace a live one"""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+    raise OSError(f"another process is already listening on {path}")
+
+
+class _Job:
+    __slots__ = ('id', 'text', 'speed', 'future', 'attempts')
+
+    def __init__(self, job_id, text, speed, future):
+        self.id = job_id
+        self.text = text
+        self.speed = speed
+        self.future = future
+        self.attempts = 0
+
+
+class _WorkerConnection:
+    __slots__ = ('worker_id', 'pid', 'slots', 'in_flight', 'completed', 'connected_at')
+
+    def __init__(self, worker_id, pid, slots):
+        self.worker_id = worker_id
+        self.pid = pid
+        self.slots = slots
+        self.in_flight = {}  # job id -> job
+        self.completed = 0
+        self.connected_at = time.time()
+
+
+class JobBroker:
+    """
+    Synthesis queue shared by the front process and the worker processes of sharded mode
+    Workers connect over a Unix socket and say how many jobs they run at once; queued jobs go
+    to whichever worker has a free slot. Jobs of a worker that disconnects are queued again.
+    Offers convert_text_to_speech_async like TTSService, and keeps the audio cache in the front.
+    """
+
+    MAX_ATTEMPTS = 2
+
+    def __init__(self, tts_service: TTSService, path=None, on_capacity_change=None):
+        self.tts_service = tts_service
+        self.path = path or Config.BROKER_SOCKET_PATH
+        self.on_capacity_change = on_capacity_change
+
+        self._server = None
+        self._queue = asyncio.Queue()
+        self._workers = {}  # connection task -> _WorkerConnection
+        self._ids = itertools.count(1)
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+
+    @property
+    def capacity(self) -> int:
+        """Jobs the connected workers can run at once"""
+        return sum(worker.slots for worker in self._workers.values())
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(worker.in_flight) for worker in self._workers.values())
+
+    async def start(self):
+        remove_stale_socket(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, self.path)
+        os.chmod(self.path, 0o600)
+        bot_logger.info(f"Job broker waiting for synthesis workers at {self.path}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._workers):
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'workers': [
+                {
+                    'worker': worker.worker_id, 'pid': worker.pid, 'slots': worker.slots,
+                    'in_flight': len(worker.in_flight), 'completed': worker.completed,
+                    'connected_for': time.time() - worker.connected_at,
+                }
+                for worker in sorted(self._workers.values(), key=lambda worker: worker.worker_id)
+            ],
+            'capacity': self.capacity,
+            'queued': self.queue_depth,
+            'in_flight': self.in_flight,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'requeued': self.requeued,
+        }
+
+    async def convert_text_to_speech_async(self, text: str, speed: float = 1.0, timeout: float = None):
+        """Synthesize in a worker process; returns an AudioResult like TTSService"""
+        timeout = Config.TTS_JOB_TIMEOUT if timeout is None else timeout
+
+        result = await asyncio.to_thread(self.tts_service.get_cached, text, speed)
+        if result is not None:
+            return result
+
+        job = _Job(next(self._ids), text, speed, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        try:
+            engine, key, data = await asyncio.wait_for(job.future, timeout)
+        except asyncio.TimeoutError:
+            bot_logger.warning(f"Synthesis timed out after {timeout}s ({len(text)} chars, {self.capacity} worker slots)")
+            raise TTSTimeoutError("Audio generation took too long. Please try a shorter text.")
+
+        return await asyncio.to_thread(self._store, engine, key, data)
+
+    def _store(self, engine, key, data):
+        self.tts_service.cache.put(key, data, self.tts_service.cache_ttl(engine))
+        return self.tts_service._make_result(data, engine, key)
+
+    # Worker connections
+
+    async def _handle_worker(self, reader, writer):
+        task = asyncio.current_task()
+        try:
+            hello, _ = await asyncio.wait_for(read_frame(reader), 10.0)
+            worker = _WorkerConnection(hello['worker'], hello.get('pid'), max(1, int(hello.get('slots', 1))))
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, KeyError, ConnectionError):
+            writer.close()
+            return
+
+        self._workers[task] = worker
+        self._capacity_changed()
+        bot_logger.info(f"Synthesis worker {worker.worker_id} connected (pid {worker.pid}, {worker.slots} slots)")
+
+        free_slots = asyncio.Semaphore(worker.slots)
+        feeder = asyncio.get_running_loop().create_task(self._feed_worker(worker, writer, free_slots))
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                job = worker.in_flight.pop(header.get('id'), None)
+                if job is None:
+                    continue
+                free_slots.release()
+                self._finish(worker, job, header, payload)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+            del self._workers[task]
+            self._capacity_changed()
+            self._requeue(worker)
+            writer.close()
+            bot_logger.warning(f"Synthesis worker {worker.worker_id} disconnected")
+
+    async def _feed_worker(self, worker, writer, free_slots):
+        """Hand queued jobs to the worker whenever it has a free slot"""
+        while True:
+            await free_slots.acquire()
+            job = await self._queue.get()
+            if job.future.done():
+                # Timed out or cancelled while queued
+                free_slots.release()
+                continue
+            job.attempts += 1
+            worker.in_flight[job.id] = job
+            write_frame(writer, {'type': 'job', 'id': job.id, 'text': job.text, 'speed': job.speed})
+            await writer.drain()
+
+    def _finish(self, worker, job, header, payload):
+        worker.completed += 1
+        if job.future.done():
+            return
+        if header.get('type') == 'result':
+            self.completed += 1
+            job.future.set_result((header['engine'], header['key'], payload))
+        else:
+            self.failed += 1
+            error = ERRORS.get(header.get('kind'), TTSError)
+            job.future.set_exception(error(header.get('error') or "Text-to-speech conversion failed."))
+
+    def _requeue(self, worker):
+        """Give the jobs of a lost worker to the others, unless they already had their chances"""
+        for job in worker.in_flight.values():
+            if job.future.done():
+                continue
+            if job.attempts < self.MAX_ATTEMPTS:
+                self.requeued += 1
+                self._queue.put_nowait(job)
+            else:
+                self.failed += 1
+                job.future.set_exception(TTSError("Text-to-speech conversion failed. Please try again later."))
+        worker.in_flight.clear()
+
+    def _capacity_changed(self):
+        if self.on_capacity_change is not None:
+            self.on_capacity_change(self.capacity)
@@ -0,0 +1,179 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from config import Config
+from utils.logger import bot_logger
+
+class QueueFullError(Exception):
+    """Raised when a job is not admitted; the message is meant for the user"""
+
+
+class _Job:
+    __slots__ = ('user_id', 'factory', 'future', 'enqueued_at', 'task')
+
+    def __init__(self, user_id, factory, future):
+        self.user_id = user_id
+        self.factory = factory
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.task = None
+
+
+class JobScheduler:
+    """
+    Fair-share scheduler between the handlers and TTSService
+    Users are served round-robin, short texts get a priority lane and total queued work is capped
+    """
+
+    # Out of every PRIORITY_WEIGHT + 1 picks, at most PRIORITY_WEIGHT come from the short-text lane
+    PRIORITY_WEIGHT = 3
+    WAIT_SAMPLES = 1000
+
+    def __init__(self, concurrency=None, max_depth=None, max_per_user=None, short_text_chars=None):
+        self.concurrency = concurrency or Config.TTS_MAX_WORKERS
+        self.max_depth = max_depth or Config.SCHEDULER_MAX_QUEUE_DEPTH
+        self.max_per_user = max_per_user or Config.SCHEDULER_MAX_JOBS_PER_USER
+        self.short_text_chars = short_text_chars or Config.SCHEDULER_SHORT_TEXT_CHARS
+
+        # user_id -> deque of jobs, in round-robin order
+        self._priority_lane = OrderedDict()
+        self._normal_lane = OrderedDict()
+        self._queued = 0
+        self._queued_per_user = {}
+        self._running = 0
+        self._priority_streak = 0
+
+        self._waits = deque(maxlen=self.WAIT_SAMPLES)
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def set_concurrency(self, concurrency: int):
+        """Change how many jobs run at once, e.g. when synthesis workers join or leave"""
+        self.concurrency = max(1, concurrency)
+        self._dispatch()
+
+    def is_saturated(self) -> bool:
+        """True when a new job would have to wait"""
+        return self._running >= self.concurrency
+
+    async def run(self, user_id: int, text_length: int, factory):
+        """Queue factory() for user_id and return its result once it has run"""
+        if self._queued >= self.max_depth:
+            self.rejected += 1
+            bot_logger.warning(f"Job queue full ({self._queued} queued), rejected job from user {user_id}")
+            raise QueueFullError("The bot is very busy right now. Please try again in a minute.")
+
+        if self._queued_per_user.get(user_id, 0) >= self.max_per_user:
+            self.rejected += 1
+            raise QueueFullError("You already have several conversions waiting. Please wait for them to finish.")
+
+        job = _Job(user_id, factory, asyncio.get_running_loop().create_future())
+        lane = self._priority_lane if text_length <= self.short_text_chars else self._normal_lane
+        lane.setdefault(user_id, deque()).append(job)
+        self._queued += 1
+        self._queued_per_user[user_id] = self._queued_per_user.get(user_id, 0) + 1
+        self.submitted += 1
+
+        self._dispatch()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            if job.task is None:
+                self._remove(job, lane)
+            else:
+                job.task.cancel()
+            raise
+
+    def stats(self) -> dict:
+        """Queue length and wait-time statistics"""
+        waits = sorted(self._waits)
+        return {
+            'queued': self._queued,
+            'queued_priority': sum(len(jobs) for jobs in self._priority_lane.values()),
+            'running': self._running,
+            'users_waiting': len(self._queued_per_user),
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+            'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            'wait_max': waits[-1] if waits else 0.0,
+        }
+
+    def _next_job(self):
+        """Pick the next job: priority lane first, but never starve the normal lane"""
+        use_priority = self._priority_lane and (
+            not self._normal_lane or self._priority_streak < self.PRIORITY_WEIGHT
+        )
+        if use_priority:
+            self._priority_streak += 1
+            lane = self._priority_lane
+        else:
+            self._priority_streak = 0
+            lane = self._normal_lane
+
+        user_id, jobs = next(iter(lane.items()))
+        job = jobs.popleft()
+        if jobs:
+            lane.move_to_end(user_id)  # next user's turn
+        else:
+            del lane[user_id]
+        self._forget(job)
+        return job
+
+    def _dispatch(self):
+        while self._running < self.concurrency and self._queued:
+            job = self._next_job()
+            self._running += 1
+            self._waits.append(time.monotonic() - job.enqueued_at)
+            job.task = asyncio.ensure_future(self._execute(job))
+
+    async def _execute(self, job):
+        try:
+            result = await job.factory()
+        except BaseException as e:
+            self.failed += 1
+            if not job.future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    job.future.cancel()
+                else:
+                    job.future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    def _remove(self, job, lane):
+        """Take a cancelled job out of its queue"""
+        jobs = lane.get(job.user_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del lane[job.user_id]
+            self._forget(job)
+
+    def _forget(self, job):
+        self._queued -= 1
+        remaining = self._queued_per_user[job.user_id] - 1
+        if remaining:
+            self._queued_per_user[job.user_id] = remaining
+        else:
+            del self._queued_per_user[job.user_id]
@@ -0,0 +1,186 @@
+import os
+import uuid
+import codecs
+import shutil
+import asyncio
+from collections import deque
+from config import Config
+from utils.logger import bot_logger
+from utils.text_decoder import detect_encoding, SNIFF_BYTES
+from utils.text_splitter import split_text_chunks, last_sentence_end
+from services.audio_codec import AudioCodec, AudioCodecError, mp3_frames, is_mp3
+
+
+class LongDocumentError(Exception):
+    """Raised when a long document cannot be converted; the message is meant for the user"""
+
+
+def _complete_text_end(text: str, max_chars: int):
+    """
+    Where the text that can be split now ends: at the last sentence end, as the rest may
+    continue in the next block, or at the last whitespace once the unfinished sentence is longer than a chunk
+    """
+    cut = last_sentence_end(text)
+    if len(text) - (cut or 0) <= max_chars:
+        return cut
+    last_word = len(text.rstrip())
+    while last_word > 0 and not text[last_word - 1].isspace():
+        last_word -= 1
+    cut = len(text[:last_word].rstrip())
+    # No whitespace at all: split_text_chunks slices such words every max_chars anyway
+    return cut or len(text) - len(text) % max_chars
+
+
+def iter_text_chunks(path: str, max_chars: int, block_size: int = 64 * 1024):
+    """
+    Yield sentence-aligned chunks of a text file without reading it all into memory
+    Only one block and the unfinished chunk after it are held at a time
+    """
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        encoding, bom = detect_encoding(head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+        pending = ""
+        block = head[bom:]
+        while block:
+            pending += decoder.decode(block)
+            cut = _complete_text_end(pending, max_chars)
+            if cut:
+                chunks = split_text_chunks(pending[:cut], max_chars, first_sentence_alone=False)
+                yield from chunks[:-1]
+                # The last chunk may still grow with the next sentences; the whitespace at the
+                # cut stays, so words and sentences on either side are never glued together
+                pending = (chunks[-1] if chunks else "") + pending[cut:]
+            block = f.read(block_size)
+
+        pending += decoder.decode(b'', final=True)
+        yield from split_text_chunks(pending, max_chars, first_sentence_alone=False)
+
+
+def count_characters(path: str, block_size: int = 64 * 1024) -> int:
+    """Number of characters in a text file, decoded block by block"""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        encoding, bom = detect_encoding(head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        count = 0
+        block = head[bom:]
+        while block:
+            count += len(decoder.decode(block))
+            block = f.read(block_size)
+        return count + len(decoder.decode(b'', final=True))
+
+
+async def download_to_path(file, path: str, max_bytes: int = None):
+    """
+    Download a Telegram file through the bot's own HTTP client and save it to path
+    The file is written in a thread, so a large document does not block the event loop
+    """
+    if not file.file_path.startswith(('http://', 'https://')):
+        # Local Bot API server: the file is already on this machine
+        await asyncio.to_thread(shutil.copyfile, file.file_path, path)
+        return
+
+    data = await file.download_as_bytearray(read_timeout=Config.LONG_DOCUMENT_DOWNLOAD_TIMEOUT)
+    if max_bytes and len(data) > max_bytes:
+        raise LongDocumentError("This document is too large.")
+    await asyncio.to_thread(_write_file, path, data)
+
+
+def _write_file(path: str, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class LongDocumentService:
+    """
+    Converts a text file of any length to MP3 with bounded memory
+    Text is read in chunks, a few chunks are synthesized ahead, and their MP3 frames are
+    appended to part files on disk that are handed out whenever the upload limit is reached
+    """
+
+    def __init__(self, synthesize, chunk_chars=None, lookahead=None, part_bytes=None, work_dir=None):
+        # synthesize(text, speed) -> AudioResult, awaited for each chunk
+        self.synthesize = synthesize
+        self.chunk_chars = chunk_chars or Config.LONG_DOCUMENT_CHUNK_CHARS
+        self.lookahead = lookahead or Config.LONG_DOCUMENT_LOOKAHEAD
+        self.part_bytes = part_bytes or Config.TELEGRAM_UPLOAD_LIMIT
+        self.work_dir = work_dir or Config.LONG_DOCUMENT_DIR
+
+    async def convert(self, path: str, speed: float, total_chars: int, on_part, on_progress=None) -> int:
+        """
+        Convert the document at path, awaiting on_part(part_path, index) for every finished part
+        and calling on_progress(chars_done, total_chars) after every chunk; returns the part count
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        chunks = iter_text_chunks(path, self.chunk_chars)
+        in_flight = deque()
+        part = None
+        part_index = 0
+        done_chars = 0
+
+        def fill():
+            while len(in_flight) < self.lookahead:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                in_flight.append((len(chunk), asyncio.ensure_future(self.synthesize(chunk, speed))))
+
+        try:
+            fill()
+            while in_flight:
+                length, task = in_flight.popleft()
+                result = await task
+                try:
+                    with result.open() as f:
+                        segment = await asyncio.to_thread(self._as_mp3, f.read())
+                finally:
+                    result.release()
+                fill()
+
+                if part is not None and part.tell() + len(segment) > self.part_bytes:
+                    await asyncio.to_thread(part.close)
+                    await on_part(part.name, part_index)
+                    os.remove(part.name)
+                    part = None
+                if part is None:
+                    part_index += 1
+                    part_path = os.path.join(self.work_dir, f"{uuid.uuid4().hex}_{part_index}.mp3")
+                    part = await asyncio.to_thread(open, part_path, 'wb')
+                # Parts are written in a thread, so other chats are not held up by the disk
+                await asyncio.to_thread(part.write, segment)
+
+                done_chars += length
+                if on_progress is not None:
+                    await on_progress(done_chars, total_chars)
+
+            if part is not None:
+                await asyncio.to_thread(part.close)
+                await on_part(part.name, part_index)
+                os.remove(part.name)
+                part = None
+            return part_index
+
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+            for result in await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True):
+                if not isinstance(result, BaseException):
+                    result.release()
+            if part is not None:
+                part.close()
+                os.remove(part.name)
+
+    @staticmethod
+    def _as_mp3(data: bytes) -> memoryview:
+        """MP3 frames for one synthesized chunk, transcoding other formats when ffmpeg is available"""
+        if not is_mp3(data):
+            if not AudioCodec.is_available():
+                raise LongDocumentError("This engine's audio cannot be joined into one file right now.")
+            try:
+                data = AudioCodec.encode_mp3(AudioCodec.decode_to_pcm(data))
+            except AudioCodecError as e:
+                bot_logger.error(f"Could not transcode long document segment: {e}")
+                raise LongDocumentError("Could not convert part of the document.")
+        return mp3_frames(data)
@@ -0,0 +1,54 @@
+import asyncio
+from config import Config
+from utils.logger import bot_logger
+from utils.metrics import registry as default_registry
+
+class MetricsServer:
+    """Serves the metrics registry in the Prometheus text format on GET /metrics"""
+
+    READ_TIMEOUT = 10.0
+
+    def __init__(self, registry=None, host=None, port=None):
+        self.registry = registry or default_registry
+        self.host = host or Config.METRICS_LISTEN
+        self.port = Config.METRICS_PORT if port is None else port
+        self._server = None
+
+    @property
+    def bound_port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        bot_logger.info(f"Metrics available at http://{self.host}:{self.bound_port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.READ_TIMEOUT)
+            method, target, _ = head.decode('latin-1').split('\r\n', 1)[0].split(' ', 2)
+
+            if target.split('?', 1)[0] != '/metrics':
+                status, body, content_type = '404 Not Found', b'', 'text/plain'
+            elif method not in ('GET', 'HEAD'):
+                status, body, content_type = '405 Method Not Allowed', b'', 'text/plain'
+            else:
+                status, content_type = '200 OK', self.registry.CONTENT_TYPE
+                body = self.registry.render().encode('utf-8')
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1')
+                + (body if method != 'HEAD' else b'')
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
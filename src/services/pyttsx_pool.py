@@ -0,0 +1,145 @@
+import sys
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from utils.logger import bot_logger
+
+# Engine owned by each worker process, created once by _init_worker
+_engine = None
+
+
+def _init_worker():
+    """Create the pyttsx3 engine once per worker process"""
+    global _engine
+    import pyttsx3
+    _engine = pyttsx3.init()
+
+
+def _synthesize(text: str, rate: int, volume: float, file_path: str) -> str:
+    """Render text to file_path with this job's settings"""
+    _engine.setProperty('rate', rate)
+    _engine.setProperty('volume', volume)
+    _engine.save_to_file(text, file_path)
+    _engine.runAndWait()
+    return file_path
+
+
+def _ping() -> int:
+    """Health check, answers with the worker's pid"""
+    if _engine is None:
+        raise RuntimeError("pyttsx3 engine not initialized")
+    return os.getpid()
+
+
+class PyttsxPoolError(Exception):
+    """Raised when the pyttsx3 worker pool cannot run a job"""
+
+
+class PyttsxPool:
+    """Pool of worker processes, each holding a warm pyttsx3 engine"""
+
+    BASE_RATE = 150  # pyttsx3 words per minute at 1.0x
+
+    def __init__(self, size=None, max_jobs_per_worker=None, max_queue=None):
+        self.size = size or Config.PYTTSX_POOL_SIZE or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker if max_jobs_per_worker is not None else Config.PYTTSX_MAX_JOBS_PER_WORKER
+        self.max_queue = max_queue or Config.PYTTSX_POOL_MAX_QUEUE
+
+        self._executor = None
+        self._lock = threading.Lock()
+        # Jobs waiting for or running in a worker; callers block when it is full
+        self._queue_slots = threading.BoundedSemaphore(self.size + self.max_queue)
+        self._last_health_check = 0.0
+        self.restarts = 0
+
+    def _create_executor(self):
+        kwargs = {}
+        # Recycling workers needs Python 3.11+
+        if self.max_jobs_per_worker and sys.version_info >= (3, 11):
+            kwargs['max_tasks_per_child'] = self.max_jobs_per_worker
+        return ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            **kwargs
+        )
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _restart(self, broken_executor):
+        """Replace a broken or stuck pool, killing its processes"""
+        with self._lock:
+            if self._executor is not broken_executor:
+                return  # another thread already restarted it
+            self._executor = None
+
+        processes = list((getattr(broken_executor, '_processes', None) or {}).values())
+        broken_executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        self.restarts += 1
+        bot_logger.warning(f"pyttsx3 worker pool restarted ({self.restarts} restarts)")
+
+    def warm_up(self):
+        """Start every worker process so the first jobs do not pay for engine start-up"""
+        self.health_check()
+
+    def health_check(self, timeout: float = 30.0) -> bool:
+        """Ping the workers and restart the pool if they do not answer"""
+        self._last_health_check = time.monotonic()
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(_ping) for _ in range(self.size)]
+            for future in futures:
+                future.result(timeout=timeout)
+            bot_logger.info(f"pyttsx3 worker pool healthy ({self.size} workers)")
+            return True
+        except (BrokenProcessPool, FutureTimeoutError, RuntimeError) as e:
+            bot_logger.error(f"pyttsx3 worker pool health check failed: {e!r}")
+            self._restart(executor)
+            return False
+
+    def synthesize(self, text: str, speed: float, file_path: str, volume: float = 0.8, timeout: float = None) -> str:
+        """Render text to file_path in a worker process, blocking until done"""
+        timeout = Config.TTS_JOB_TIMEOUT if timeout is None else timeout
+
+        if time.monotonic() - self._last_health_check > Config.PYTTSX_HEALTH_INTERVAL:
+            self.health_check()
+
+        if not self._queue_slots.acquire(timeout=timeout):
+            raise PyttsxPoolError("pyttsx3 worker queue is full")
+
+        try:
+            rate = int(self.BASE_RATE * speed)
+            # One retry covers a worker that died or was recycled mid-job
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(_synthesize, text, rate, volume, file_path)
+                    return future.result(timeout=timeout)
+                except BrokenProcessPool as e:
+                    self._restart(executor)
+                    if attempt:
+                        raise PyttsxPoolError(f"pyttsx3 worker pool is broken: {e}")
+                except FutureTimeoutError:
+                    self._restart(executor)
+                    raise PyttsxPoolError(f"pyttsx3 job timed out after {timeout}s")
+        finally:
+            self._queue_slots.release()
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
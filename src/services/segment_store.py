@@ -0,0 +1,269 @@
+import os
+import time
+import struct
+import threading
+from collections import OrderedDict
+from config import Config
+from utils.logger import bot_logger
+from utils.metrics import disk_write_seconds
+
+class SegmentStore:
+    """
+    Audio segments packed into one append-only file
+    Each record is a fixed header (key, length, stored_at) followed by the audio, so the pack
+    can always be re-indexed by scanning it. The index is saved beside the pack on close and
+    after compaction; only records appended after the saved index need scanning on startup.
+    Dropped and replaced records become dead space that compaction reclaims in the background.
+    """
+
+    RECORD = struct.Struct('<32sId')       # sha256 key, data length, stored_at
+    INDEX_HEADER = struct.Struct('<8sQ')   # magic, pack size covered by the index
+    INDEX_ENTRY = struct.Struct('<32sQId')  # key, data offset, length, stored_at
+    INDEX_MAGIC = b'TTSIDX01'
+
+    # Compact once dead space is at least this large and as large as the live data
+    COMPACT_MIN_DEAD_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = path or Config.SEGMENT_STORE_PATH
+        self.index_path = self.path + '.idx'
+        self.max_bytes = Config.SEGMENT_STORE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = Config.AUDIO_CACHE_TTL if ttl is None else ttl
+
+        # hex key -> (data offset, length, stored_at), least recently used first
+        self._index = None
+        self._file = None
+        self._size = 0
+        self._live_bytes = 0
+        self._lock = threading.RLock()
+        self._compactor = None
+
+        self.hits = 0
+        self.misses = 0
+
+    # Public API
+
+    def get(self, key: str):
+        """Return the segment stored under key, or None"""
+        with self._lock:
+            index = self._load()
+            entry = index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            offset, length, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            try:
+                self._file.seek(offset)
+                data = self._file.read(length)
+            except OSError as e:
+                bot_logger.error(f"Error reading audio segment: {e}")
+                data = b''
+            if len(data) != length:
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        """Append a segment, evicting the least recently used ones over max_bytes"""
+        if not data or len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            index = self._load()
+            if key in index:
+                index.move_to_end(key)
+                return
+
+            stored_at = time.time()
+            record = self.RECORD.pack(bytes.fromhex(key), len(data), stored_at)
+            try:
+                with disk_write_seconds.time(target='segments'):
+                    self._file.seek(self._size)
+                    self._file.write(record + data)
+                    self._file.flush()
+            except OSError as e:
+                bot_logger.error(f"Error writing audio segment: {e}")
+                return
+
+            index[key] = (self._size + self.RECORD.size, len(data), stored_at)
+            self._size += self.RECORD.size + len(data)
+            self._live_bytes += len(data)
+
+            while self._live_bytes > self.max_bytes and index:
+                self._drop(next(iter(index)))
+
+            if self._should_compact():
+                self._compactor = threading.Thread(target=self.compact, name='segment-compactor', daemon=True)
+                self._compactor.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'segments': len(self._index) if self._index is not None else 0,
+                'live_bytes': self._live_bytes,
+                'pack_bytes': self._size,
+            }
+
+    def close(self):
+        """Save the index and close the pack"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._file is None:
+                return
+            self._save_index()
+            self._file.close()
+            self._file = None
+            self._index = None
+
+    # Compaction
+
+    def _should_compact(self) -> bool:
+        dead = self._size - self._live_bytes - len(self._index) * self.RECORD.size
+        return (
+            dead >= self.COMPACT_MIN_DEAD_BYTES
+            and dead >= self._live_bytes
+            and (self._compactor is None or not self._compactor.is_alive())
+        )
+
+    def compact(self):
+        """Rewrite the pack with live segments only; reads and writes continue meanwhile"""
+        started = time.monotonic()
+        with self._lock:
+            snapshot = list(self._load().items())
+            old_size = self._size
+
+        tmp_path = self.path + '.compact'
+        moved = {}
+        try:
+            # Copy the bulk without holding the lock, through a reader of our own
+            with open(tmp_path, 'wb') as out, open(self.path, 'rb') as source:
+                def copy(key, offset, length, stored_at):
+                    source.seek(offset)
+                    data = source.read(length)
+                    moved[key] = (out.tell() + self.RECORD.size, length, stored_at)
+                    out.write(self.RECORD.pack(bytes.fromhex(key), length, stored_at) + data)
+
+                for key, (offset, length, stored_at) in snapshot:
+                    copy(key, offset, length, stored_at)
+
+                with self._lock:
+                    # Catch up with segments appended while copying
+                    for key, (offset, length, stored_at) in self._index.items():
+                        if offset >= old_size:
+                            copy(key, offset, length, stored_at)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    new_size = out.tell()
+
+                    # Every handle on both files is closed before replacing (required on Windows)
+                    out.close()
+                    source.close()
+                    self._file.close()
+                    os.replace(tmp_path, self.path)
+                    self._file = open(self.path, 'r+b')
+
+                    # Keep LRU order and anything dropped while copying stays dropped
+                    for key in self._index:
+                        self._index[key] = moved[key]
+                    self._size = new_size
+                    self._save_index()
+        except OSError as e:
+            bot_logger.error(f"Audio segment compaction failed: {e}")
+            with self._lock:
+                if self._file is not None and self._file.closed:
+                    self._file = open(self.path, 'r+b')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        bot_logger.info(
+            f"Compacted audio segments from {old_size} to {self._size} bytes "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+    # Index
+
+    def _load(self):
+        """Open the pack and load its index on first use"""
+        if self._index is not None:
+            return self._index
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+        self._file = open(self.path, 'r+b')
+        pack_size = os.fstat(self._file.fileno()).st_size
+
+        entries, covered = self._read_index(pack_size)
+        scanned, valid_end = self._scan(covered, pack_size)
+        entries.update(scanned)
+        if valid_end < pack_size:
+            # A record torn by a crash: drop it so appends start on a record boundary
+            bot_logger.warning(f"Truncating {pack_size - valid_end} bytes of incomplete audio segments")
+            self._file.truncate(valid_end)
+
+        now = time.time()
+        self._index = OrderedDict(
+            (key, entry) for key, entry in sorted(entries.items(), key=lambda item: item[1][2])
+            if now - entry[2] <= self.ttl
+        )
+        self._size = valid_end
+        self._live_bytes = sum(length for _, length, _ in self._index.values())
+        return self._index
+
+    def _read_index(self, pack_size: int):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            magic, covered = self.INDEX_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return {}, 0
+        if magic != self.INDEX_MAGIC or covered > pack_size:
+            return {}, 0
+
+        entries = {}
+        for key, offset, length, stored_at in self.INDEX_ENTRY.iter_unpack(data[self.INDEX_HEADER.size:]):
+            entries[key.hex()] = (offset, length, stored_at)
+        return entries, covered
+
+    def _scan(self, start: int, end: int):
+        """Index the records between start and end, returning them and where valid data ends"""
+        entries = {}
+        position = start
+        while position + self.RECORD.size <= end:
+            self._file.seek(position)
+            key, length, stored_at = self.RECORD.unpack(self._file.read(self.RECORD.size))
+            data_offset = position + self.RECORD.size
+            if data_offset + length > end:
+                break
+            entries[key.hex()] = (data_offset, length, stored_at)
+            position = data_offset + length
+        return entries, position
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self._size))
+            for key, (offset, length, stored_at) in self._index.items():
+                f.write(self.INDEX_ENTRY.pack(bytes.fromhex(key), offset, length, stored_at))
+        os.replace(tmp_path, self.index_path)
+
+    def _drop(self, key):
+        _, length, _ = self._index.pop(key)
+        self._live_bytes -= length
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from telegram.ext import BasePersistence, PersistenceInput
+from config import Config
+from utils.logger import bot_logger
+
+class SQLitePersistence(BasePersistence):
+    """
+    Application persistence backed by SQLite in WAL mode
+    Writes are staged in memory and committed in one debounced transaction;
+    user and chat data are loaded lazily, the first time an update needs them
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL)",
+        "CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL)",
+        "CREATE TABLE IF NOT EXISTS bot_data (id INTEGER PRIMARY KEY CHECK (id = 0), data TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS conversations ("
+        "name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key))",
+    )
+
+    def __init__(self, path=None, update_interval=None, write_delay=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval or Config.PERSISTENCE_UPDATE_INTERVAL
+        )
+        self.path = path or Config.DATABASE_PATH
+        self.write_delay = Config.PERSISTENCE_WRITE_DELAY if write_delay is None else write_delay
+
+        self._reader = None
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+        # Staged writes: (table, id) -> encoded data, or None to delete
+        self._pending = {}
+        self._pending_conversations = {}
+        self._flush_handle = None
+        self._flush_task = None
+
+        # Conversation name -> keys of chats not in the END state, for the active conversation count
+        self._conversation_keys = {}
+
+        self._loaded_users = set()
+        self._loaded_chats = set()
+        self._bot_data_json = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def reader(self):
+        """Connection used for lazy loads on the event loop"""
+        if self._reader is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._write_lock:
+                writer = self._get_writer()
+                for statement in self.SCHEMA:
+                    writer.execute(statement)
+                writer.commit()
+            self._reader = self._connect()
+        return self._reader
+
+    def _get_writer(self):
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    @staticmethod
+    def _encode(data) -> str:
+        """Serialize data as JSON, dropping values JSON cannot represent"""
+        try:
+            return json.dumps(data)
+        except (TypeError, ValueError):
+            clean = {}
+            for key, value in data.items():
+                try:
+                    json.dumps(value)
+                    clean[str(key)] = value
+                except (TypeError, ValueError):
+                    bot_logger.warning(f"Not persisting '{key}': {type(value).__name__} is not JSON serializable")
+            return json.dumps(clean)
+
+    def active_conversations(self) -> int:
+        """Chats in the middle of a persistent conversation, as of the last persistence update"""
+        return sum(len(keys) for keys in self._conversation_keys.values())
+
+    # Loading
+
+    async def get_user_data(self) -> dict:
+        # Nothing up front, users are loaded in refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        row = self.reader.execute("SELECT data FROM bot_data WHERE id = 0").fetchone()
+        self._bot_data_json = row[0] if row else json.dumps({})
+        return json.loads(self._bot_data_json)
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = self.reader.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        conversations = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+        self._conversation_keys[name] = set(conversations)
+        bot_logger.info(f"Restored {len(conversations)} '{name}' conversations")
+        return conversations
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        row = self.reader.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            # Keep anything set in memory before the first load
+            user_data.update({k: v for k, v in json.loads(row[0]).items() if k not in user_data})
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        self._loaded_chats.add(chat_id)
+        row = self.reader.execute("SELECT data FROM chat_data WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row:
+            chat_data.update({k: v for k, v in json.loads(row[0]).items() if k not in chat_data})
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # Staging writes
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._loaded_users.add(user_id)
+        self._stage(('user_data', user_id), self._encode(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._loaded_chats.add(chat_id)
+        self._stage(('chat_data', chat_id), self._encode(data))
+
+    async def update_bot_data(self, data: dict) -> None:
+        encoded = self._encode(data)
+        if encoded != self._bot_data_json:
+            self._bot_data_json = encoded
+            self._stage(('bot_data', 0), encoded)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        keys = self._conversation_keys.setdefault(name, set())
+        if new_state is None:
+            keys.discard(key)
+        else:
+            keys.add(key)
+        self._pending_conversations[(name, json.dumps(list(key)))] = (
+            None if new_state is None else json.dumps(new_state)
+        )
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(('user_data', user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage(('chat_data', chat_id), None)
+
+    def _stage(self, target, encoded):
+        self._pending[target] = encoded
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Debounce: everything staged within write_delay goes into one transaction"""
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.write_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._write_pending())
+        else:
+            self._schedule_flush()  # a write is still running, try again later
+
+    async def _write_pending(self):
+        pending, self._pending = self._pending, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        if pending or conversations:
+            await asyncio.to_thread(self._write_batch, pending, conversations)
+
+    def _write_batch(self, pending: dict, conversations: dict):
+        now = time.time()
+        id_columns = {'user_data': 'user_id', 'chat_data': 'chat_id', 'bot_data': 'id'}
+
+        with self._write_lock:
+            writer = self._get_writer()
+            try:
+                with writer:
+                    for (table, row_id), encoded in pending.items():
+                        column = id_columns[table]
+                        if encoded is None:
+                            writer.execute(f"DELETE FROM {table} WHERE {column} = ?", (row_id,))
+                        elif table == 'bot_data':
+                            writer.execute("INSERT OR REPLACE INTO bot_data (id, data) VALUES (0, ?)", (encoded,))
+                        else:
+                            writer.execute(
+                                f"INSERT OR REPLACE INTO {table} ({column}, data, updated_at) VALUES (?, ?, ?)",
+                                (row_id, encoded, now)
+                            )
+                    for (name, key), state in conversations.items():
+                        if state is None:
+                            writer.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+                        else:
+                            writer.execute(
+                                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                                (name, key, state)
+                            )
+            except sqlite3.Error as e:
+                bot_logger.error(f"Error writing session data: {e}")
+
+    async def flush(self) -> None:
+        """Write everything still staged and close the database"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_pending()
+
+        with self._write_lock:
+            for connection in (self._reader, self._writer):
+                if connection is not None:
+                    connection.close()
+            self._reader = self._writer = None
+        bot_logger.info("Session data flushed")
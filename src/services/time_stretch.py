@@ -0,0 +1,138 @@
+import numpy as np
+
+MIN_SPEED = 0.1
+MAX_SPEED = 3.0
+
+
+class TimeStretcher:
+    """
+    Pitch-preserving time-stretch using WSOLA (waveform similarity overlap-add)
+    Works on blocks of mono PCM so long inputs never have to be held twice in memory
+    """
+
+    def __init__(self, speed: float, sample_rate: int = 24000, frame_ms: float = 40.0, tolerance_ms: float = 10.0):
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"Speed must be between {MIN_SPEED} and {MAX_SPEED}")
+
+        self.speed = float(speed)
+        self.sample_rate = sample_rate
+
+        # Even frame length with 50% overlap, so the Hann windows sum to one
+        self.frame = max(64, int(sample_rate * frame_ms / 1000) // 2 * 2)
+        self.hop = self.frame // 2
+        self.tolerance = max(1, int(sample_rate * tolerance_ms / 1000))
+        self.analysis_hop = self.hop * self.speed
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.frame) / self.frame)).astype(np.float32)
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0      # absolute input position of self._buffer[0]
+        self._input_length = 0      # total input samples received
+        self._frame_index = 0
+        self._previous = None       # absolute input position of the last frame used
+        self._overlap = np.zeros(self.frame, dtype=np.float32)
+        self._emitted = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Feed a block of samples and return the output that is ready so far"""
+        block = np.asarray(block, dtype=np.float32)
+        self._buffer = np.concatenate((self._buffer, block))
+        self._input_length += len(block)
+        return self._run(final=False)
+
+    def flush(self) -> np.ndarray:
+        """Return the remaining output once all input has been fed"""
+        output = self._run(final=True)
+        expected = int(round(self._input_length / self.speed))
+        tail = self._overlap[:max(0, min(self.hop, expected - self._emitted))]
+        output = np.concatenate((output, tail))
+        self._emitted += len(tail)
+        return output
+
+    def _run(self, final: bool) -> np.ndarray:
+        frame, hop, tolerance = self.frame, self.hop, self.tolerance
+        outputs = []
+
+        while True:
+            nominal = int(round(self._frame_index * self.analysis_hop))
+            if final and nominal >= self._input_length:
+                break
+            if not final and nominal + tolerance + frame > self._input_length:
+                break
+
+            if self._previous is None:
+                position = nominal
+            else:
+                position = self._best_position(nominal)
+
+            samples = self._slice(position, frame)
+            self._overlap += samples * self.window
+            outputs.append(self._overlap[:hop].copy())
+            self._overlap = np.concatenate((self._overlap[hop:], np.zeros(hop, dtype=np.float32)))
+
+            self._previous = position
+            self._frame_index += 1
+            self._trim()
+
+        if not outputs:
+            return np.zeros(0, dtype=np.float32)
+
+        output = np.concatenate(outputs)
+        if final:
+            expected = int(round(self._input_length / self.speed))
+            output = output[:max(0, expected - self._emitted)]
+        self._emitted += len(output)
+        return output
+
+    def _best_position(self, nominal: int) -> int:
+        """Pick the frame start near nominal that best continues the previous frame"""
+        hop, tolerance = self.hop, self.tolerance
+
+        # What would naturally follow the previous frame in the overlap region
+        template = self._slice(self._previous + hop, hop)
+        start = max(0, nominal - tolerance)
+        stop = min(nominal + tolerance, max(start, self._input_length - 1))
+        region = self._slice(start, stop - start + hop)
+
+        # Normalized cross-correlation over all candidate offsets
+        correlation = np.correlate(region, template, mode='valid')
+        energy = np.cumsum(np.concatenate(([0.0], region.astype(np.float64) ** 2)))
+        window_energy = energy[hop:] - energy[:-hop]
+        scores = correlation / np.sqrt(np.maximum(window_energy[:len(correlation)], 1e-9))
+        return start + int(np.argmax(scores))
+
+    def _slice(self, position: int, length: int) -> np.ndarray:
+        """Input samples [position, position + length), zero-padded past the end"""
+        offset = position - self._buffer_start
+        samples = self._buffer[max(0, offset):max(0, offset + length)]
+        if offset < 0:
+            samples = np.concatenate((np.zeros(-offset, dtype=np.float32), samples))
+        if len(samples) < length:
+            samples = np.concatenate((samples, np.zeros(length - len(samples), dtype=np.float32)))
+        return samples
+
+    def _trim(self):
+        """Drop input that no future frame can reach"""
+        next_nominal = int(round(self._frame_index * self.analysis_hop))
+        keep_from = min(next_nominal - self.tolerance, self._previous + self.hop)
+        drop = keep_from - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+
+
+def time_stretch(samples: np.ndarray, speed: float, sample_rate: int = 24000, block_size: int = 65536) -> np.ndarray:
+    """Time-stretch int16 or float mono PCM by speed without changing pitch"""
+    if abs(speed - 1.0) < 1e-3:
+        return samples
+
+    is_int = np.issubdtype(samples.dtype, np.integer)
+    data = samples.astype(np.float32) / 32768.0 if is_int else samples.astype(np.float32)
+
+    stretcher = TimeStretcher(speed, sample_rate)
+    parts = [stretcher.process(data[i:i + block_size]) for i in range(0, len(data), block_size)]
+    parts.append(stretcher.flush())
+    output = np.concatenate(parts)
+
+    if is_int:
+        return np.clip(output * 32768.0, -32768, 32767).astype(np.int16)
+    return output
@@ -1,23 +1,136 @@
-import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import io
-from gtts import gTTS
-import pyttsx3
+import time
+import asyncio
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
 from utils.logger import bot_logger
 from services.file_service import FileService
+from services.cache_service import AudioCache
+from services.audio_codec import AudioCodec, AudioCodecError, mp3_frames
+from services.segment_store import SegmentStore
+from services.pyttsx_pool import PyttsxPool
+from services.circuit_breaker import CircuitBreaker
+from utils.text_splitter import split_sentences
+from utils.metrics import synthesis_seconds, fallbacks_total, errors_total
+
+_time_stretch = False  # not imported yet
+
+
+def load_time_stretch():
+    """The time stretcher, imported on first use as it pulls in numpy; None without numpy"""
+    global _time_stretch
+    if _time_stretch is False:
+        try:
+            from services.time_stretch import time_stretch
+        except ImportError:  # numpy is optional, without it gTTS speed falls back to the slow flag
+            time_stretch = None
+        _time_stretch = time_stretch
+    return _time_stretch
+
+
+class TTSError(Exception):
+    """Raised when text-to-speech conversion fails"""
+
+
+class TTSBusyError(TTSError):
+    """Raised when the synthesis pool has no room for another job"""
+
+
+class TTSTimeoutError(TTSError):
+    """Raised when a synthesis job exceeds its time limit"""
+
+
+class AudioResult:
+    """Generated audio, held in memory or spilled to a file, plus the engine and cache key that produced it"""
+    
+    def __init__(self, engine: str, key: str, data: bytes = None, file_path: str = None,
+                 cached: bool = False, filename: str = None):
+        self.engine = engine
+        self.key = key
+        self.data = data
+        self.file_path = file_path
+        self.cached = cached
+        self.filename = filename or (os.path.basename(file_path) if file_path else FileService.generate_filename())
+    
+    @property
+    def size(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        return os.path.getsize(self.file_path)
+    
+    def open(self):
+        """Binary file object over the audio, without touching disk for in-memory audio"""
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        # Tracked while open, so expiry never deletes a file that is being sent
+        return FileService.open_file(self.file_path)
+    
+    @property
+    def is_voice(self) -> bool:
+        """OGG/Opus audio, sent as a voice note instead of an audio file"""
+        return self.filename.endswith('.ogg')
+    
+    def release(self):
+        """Delete the spilled file, if any"""
+        if self.file_path:
+            FileService.delete_file(self.file_path)
+            self.file_path = None
+
 
 class TTSService:
     """Text-to-Speech service with multiple providers"""
     
-    def __init__(self):
+    # Engines in order of preference
+    ENGINES = ('gtts', 'pyttsx3')
+    
+    # Latency is tracked per LATENCY_UNIT_CHARS characters, so short and long texts are comparable
+    LATENCY_UNIT_CHARS = 200
+    
+    def __init__(self, max_workers=None, max_pending=None, cache=None, segments=None):
+        self.lang = Config.TTS_LANGUAGE
+        self.cache = cache if cache is not None else AudioCache()
+        if segments is None and Config.SEGMENT_CACHE_ENABLED:
+            segments = SegmentStore()
+        self.segments = segments
+        self.breakers = {engine: CircuitBreaker(engine) for engine in self.ENGINES}
+        self.hedged_requests = 0
         self._pyttsx_engine = None
+        # pyttsx3 engines are not thread-safe, serialize access to the shared one
+        self._pyttsx_lock = threading.Lock()
+        # Warm engines in worker processes, so the offline fallback scales with cores
+        self.pyttsx_pool = PyttsxPool() if Config.PYTTSX_POOL_SIZE > 0 else None
+        
+        self.max_workers = max_workers or Config.TTS_MAX_WORKERS
+        self.max_pending = max_pending or Config.TTS_MAX_PENDING
+        self._executor = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.warm_up_future = None
+    
+    @property
+    def executor(self):
+        """Lazy initialization of the synthesis worker pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='tts-worker'
+            )
+        return self._executor
+    
+    @property
+    def pending_jobs(self):
+        """Number of jobs queued or running in the worker pool"""
+        return self._pending
     
     @property
     def pyttsx_engine(self):
         """Lazy initialization of pyttsx3 engine"""
         if self._pyttsx_engine is None:
             try:
+                import pyttsx3
                 self._pyttsx_engine = pyttsx3.init()
                 # Configure default settings
                 self._pyttsx_engine.setProperty('rate', 150)  # Default speed
@@ -29,45 +142,101 @@ class TTSService:
     
     def text_to_speech_gtts(self, text: str, speed: float = 1.0) -> bytes:
         """Convert text to speech using gTTS (primary service)"""
+        # Imported on first use (or by warm_up), as gTTS pulls in requests
+        from gtts import gTTS
         try:
-            # gTTS only supports slow=True/False, not exact speeds
-            # We'll map speed ranges to slow/normal
-            if speed < 0.8:
-                slow = True
-            elif speed > 1.2:
-                # For faster speeds, we'll use normal and indicate in filename
+            stretch = self.can_stretch(speed)
+            
+            if stretch:
+                # Synthesize at normal speed and time-stretch to the exact speed
                 slow = False
             else:
-                slow = False
+                # gTTS only supports slow=True/False, not exact speeds
+                slow = speed < 0.8
             
-            tts = gTTS(text=text, lang='en', slow=slow)
+            tts = gTTS(text=text, lang=self.lang, slow=slow)
             
             # Save to bytes buffer
             audio_buffer = io.BytesIO()
             tts.write_to_fp(audio_buffer)
             audio_buffer.seek(0)
             
+            if stretch:
+                return self.change_speed(audio_buffer.read(), speed)
+            
             return audio_buffer.read()
                 
         except Exception as e:
             bot_logger.error(f"gTTS service error: {e}")
             raise
     
+    def text_to_speech_segments(self, text: str, speed: float = 1.0) -> bytes:
+        """gTTS audio assembled sentence by sentence, synthesizing only sentences not stored yet"""
+        sentences = split_sentences(text) or [text]
+        segments = []
+        reused = 0
+        
+        for sentence in sentences:
+            key = self.cache_key(sentence, speed, 'gtts')
+            audio_data = self.segments.get(key)
+            if audio_data is None:
+                audio_data = self.text_to_speech_gtts(sentence, speed)
+                self.segments.put(key, audio_data)
+            else:
+                reused += 1
+            segments.append(audio_data)
+        
+        if reused:
+            bot_logger.info(f"Reused {reused}/{len(sentences)} cached sentences")
+        if len(segments) == 1:
+            return segments[0]
+        # MP3 frames can be appended once the per-segment tags are stripped
+        return b''.join(mp3_frames(segment) for segment in segments)
+    
+    @staticmethod
+    def can_stretch(speed: float) -> bool:
+        """Whether real time-stretching is available for this speed"""
+        return (
+            abs(speed - 1.0) >= 0.01
+            and Config.TIME_STRETCH_ENABLED
+            and AudioCodec.is_available()
+            and load_time_stretch() is not None
+        )
+    
+    @staticmethod
+    def change_speed(audio_data: bytes, speed: float) -> bytes:
+        """Time-stretch encoded audio to the given speed, keeping its pitch"""
+        import numpy as np
+        try:
+            pcm = np.frombuffer(AudioCodec.decode_to_pcm(audio_data), dtype=np.int16)
+            stretched = load_time_stretch()(pcm, speed, AudioCodec.SAMPLE_RATE)
+            return AudioCodec.encode_mp3(stretched.tobytes())
+        except (AudioCodecError, ValueError) as e:
+            bot_logger.warning(f"Time-stretch failed, sending normal speed audio: {e}")
+            return audio_data
+    
     def text_to_speech_pyttsx(self, text: str, speed: float = 1.0) -> str:
         """Convert text to speech using pyttsx3 (fallback service)"""
         try:
             # Generate filename
             filename = FileService.generate_filename()
             file_path = FileService.get_file_path(filename)
+            # Indexed before synthesis, so a file left behind by a failed job still expires
+            FileService.track(file_path)
+            
+            if self.pyttsx_pool is not None:
+                return self.pyttsx_pool.synthesize(text, speed, file_path)
             
             # Configure speed (pyttsx3 rate is words per minute)
             base_rate = 150  # Normal speed
             adjusted_rate = int(base_rate * speed)
-            self.pyttsx_engine.setProperty('rate', adjusted_rate)
             
-            # Save to file
-            self.pyttsx_engine.save_to_file(text, file_path)
-            self.pyttsx_engine.runAndWait()
+            with self._pyttsx_lock:
+                self.pyttsx_engine.setProperty('rate', adjusted_rate)
+                
+                # Save to file
+                self.pyttsx_engine.save_to_file(text, file_path)
+                self.pyttsx_engine.runAndWait()
             
             return file_path
             
@@ -75,30 +244,272 @@ class TTSService:
             bot_logger.error(f"pyttsx3 service error: {e}")
             raise
     
-    def convert_text_to_speech(self, text: str, speed: float = 1.0) -> str:
+    def convert_text_to_speech(self, text: str, speed: float = 1.0) -> AudioResult:
         """
         Main method to convert text to speech with fallback logic
-        Returns path to generated audio file
+        Returns an AudioResult holding the generated audio
         """
-        bot_logger.info(f"Converting text to speech ({len(text)} chars, speed: {speed}x)")
+        bot_logger.info(f"Converting text to speech ({len(text)} chars, speed: {speed}x)",
+                        extra={'text_length': len(text), 'speed': speed})
+        
+        # Serve repeated requests without synthesizing again
+        result = self.get_cached(text, speed)
+        if result is not None:
+            return result
+        
+        last_error = None
+        for engine in self.ENGINES:
+            # Skip engines that are failing right now instead of waiting for their timeout
+            if not self.breakers[engine].allow_request():
+                bot_logger.warning(f"Skipping {engine}, its circuit is open")
+                fallbacks_total.inc(engine=engine, reason='circuit_open')
+                continue
+            
+            try:
+                return self.synthesize_with(engine, text, speed)
+            except Exception as e:
+                last_error = e
+                bot_logger.warning(f"{engine} failed: {e}", extra={'engine': engine})
+                fallbacks_total.inc(engine=engine, reason='error')
+        
+        bot_logger.error(f"All TTS services failed: {last_error}")
+        errors_total.inc(stage='synthesis')
+        raise TTSError("Text-to-speech conversion failed. Please try again later.")
+    
+    def get_cached(self, text: str, speed: float):
+        """Cached audio for this request from any engine, in order of preference"""
+        for engine in self.ENGINES:
+            key = self.cache_key(text, speed, engine)
+            audio_data = self.cache.get(key)
+            if audio_data is not None:
+                bot_logger.info(f"Audio cache hit ({engine})", extra={'engine': engine})
+                return self._make_result(audio_data, engine, key, cached=True)
+        return None
+    
+    def synthesize_with(self, engine: str, text: str, speed: float) -> AudioResult:
+        """Synthesize with one engine, cache the audio and report the outcome to its circuit breaker"""
+        breaker = self.breakers[engine]
+        key = self.cache_key(text, speed, engine)
+        units = max(1.0, len(text) / self.LATENCY_UNIT_CHARS)
+        started = time.monotonic()
         
         try:
-            # Try gTTS first (better quality)
-            audio_data = self.text_to_speech_gtts(text, speed)
-            filename = FileService.generate_filename()
+            if engine == 'gtts':
+                if self.segments is not None:
+                    audio_data = self.text_to_speech_segments(text, speed)
+                else:
+                    audio_data = self.text_to_speech_gtts(text, speed)
+                self.cache.put(key, audio_data)
+                result = self._make_result(audio_data, engine, key)
+            else:
+                file_path = self.text_to_speech_pyttsx(text, speed)
+                with open(file_path, 'rb') as f:
+                    self.cache.put(key, f.read(), self.cache_ttl(engine))
+                result = AudioResult(engine, key, file_path=file_path)
+        except Exception:
+            elapsed = time.monotonic() - started
+            breaker.record_failure(elapsed / units)
+            synthesis_seconds.observe(elapsed, engine=engine, outcome='error')
+            raise
+        
+        elapsed = time.monotonic() - started
+        breaker.record_success(elapsed / units)
+        synthesis_seconds.observe(elapsed, engine=engine, outcome='ok')
+        bot_logger.info(f"Successfully generated audio with {engine}", extra={
+            'engine': engine, 'text_length': len(text), 'speed': speed, 'latency_ms': round(elapsed * 1000)
+        })
+        return result
+    
+    def _synthesize_if_allowed(self, engine: str, text: str, speed: float) -> AudioResult:
+        """
+        synthesize_with, unless the engine's circuit is open
+        Checked in the worker, like the sequential path, so a half-open probe is only claimed by a
+        job that runs and reports its outcome, never by one rejected as busy or cancelled in the queue
+        """
+        if not self.breakers[engine].allow_request():
+            fallbacks_total.inc(engine=engine, reason='circuit_open')
+            raise TTSError(f"Skipping {engine}, its circuit is open")
+        return self.synthesize_with(engine, text, speed)
+    
+    def hedge_delay(self, engine: str, text: str):
+        """How long to wait for engine before starting the fallback, None if unknown"""
+        per_unit = self.breakers[engine].latency_percentile(
+            Config.HEDGE_PERCENTILE, min_samples=Config.HEDGE_MIN_SAMPLES
+        )
+        if per_unit is None:
+            return None
+        return per_unit * max(1.0, len(text) / self.LATENCY_UNIT_CHARS)
+    
+    @staticmethod
+    def _make_result(audio_data: bytes, engine: str, key: str, cached: bool = False,
+                     extension: str = '.mp3') -> AudioResult:
+        """Keep audio in memory, spilling to disk only above AUDIO_SPILL_THRESHOLD"""
+        filename = os.path.splitext(FileService.generate_filename())[0] + extension
+        if len(audio_data) > Config.AUDIO_SPILL_THRESHOLD:
             file_path = FileService.save_audio_file(audio_data, filename)
-            bot_logger.info("Successfully generated audio with gTTS")
-            return file_path
+            return AudioResult(engine, key, file_path=file_path, cached=cached)
+        return AudioResult(engine, key, data=audio_data, cached=cached, filename=filename)
+    
+    def cache_ttl(self, engine: str):
+        """How long engine's audio stays cached; None for the full AUDIO_CACHE_TTL"""
+        return None if engine == self.ENGINES[0] else Config.FALLBACK_CACHE_TTL
+    
+    def primary_circuit_closed(self) -> bool:
+        """Whether the preferred engine's circuit is closed, so fallback audio should not be reused"""
+        return self.breakers[self.ENGINES[0]].state == CircuitBreaker.CLOSED
+    
+    def cache_key(self, text: str, speed: float, engine: str) -> str:
+        """Cache key for audio produced by engine for this request"""
+        return AudioCache.make_key(text, speed, engine, self.lang)
+    
+    def cache_keys(self, text: str, speed: float) -> list:
+        """Cache keys for every engine, in order of preference"""
+        return [self.cache_key(text, speed, engine) for engine in self.ENGINES]
+    
+    async def convert_text_to_speech_async(self, text: str, speed: float = 1.0, timeout: float = None) -> AudioResult:
+        """
+        Run synthesis in the worker pool without blocking the event loop
+        Returns an AudioResult holding the generated audio
+        """
+        timeout = Config.TTS_JOB_TIMEOUT if timeout is None else timeout
+        
+        if not Config.TTS_HEDGING:
+            return await self._await_job(self._submit(self.convert_text_to_speech, text, speed), text, timeout)
+        
+        try:
+            return await asyncio.wait_for(self._convert_hedged(text, speed), timeout=timeout)
+        except asyncio.TimeoutError:
+            bot_logger.warning(f"Synthesis timed out after {timeout}s ({len(text)} chars)")
+            raise TTSTimeoutError("Audio generation took too long. Please try a shorter text.")
+    
+    async def run_in_pool(self, fn, *args) -> AudioResult:
+        """
+        Run fn(*args), a blocking job returning an AudioResult, in the synthesis worker pool
+        Counts against the pending-job limit like synthesis; a result nobody waits for is released
+        """
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self._discard_late_result(future)
+            raise
+    
+    async def _convert_hedged(self, text: str, speed: float) -> AudioResult:
+        """
+        Start the primary engine; if it runs past its usual p95 latency, start the
+        fallback in parallel and use whichever finishes first
+        """
+        bot_logger.info(f"Converting text to speech ({len(text)} chars, speed: {speed}x, hedged)")
+        
+        result = await asyncio.wrap_future(self._submit(self.get_cached, text, speed))
+        if result is not None:
+            return result
+        
+        primary, fallback = self.ENGINES
+        futures = {}
+        winner = None
+        
+        try:
+            futures[primary] = asyncio.wrap_future(self._submit(self._synthesize_if_allowed, primary, text, speed))
+            delay = self.hedge_delay(primary, text)
+            done, _ = await asyncio.wait([futures[primary]], timeout=delay)
             
-        except Exception as gtts_error:
-            bot_logger.warning(f"gTTS failed, trying pyttsx3: {gtts_error}")
+            if done and not futures[primary].exception():
+                winner = futures[primary]
+                return winner.result()
+            if done:
+                bot_logger.warning(f"{primary} failed: {futures[primary].exception()}")
+            else:
+                self.hedged_requests += 1
+                bot_logger.info(f"{primary} slower than its p95 ({delay:.2f}s), hedging with {fallback}")
             
-            try:
-                # Fallback to pyttsx3
-                file_path = self.text_to_speech_pyttsx(text, speed)
-                bot_logger.info("Successfully generated audio with pyttsx3 fallback")
-                return file_path
-                
-            except Exception as pyttsx_error:
-                bot_logger.error(f"All TTS services failed: {pyttsx_error}")
-                raise Exception("Text-to-speech conversion failed. Please try again later.")
\ No newline at end of file
+            futures[fallback] = asyncio.wrap_future(self._submit(self._synthesize_if_allowed, fallback, text, speed))
+            
+            # First successful engine wins
+            pending = {future for future in futures.values() if not future.done() or not future.exception()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if not future.exception():
+                        winner = future
+                        return winner.result()
+                    bot_logger.warning(f"Hedged engine failed: {future.exception()}")
+            
+            raise TTSError("Text-to-speech conversion failed. Please try again later.")
+        
+        finally:
+            # Release the losing engine's audio once it finishes
+            for future in futures.values():
+                if future is not winner:
+                    self._discard_late_result(future)
+    
+    def _submit(self, fn, *args):
+        """Submit a blocking call to the worker pool, enforcing the pending-job limit"""
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                raise TTSBusyError("Too many audio requests right now. Please try again shortly.")
+            self._pending += 1
+        
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(lambda _: self._release_slot())
+        return future
+    
+    async def _await_job(self, future, text: str, timeout: float) -> AudioResult:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            bot_logger.warning(f"Synthesis timed out after {timeout}s ({len(text)} chars)")
+            self._discard_late_result(future)
+            raise TTSTimeoutError("Audio generation took too long. Please try a shorter text.")
+        except asyncio.CancelledError:
+            self._discard_late_result(future)
+            raise
+    
+    def warm_up(self):
+        """Import the engines and start the pyttsx3 worker processes ahead of the first job"""
+        started = time.monotonic()
+        importlib.import_module('gtts')
+        load_time_stretch()
+        if self.pyttsx_pool is not None:
+            self.pyttsx_pool.warm_up()
+        bot_logger.info(f"Speech engines ready after {time.monotonic() - started:.2f}s")
+    
+    def warm_up_in_background(self):
+        """Run warm_up in the loop's default executor; a failure is logged, the engines then load on first use"""
+        def report(future):
+            if not future.cancelled() and future.exception() is not None:
+                bot_logger.error(f"Speech engine warm-up failed: {future.exception()}")
+        
+        self.warm_up_future = asyncio.get_running_loop().run_in_executor(None, self.warm_up)
+        self.warm_up_future.add_done_callback(report)
+        return self.warm_up_future
+    
+    def shutdown(self, wait: bool = False):
+        """Stop the worker pools and drop jobs that have not started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        if self.pyttsx_pool is not None:
+            self.pyttsx_pool.shutdown()
+        if self.segments is not None:
+            self.segments.close()
+    
+    def _release_slot(self):
+        with self._pending_lock:
+            self._pending -= 1
+    
+    @staticmethod
+    def _discard_late_result(future):
+        """Cancel a job nobody waits for, or delete its file once it finishes"""
+        if future.cancel():
+            return
+        
+        def cleanup(done):
+            if not done.cancelled() and done.exception() is None:
+                done.result().release()
+        
+        future.add_done_callback(cleanup)
\ No newline at end of file
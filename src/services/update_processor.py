@@ -0,0 +1,122 @@
+import time
+from collections import OrderedDict, deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import Config
+from utils.logger import bot_logger
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently and updates from the same chat in order
+    Each chat holds at most one processing slot; later updates for a busy chat wait in that chat's
+    queue so the conversation state machine always sees them one at a time
+    """
+
+    WAIT_SAMPLES = 1000
+    TRACKED_CHATS = 1000
+
+    def __init__(self, max_concurrent_updates=None, wait_warning=None):
+        super().__init__(max_concurrent_updates or Config.CONCURRENT_UPDATES)
+        self.wait_warning = Config.CHAT_WAIT_WARNING if wait_warning is None else wait_warning
+
+        # chat key -> deque of (coroutine, queued_at) waiting behind the running update
+        self._chat_queues = {}
+        self._running = 0
+
+        self._waits = deque(maxlen=self.WAIT_SAMPLES)
+        # chat key -> [updates, total wait, max wait], least recently active first
+        self._chat_waits = OrderedDict()
+        self.processed = 0
+
+    @property
+    def backlog(self) -> int:
+        """Updates being processed or waiting behind another update from their chat"""
+        return self._running + sum(len(queue) for queue in self._chat_queues.values())
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await self._run(key, coroutine, time.monotonic())
+            return
+
+        queue = self._chat_queues.get(key)
+        if queue is not None:
+            # The chat is busy: hand the update to the task already working through it
+            queue.append((coroutine, time.monotonic()))
+            return
+
+        queue = self._chat_queues[key] = deque()
+        try:
+            await self._run(key, coroutine, time.monotonic())
+            while queue:
+                next_coroutine, queued_at = queue.popleft()
+                await self._run(key, next_coroutine, queued_at)
+        finally:
+            del self._chat_queues[key]
+            for leftover, _ in queue:
+                leftover.close()
+
+    async def _run(self, key, coroutine, queued_at):
+        wait = time.monotonic() - queued_at
+        self._record_wait(key, wait)
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+            self.processed += 1
+
+    def _record_wait(self, key, wait: float):
+        self._waits.append(wait)
+        if key is None:
+            return
+
+        entry = self._chat_waits.pop(key, None) or [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += wait
+        entry[2] = max(entry[2], wait)
+        self._chat_waits[key] = entry
+        if len(self._chat_waits) > self.TRACKED_CHATS:
+            self._chat_waits.popitem(last=False)
+
+        if wait >= self.wait_warning:
+            bot_logger.warning(f"Update for chat {key} waited {wait:.1f}s behind earlier updates from the same chat")
+
+    def stats(self) -> dict:
+        """Processing counts and per-chat queue wait statistics"""
+        waits = sorted(self._waits)
+        slowest = sorted(self._chat_waits.items(), key=lambda item: item[1][2], reverse=True)[:5]
+        return {
+            'max_concurrent': self.max_concurrent_updates,
+            'running': self._running,
+            'busy_chats': len(self._chat_queues),
+            'queued': sum(len(queue) for queue in self._chat_queues.values()),
+            'processed': self.processed,
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+            'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            'wait_max': waits[-1] if waits else 0.0,
+            'slowest_chats': [
+                {'chat': key, 'updates': count, 'wait_avg': total / count, 'wait_max': worst}
+                for key, (count, total, worst) in slowest
+            ],
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        stats = self.stats()
+        bot_logger.info(
+            f"Processed {stats['processed']} updates, chat queue wait p95 {stats['wait_p95']:.2f}s, "
+            f"max {stats['wait_max']:.2f}s"
+        )
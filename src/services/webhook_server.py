@@ -0,0 +1,169 @@
+import hmac
+import json
+import asyncio
+from telegram import Update
+from config import Config
+from utils.logger import bot_logger
+
+class WebhookServer:
+    """
+    Small asyncio HTTP/1.1 server that receives Telegram webhook updates
+    Updates go into the application's update queue; when it is full the server answers 503
+    and Telegram retries the delivery later
+    """
+
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_BODY_BYTES = 1024 * 1024
+    READ_TIMEOUT = 30.0
+
+    REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+    def __init__(self, application, host=None, port=None, path=None, secret_token=None, max_queue=None):
+        self.application = application
+        self.host = host or Config.WEBHOOK_LISTEN
+        self.port = Config.WEBHOOK_PORT if port is None else port
+        self.path = path or Config.WEBHOOK_PATH
+        self.secret_token = secret_token
+        self.max_queue = max_queue or Config.WEBHOOK_MAX_QUEUE
+
+        self._server = None
+        self._connections = set()
+        self._idle = set()
+        self._closing = False
+        self.accepted = 0
+        self.rejected = 0
+
+    @property
+    def bound_port(self) -> int:
+        """Actual port, useful when started with port 0"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._closing = False
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        bot_logger.info(f"Webhook server listening on {self.host}:{self.bound_port}{self.path}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting connections and let requests in flight finish"""
+        if self._server is None:
+            return
+        self._closing = True
+        self._server.close()
+
+        # Idle keep-alive connections have nothing in flight. They go first, as from Python 3.12
+        # wait_closed() also waits for open connections, which would stall until READ_TIMEOUT.
+        for task in self._idle:
+            task.cancel()
+        if self._connections:
+            _, pending = await asyncio.wait(set(self._connections), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        bot_logger.info(f"Webhook server stopped ({self.accepted} updates accepted, {self.rejected} rejected)")
+
+    def backlog(self) -> int:
+        """Updates received but not yet handled, including those already taken off the queue"""
+        processor = self.application.update_processor
+        return self.application.update_queue.qsize() + getattr(processor, 'backlog', 0)
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            # Keep-alive: Telegram reuses connections for consecutive updates
+            while not self._closing:
+                self._idle.add(task)
+                keep_alive = await asyncio.wait_for(self._handle_request(reader, writer, task), self.READ_TIMEOUT)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._connections.discard(task)
+            self._idle.discard(task)
+            writer.close()
+
+    async def _handle_request(self, reader, writer, task) -> bool:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            self._idle.discard(task)
+        except asyncio.LimitOverrunError:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+        if len(head) > self.MAX_HEADER_BYTES:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            await self._respond(writer, 400, keep_alive=False)
+            return False
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self._respond(writer, 400, keep_alive=False)
+            return False
+        if length > self.MAX_BODY_BYTES:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+        body = await reader.readexactly(length) if length else b''
+
+        status = self._accept(method, target, headers, body)
+        await self._respond(writer, status, keep_alive)
+        return keep_alive
+
+    def _accept(self, method, target, headers, body) -> int:
+        """Validate a webhook request and enqueue its update, returning the HTTP status"""
+        if target.split('?', 1)[0] != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+
+        if self.secret_token:
+            received = headers.get('x-telegram-bot-api-secret-token', '')
+            if not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+                bot_logger.warning("Webhook request with a wrong secret token rejected")
+                return 403
+
+        if self.backlog() >= self.max_queue:
+            self.rejected += 1
+            return 503
+
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("the update is not a JSON object")
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            bot_logger.warning(f"Malformed webhook update: {e}")
+            return 400
+
+        self.application.update_queue.put_nowait(update)
+        self.accepted += 1
+        return 200
+
+    async def _respond(self, writer, status, keep_alive):
+        reason = self.REASONS.get(status, '')
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        await writer.drain()
@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+
+# Processes run from the project root, like admin.py starts them
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The supervisor's own messages stay out of the bot's log; the processes it starts get
+# their own log files through the environment it gives them
+bot_log_file = os.environ.get('BOT_LOG_FILE', 'bot.log')
+os.environ['BOT_LOG_FILE'] = 'supervisor.log'
+
+from config import Config
+from utils.logger import bot_logger
+from services.control_server import ControlServer
+
+
+class _Managed:
+    """One supervised process and its restart history"""
+
+    def __init__(self, name, args, log_file):
+        self.name = name
+        self.args = args
+        self.log_file = log_file
+        self.process = None
+        self.task = None
+        self.started_at = None
+        self.restarts = 0
+        self.failures = 0
+        self.stopping = False
+
+
+class ShardSupervisor:
+    """
+    Runs the bot (front) process and the synthesis worker processes of sharded mode
+    Processes that exit are restarted, with a growing delay if they keep crashing. The worker
+    count can be changed while running through the supervisor's control socket.
+    """
+
+    RESTART_DELAYS = (0, 1, 2, 5, 10, 30)
+    STABLE_AFTER = 60  # seconds; a crash after running this long restarts without delay
+    STOP_TIMEOUT = 15
+
+    def __init__(self, workers=None):
+        self.workers = Config.SHARD_WORKERS if workers is None else workers
+        self._processes = {}  # name -> _Managed
+        self._started_at = time.time()
+
+    def start(self):
+        self._spawn('front', ['src/bot.py'], bot_log_file)
+        for worker_id in range(1, self.workers + 1):
+            self._spawn_worker(worker_id)
+
+    async def stop(self):
+        """Stop the front first so it finishes its updates, then the workers"""
+        front = self._processes.pop('front', None)
+        if front is not None:
+            await self._stop(front)
+        managed = list(self._processes.values())
+        self._processes.clear()
+        await asyncio.gather(*(self._stop(process) for process in managed))
+
+    async def scale(self, workers: int) -> dict:
+        """Start or stop workers until workers are running"""
+        workers = int(workers)
+        if workers < 1:
+            raise ValueError("at least one worker is needed")
+
+        for worker_id in range(self.workers + 1, workers + 1):
+            self._spawn_worker(worker_id)
+        surplus = [self._processes.pop(f"worker{worker_id}") for worker_id in range(workers + 1, self.workers + 1)]
+        bot_logger.info(f"Scaling synthesis workers from {self.workers} to {workers}")
+        self.workers = workers
+        await asyncio.gather(*(self._stop(process) for process in surplus))
+        return self.status()
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - self._started_at,
+            'workers': self.workers,
+            'processes': [
+                {
+                    'name': managed.name,
+                    'pid': managed.process.pid if managed.process else None,
+                    'running': managed.process is not None and managed.process.returncode is None,
+                    'restarts': managed.restarts,
+                    'uptime': now - managed.started_at if managed.started_at else 0.0,
+                }
+                for managed in self._processes.values()
+            ],
+        }
+
+    def _spawn_worker(self, worker_id: int):
+        self._spawn(f"worker{worker_id}", ['src/worker.py', '--id', str(worker_id)], f"worker{worker_id}.log")
+
+    def _spawn(self, name, args, log_file):
+        managed = _Managed(name, args, log_file)
+        managed.task = asyncio.get_running_loop().create_task(self._keep_running(managed))
+        self._processes[name] = managed
+
+    async def _keep_running(self, managed):
+        # Tracebacks from before a process's logger is up (import errors, bad settings) land here
+        stderr_path = os.path.join(Config.LOGS_DIR, f"{managed.name}.stderr.log")
+        while True:
+            started = time.monotonic()
+            try:
+                with open(stderr_path, 'ab') as stderr:
+                    managed.process = await asyncio.create_subprocess_exec(
+                        sys.executable, *managed.args,
+                        cwd=project_root,
+                        env={**os.environ, 'BOT_LOG_FILE': managed.log_file},
+                        stdout=subprocess.DEVNULL,
+                        stderr=stderr
+                    )
+            except OSError as e:
+                managed.process = None
+                code = None
+                bot_logger.error(f"Could not start {managed.name}: {e}", extra={'process_name': managed.name})
+            else:
+                managed.started_at = started
+                code = await managed.process.wait()
+            if managed.stopping:
+                return
+
+            ran = time.monotonic() - started
+            managed.failures = 0 if ran >= self.STABLE_AFTER else managed.failures + 1
+            delay = self.RESTART_DELAYS[min(managed.failures, len(self.RESTART_DELAYS) - 1)]
+            managed.restarts += 1
+            bot_logger.warning(
+                f"{managed.name} exited with code {code} after {ran:.0f}s, restarting in {delay}s",
+                extra={'process_name': managed.name, 'exit_code': code, 'restarts': managed.restarts}
+            )
+            await asyncio.sleep(delay)
+
+    async def _stop(self, managed):
+        managed.stopping = True
+        process = managed.process
+        if process is not None and process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), self.STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                bot_logger.warning(f"{managed.name} did not stop in {self.STOP_TIMEOUT}s, killing it")
+                process.kill()
+                await process.wait()
+        managed.task.cancel()
+        await asyncio.gather(managed.task, return_exceptions=True)
+
+
+async def run_supervisor():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    supervisor = ShardSupervisor()
+    control = ControlServer({
+        'ping': lambda: 'pong',
+        'status': supervisor.status,
+        'scale': supervisor.scale,
+    }, path=Config.SUPERVISOR_SOCKET_PATH)
+
+    bot_logger.info(f"Supervisor starting the bot with {supervisor.workers} synthesis workers")
+    supervisor.start()
+    await control.start()
+    try:
+        await stop_event.wait()
+    finally:
+        await control.stop()
+        await supervisor.stop()
+        bot_logger.info("Supervisor stopped")
+
+
+def main():
+    """Entry point for sharded mode, normally started by admin.py"""
+    Config.validate_setup()
+    if Config.SHARD_WORKERS < 1:
+        raise SystemExit("Set SHARD_WORKERS to the number of synthesis workers to use sharded mode")
+    asyncio.run(run_supervisor())
+
+
+if __name__ == '__main__':
+    main()
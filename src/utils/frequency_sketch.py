@@ -0,0 +1,44 @@
+import hashlib
+from array import array
+
+
+class CountMinSketch:
+    """
+    Approximate counts of any number of keys in fixed memory: depth rows of width 32-bit counters
+    Estimates can be too high when keys share counters, but never too low
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self._rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    @property
+    def memory_bytes(self) -> int:
+        return 4 * self.width * self.depth
+
+    def _indexes(self, key: str):
+        # Double hashing: the counters of one key come from a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        first = int.from_bytes(digest[:4], 'little')
+        step = int.from_bytes(digest[4:], 'little') | 1
+        return [(first + row * step) % self.width for row in range(self.depth)]
+
+    def add(self, key: str) -> int:
+        """Count key once and return its new estimate"""
+        indexes = self._indexes(key)
+        estimate = min(row[index] for row, index in zip(self._rows, indexes)) + 1
+        # Conservative update: only raise counters that are below the new estimate
+        for row, index in zip(self._rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def halve(self):
+        """Halve every counter, so old traffic counts for less than recent traffic"""
+        for row in self._rows:
+            for index in range(self.width):
+                row[index] >>= 1
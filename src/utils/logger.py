@@ -1,15 +1,37 @@
 import logging
 import os
+import json
+import queue
+import atexit
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from colorama import Fore, Style, init
-import sys
 
-# Add project root to path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
 
 init()
 
-class ColorFormatter(logging.Formatter):
+# Attributes every LogRecord has; anything else was passed with extra= and is a structured field
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def structured_fields(record) -> dict:
+    """Fields passed to a logging call with extra=, e.g. user_id, engine or latency_ms"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Plain text lines with structured fields appended as key=value"""
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        fields = structured_fields(record)
+        if fields:
+            line += ' | ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class ColorFormatter(StructuredFormatter):
     COLORS = {
         'DEBUG': Fore.CYAN,
         'INFO': Fore.GREEN,
@@ -17,47 +39,114 @@ class ColorFormatter(logging.Formatter):
         'ERROR': Fore.RED,
         'CRITICAL': Fore.RED + Style.BRIGHT
     }
-    
+
     def format(self, record):
-        # Only apply colors if the levelname hasn't been colored already
-        if record.levelname in self.COLORS and not record.levelname.startswith('\x1b['):
-            color = self.COLORS[record.levelname]
-            record.levelname = f"{color}{record.levelname}{Style.RESET_ALL}"
-            record.msg = f"{color}{record.msg}{Style.RESET_ALL}"
-        return super().format(record)
+        color = self.COLORS.get(record.levelname)
+        if color is None:
+            return super().format(record)
+        # Color a copy: the record is shared with the file handler, which must stay plain
+        colored = logging.makeLogRecord(vars(record))
+        colored.levelname = f"{color}{record.levelname}{Style.RESET_ALL}"
+        colored.msg = f"{color}{record.getMessage()}{Style.RESET_ALL}"
+        colored.args = None
+        return super().format(colored)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, structured fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(structured_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """Queues records for the listener thread, leaving all formatting to its handlers"""
+
+    def prepare(self, record):
+        # Merge args now, as they may change before the listener gets to them, and render
+        # tracebacks to text, as traceback objects keep whole stack frames alive
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listeners = []
+
+
+@atexit.register
+def _stop_listeners():
+    """Write out queued records before exit"""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def _file_handler(log_file):
+    # delay=True: the file is opened on the first record, so a process only holds (and rotates)
+    # the log files it actually writes to
+    if Config.LOG_ROTATE_WHEN:
+        return TimedRotatingFileHandler(
+            log_file, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUP_COUNT,
+            encoding='utf-8', delay=True
+        )
+    return RotatingFileHandler(
+        log_file, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT,
+        encoding='utf-8', delay=True
+    )
+
 
 def setup_logger(name, log_file, level=logging.INFO):
-    """Setup logger with file and console handlers"""
+    """Setup logger with rotating file and console handlers, written from a background thread"""
     logger = logging.getLogger(name)
-    
+
     # Avoid adding handlers multiple times
     if logger.handlers:
         return logger
-    
+
     logger.setLevel(level)
-    
+
     # Create logs directory if it doesn't exist
     os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    
+
     # File handler
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler = _file_handler(log_file)
     file_handler.setLevel(level)
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    if Config.LOG_FORMAT == 'json':
+        file_formatter = JsonFormatter()
+    else:
+        file_formatter = StructuredFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(file_formatter)
-    
+
     # Console handler with colors
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_formatter = ColorFormatter('%(asctime)s - %(levelname)s - %(message)s')
     console_handler.setFormatter(console_formatter)
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    # Logging calls only enqueue the record; disk and terminal writes happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+    logger.addHandler(_RecordQueueHandler(log_queue))
+
     return logger
 
 # Create loggers
-bot_logger = setup_logger('bot', os.path.join(Config.LOGS_DIR, 'bot.log'))
-admin_logger = setup_logger('admin', os.path.join(Config.LOGS_DIR, 'admin.log'))
\ No newline at end of file
+bot_logger = setup_logger('bot', os.path.join(Config.LOGS_DIR, Config.BOT_LOG_FILE))
+admin_logger = setup_logger('admin', os.path.join(Config.LOGS_DIR, 'admin.log'))
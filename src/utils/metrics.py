@@ -0,0 +1,209 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cache hit to a long synthesis
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; set directly or read from a callback at scrape time"""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        """Read the value from fn() whenever metrics are collected, so updates cost nothing"""
+        with self._lock:
+            self._callbacks[self._key(labels)] = fn
+
+    def render(self) -> list:
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        for key, fn in callbacks:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            with self._lock:
+                self._values[key] = value
+        return super().render()
+
+
+class CounterFunction(Gauge):
+    """Counter whose value is read from an existing statistic at scrape time"""
+
+    TYPE = 'counter'
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the bot's metrics and renders them in the Prometheus text format"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames=(), **kwargs):
+        full_name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def counter_function(self, name: str, documentation: str, labelnames=()) -> CounterFunction:
+        return self._register(CounterFunction, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(prefix='ttsbot_')
+
+# Pipeline stage latencies
+text_extraction_seconds = registry.histogram(
+    'text_extraction_seconds', "Time to get text out of a message", ('source',))
+synthesis_seconds = registry.histogram(
+    'synthesis_seconds', "Time spent in a TTS engine", ('engine', 'outcome'))
+disk_write_seconds = registry.histogram(
+    'disk_write_seconds', "Time to write audio to disk", ('target',))
+upload_seconds = registry.histogram(
+    'upload_seconds', "Time to send audio to Telegram", ('kind',))
+encode_seconds = registry.histogram(
+    'encode_seconds', "Time to encode audio for sending", ('format',))
+request_seconds = registry.histogram(
+    'request_seconds', "Time from speed selection to the last audio sent", ('mode', 'outcome'))
+
+# Events
+fallbacks_total = registry.counter(
+    'engine_fallbacks_total', "Requests that moved on from a failed or skipped engine", ('engine', 'reason'))
+errors_total = registry.counter(
+    'errors_total', "Errors by where they happened", ('stage',))
+upload_bytes_total = registry.counter(
+    'upload_bytes_total', "Audio bytes uploaded to Telegram", ('format',))
+prerenders_total = registry.counter(
+    'hot_phrase_prerenders_total', "Frequently requested phrases synthesized ahead of time", ('outcome',))
@@ -0,0 +1,79 @@
+import codecs
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+SNIFF_BYTES = 64 * 1024
+FALLBACK_ENCODING = 'cp1252'
+
+
+class TextTooLongError(ValueError):
+    """Raised when decoded text goes over the character limit"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Text is longer than {limit} characters")
+        self.limit = limit
+
+
+def detect_encoding(data) -> tuple:
+    """Return (encoding, BOM length) for the start of a byte buffer"""
+    head = bytes(data[:4])
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+
+    sample = bytes(data[:SNIFF_BYTES])
+    try:
+        sample.decode('utf-8')
+        return 'utf-8', 0
+    except UnicodeDecodeError as e:
+        # A multibyte character cut at the end of the sample is still UTF-8
+        if e.start >= len(sample) - 3 and len(data) > len(sample):
+            return 'utf-8', 0
+
+    try:
+        # Installed with gTTS (through requests); only imported when a file is not UTF-8
+        from charset_normalizer import from_bytes
+    except ImportError:
+        from_bytes = None
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding, 0
+    return FALLBACK_ENCODING, 0
+
+
+def decode_limited(data, max_chars: int, chunk_size: int = 16 * 1024) -> str:
+    """
+    Decode a byte buffer chunk by chunk, stopping as soon as it exceeds max_chars
+    Leading and trailing whitespace does not count towards the limit
+    """
+    encoding, offset = detect_encoding(data)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    view = memoryview(data)
+
+    parts = []
+    length = 0
+    trailing = 0
+    leading = True
+    while offset < len(view):
+        piece = decoder.decode(view[offset:offset + chunk_size])
+        offset += chunk_size
+        if leading:
+            piece = piece.lstrip()
+            leading = not piece
+        parts.append(piece)
+        length += len(piece)
+        # Trailing whitespace may still be stripped, so only count it once it is followed by text
+        content = len(piece.rstrip())
+        trailing = trailing + len(piece) if not content else len(piece) - content
+        if length - trailing > max_chars:
+            raise TextTooLongError(max_chars)
+    parts.append(decoder.decode(b'', final=True))
+
+    return ''.join(parts).strip()
@@ -0,0 +1,64 @@
+import re
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["\'”’)\]]))\s+|\n\s*\n')
+
+
+def last_sentence_end(text: str):
+    """Index where the whitespace after the last complete sentence starts, or None"""
+    end = None
+    for end in _SENTENCE_END.finditer(text):
+        pass
+    return end.start() if end else None
+
+
+def split_sentences(text: str) -> list:
+    """Split text into sentences, keeping punctuation attached"""
+    sentences = [s.strip() for s in _SENTENCE_END.split(text)]
+    return [s for s in sentences if s]
+
+
+def _split_long(sentence: str, max_chars: int) -> list:
+    """Split an over-long sentence at word boundaries"""
+    parts = []
+    current = ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_text_chunks(text: str, max_chars: int, first_sentence_alone: bool = True) -> list:
+    """
+    Group sentences into chunks of at most max_chars characters
+    The first sentence is kept as its own chunk so it can be delivered quickly
+    """
+    chunks = []
+    current = ""
+
+    for sentence in split_sentences(text):
+        pieces = _split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence]
+        for piece in pieces:
+            if first_sentence_alone and not chunks and not current:
+                chunks.append(piece)
+                continue
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+
+    if current:
+        chunks.append(current)
+    return chunks
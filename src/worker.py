@@ -0,0 +1,140 @@
+import os
+import signal
+import asyncio
+import argparse
+
+# The supervisor starts each worker with BOT_LOG_FILE=workerN.log, so no two processes rotate the same log
+from config import Config
+from utils.logger import bot_logger
+from services.cache_service import AudioCache
+from services.segment_store import SegmentStore
+from services.tts_service import TTSService, TTSBusyError, TTSTimeoutError
+from services.job_broker import read_frame, write_frame
+
+
+class SynthesisWorker:
+    """Runs synthesis jobs from the front process's job broker"""
+
+    RECONNECT_DELAYS = (0.5, 1, 2, 5)
+
+    def __init__(self, worker_id: int, path=None, slots=None):
+        self.worker_id = worker_id
+        self.path = path or Config.BROKER_SOCKET_PATH
+        self.slots = slots or Config.WORKER_CONCURRENCY
+
+        # One in-process offline engine per worker; the supervisor scales workers instead
+        Config.PYTTSX_POOL_SIZE = 0
+        # The sentence pack is single-process, so every worker slot keeps its own
+        segments = None
+        if Config.SEGMENT_CACHE_ENABLED:
+            segments = SegmentStore(f"{Config.SEGMENT_STORE_PATH}.worker{worker_id}")
+        # The front process owns the audio cache; workers only read it
+        self.tts_service = TTSService(
+            max_workers=self.slots,
+            cache=AudioCache(memory_limit=0, disk_limit=0),
+            segments=segments
+        )
+        self.jobs_done = 0
+
+    async def run(self, stop_event: asyncio.Event):
+        """Serve the broker until stop_event is set, reconnecting whenever the connection drops"""
+        # Engines load in the background; jobs that arrive first import them on demand
+        self.tts_service.warm_up_in_background()
+        attempt = 0
+        while not stop_event.is_set():
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                delay = self.RECONNECT_DELAYS[min(attempt, len(self.RECONNECT_DELAYS) - 1)]
+                attempt += 1
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            attempt = 0
+            serving = asyncio.ensure_future(self._serve(reader, writer))
+            stopping = asyncio.ensure_future(stop_event.wait())
+            await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (serving, stopping):
+                task.cancel()
+            await asyncio.gather(serving, stopping, return_exceptions=True)
+            writer.close()
+
+        self.tts_service.shutdown()
+
+    async def _serve(self, reader, writer):
+        write_frame(writer, {'type': 'hello', 'worker': self.worker_id, 'pid': os.getpid(), 'slots': self.slots})
+        await writer.drain()
+        bot_logger.info(f"Worker {self.worker_id} connected to the job broker ({self.slots} slots)")
+
+        jobs = set()
+        try:
+            while True:
+                header, _ = await read_frame(reader)
+                if header.get('type') == 'job':
+                    task = asyncio.ensure_future(self._run_job(header, writer))
+                    jobs.add(task)
+                    task.add_done_callback(jobs.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            bot_logger.warning(f"Worker {self.worker_id} lost the job broker, reconnecting")
+        finally:
+            # The broker hands unfinished jobs to other workers
+            for task in jobs:
+                task.cancel()
+
+    async def _run_job(self, job: dict, writer):
+        try:
+            result = await self.tts_service.convert_text_to_speech_async(job['text'], job['speed'])
+            try:
+                with result.open() as f:
+                    data = await asyncio.to_thread(f.read)
+            finally:
+                result.release()
+            reply, payload = {'type': 'result', 'id': job['id'], 'engine': result.engine, 'key': result.key}, data
+        except TTSBusyError as e:
+            reply, payload = {'type': 'error', 'id': job['id'], 'kind': 'busy', 'error': str(e)}, b''
+        except TTSTimeoutError as e:
+            reply, payload = {'type': 'error', 'id': job['id'], 'kind': 'timeout', 'error': str(e)}, b''
+        except Exception as e:
+            bot_logger.error(f"Worker {self.worker_id} job failed: {e}")
+            reply, payload = {'type': 'error', 'id': job['id'], 'kind': 'failed', 'error': str(e)}, b''
+
+        write_frame(writer, reply, payload)
+        self.jobs_done += 1
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthesis worker for sharded mode")
+    parser.add_argument('--id', type=int, required=True, help="worker slot, stable across restarts")
+    return parser.parse_args()
+
+
+async def main_async(worker_id: int):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    worker = SynthesisWorker(worker_id)
+    bot_logger.info(f"Synthesis worker {worker_id} started (pid {os.getpid()})")
+    await worker.run(stop_event)
+    bot_logger.info(f"Synthesis worker {worker_id} stopped after {worker.jobs_done} jobs")
+
+
+def main():
+    """Entry point for one synthesis worker process"""
+    args = parse_args()
+    asyncio.run(main_async(args.id))
+
+
+if __name__ == '__main__':
+    main()